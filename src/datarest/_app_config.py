@@ -1,8 +1,13 @@
-# Load the central app.yaml configuration file and provide it for use in other
+# Load the central app.yaml configuration file (or the one given by the
+# DATAREST_APP_CONFIG environment variable) and provide it for use in other
 # modules.
 
+import os
+
 from . import _cfgfile
 
+# The config file path
+cfg_path = os.environ.get('DATAREST_APP_CONFIG', 'app.yaml')
 # config is the main entry point for other modules to read the config
 # information. config is an AppConfig model object.
-config = _cfgfile.read_app_config()
+config = _cfgfile.read_app_config(cfg_path)
@@ -0,0 +1,631 @@
+# Create the FastAPI app from the app configuration, and hot reload it.
+
+import asyncio
+import collections
+import contextlib
+import functools
+import logging
+import os
+import signal
+import threading
+import warnings
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi.openapi.docs import get_swagger_ui_html
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import exc as sa_exc
+from sqlmodel import SQLModel
+from starlette.concurrency import run_in_threadpool
+
+from . import _authn
+from . import _cfgfile
+from . import _compression
+from . import _models
+from . import _ratelimit
+from . import _request_context
+from . import _routes
+
+
+# Log along with uvicorn's server messages.
+logger = logging.getLogger('uvicorn.error')
+
+# The compiled state of a datatable: Its config model definition, table
+# definition, ModelCombo and routes.
+TableState = collections.namedtuple(
+    'TableState', ['model_def', 'table_def', 'model', 'routes'])
+
+# Summary of an app reload, lists of table names.
+ReloadResult = collections.namedtuple(
+    'ReloadResult', ['added', 'changed', 'removed', 'unchanged'])
+
+
+def no_phase(name, table=None):
+    """Default phase callable for create_app(), does nothing.
+    """
+    return contextlib.nullcontext()
+
+
+def _authn_dependencies(fastapi_config):
+    """Return (dependencies, responses) for the configured authentication.
+    """
+    # Add-ons:
+    # additional dependencies for authentication, additional response models
+    dependencies = []
+    responses = {}
+
+    if fastapi_config.authn is not None:
+        # Add proper FastAPI auth dependencies if authentication is
+        # configured.
+        authn_dependencies = _authn.create_authn(fastapi_config.authn)
+        # Wrap authn dependency callables with Depends() for FastAPI
+        # dependency injection.
+        dependencies.extend(
+            Depends(authn_dep) for authn_dep in authn_dependencies)
+        # Set up additional 401 responses so that it shows up in OpenAPI docs.
+        responses.update({
+            '401': {"description": "Unauthorized"},
+            })
+    return dependencies, responses
+
+
+def _route_dependencies(app, fastapi_config):
+    """Return (dependencies, responses) for the datatable routes: The app's
+    authentication (see _authn_dependencies()) and app-wide rate limits.
+    """
+    dependencies = list(app.state.authn_dependencies)
+    responses = dict(app.state.authn_responses)
+    if fastapi_config.profiling is not None and dependencies:
+        from . import _request_profiling
+        dependencies.append(Depends(_request_profiling.authorization(
+            fastapi_config.profiling.admins, dependencies[0].dependency)))
+    dependencies.extend(_rate_limit_dependencies(
+        app, '', fastapi_config.rate_limit))
+    if fastapi_config.rate_limit is not None:
+        responses['429'] = {"description": "Too Many Requests"}
+    return dependencies, responses
+
+
+def _rate_limit_dependencies(app, scope, limits):
+    """Return the dependencies applying the limits (a _cfgfile.RateLimit or
+    None) to the scope's requests, per authenticated user or client IP.
+    """
+    if limits is None:
+        return []
+    authn_dependencies = app.state.authn_dependencies
+    authenticate = None
+    if authn_dependencies:
+        authenticate = authn_dependencies[0].dependency
+    return [Depends(app.state.rate_limiter.dependency(
+        scope, limits, authenticate=authenticate))]
+
+
+def _setup_token_route(app, authn):
+    """Add the OAuth2 token endpoint if the authn config issues tokens.
+    """
+    if not _authn.issues_tokens(authn):
+        return
+    from . import _jwt
+    route = APIRoute(
+        _authn.TOKEN_PATH,
+        _authn.create_token_endpoint(authn),
+        methods=['POST'],
+        response_model=_jwt.Token,
+        responses={'401': {'description': 'Unauthorized'}},
+        tags=['Authentication'],
+        dependency_overrides_provider=app,
+        )
+    # In front of the (lazy) datatable routes
+    app.router.routes.insert(0, route)
+
+
+def _create_table(
+        app, model_name, model_def, table_def, dependencies, responses,
+        phase=no_phase):
+    """Create the model + routes for a datatable, return its TableState.
+
+    The routes aren't added to the app yet.
+    """
+    if model_def.rate_limit is not None:
+        dependencies = dependencies + _rate_limit_dependencies(
+            app, model_name, model_def.rate_limit)
+        responses = {
+            **responses, '429': {"description": "Too Many Requests"}}
+    with phase('model creation', model_name):
+        model = _models.create_model(
+            model_name, model_def, table_def=table_def)
+    with phase('router creation', model_name):
+        # Create the FastAPI routes using CRUDRouter, on a separate router to
+        # get hold of the routes for this table only.
+        router = APIRouter(dependency_overrides_provider=app)
+        _routes.create_routes(
+            app=router,
+            models={model_name: model},
+            dependencies=dependencies,
+            responses=responses,
+            )
+    _request_context.tag_routes(model_name, router.routes)
+    return TableState(
+        model_def=model_def, table_def=table_def, model=model,
+        routes=list(router.routes))
+
+
+def create_app(config, phase=no_phase, cfg_path='app.yaml'):
+    """Create the FastAPI app for the given AppConfig.
+
+    Parameters:
+        config: AppConfig model
+        phase: a callable phase(name, table=None) returning a context manager
+            that wraps each app creation phase, e.g. for timing startup
+        cfg_path: the app.yaml config file path, to reload from
+
+    Returns: The FastAPI app, with its ModelCombos in app.state.models
+    """
+    # Create main FastAPI app with given configuration.
+    fastapi_config = config.datarest.fastapi
+
+    openapi_urls = {}
+    if fastapi_config.openapi is not None:
+        # Served from the precomputed OpenAPI document instead
+        openapi_urls = dict(openapi_url=None, docs_url=None, redoc_url=None)
+
+    with phase('fastapi app'):
+        app = FastAPI(
+            title=fastapi_config.app.title,
+            description=fastapi_config.app.description,
+            version=fastapi_config.app.version,
+            **openapi_urls)
+
+    if fastapi_config.compression is not None:
+        compression = fastapi_config.compression
+        app.add_middleware(
+            _compression.CompressionMiddleware,
+            encodings=compression.encodings,
+            minimum_size=compression.minimum_size,
+            levels=compression.levels)
+
+    app.state.rate_limiter = _ratelimit.RateLimiter()
+    with phase('authn'):
+        # Used by the datatable + admin routes, kept on reload
+        app.state.authn_dependencies, app.state.authn_responses = (
+            _authn_dependencies(fastapi_config))
+        dependencies, responses = _route_dependencies(app, fastapi_config)
+        _setup_token_route(app, fastapi_config.authn)
+
+    if fastapi_config.metrics is not None:
+        _setup_metrics(app, fastapi_config.metrics)
+    if fastapi_config.slow_queries is not None:
+        _setup_slow_queries(app, fastapi_config)
+    if fastapi_config.profiling is not None:
+        _setup_profiling(app, fastapi_config)
+    if (fastapi_config.metrics is not None
+            or fastapi_config.slow_queries is not None):
+        # Outermost, for the metrics + slow query log to know the request
+        app.add_middleware(_request_context.RequestContextMiddleware)
+
+    app.state.config = config
+    app.state.cfg_path = cfg_path
+    app.state.dependencies = dependencies
+    app.state.responses = responses
+    app.state.reload_lock = threading.Lock()
+
+    if fastapi_config.reload is not None:
+        _setup_reload(app, fastapi_config, dependencies)
+
+    if fastapi_config.lazy is not None:
+        _setup_lazy(app, fastapi_config.lazy)
+    else:
+        # Create the API/ORM data models and routes.
+        tables = {}
+        for model_name, model_def in config.datarest.datatables.items():
+            with phase('schema load', model_name):
+                table_def = _models.read_table_def(
+                    model_def, cache_dir=config.datarest.model_cache)
+            tables[model_name] = _create_table(
+                app, model_name, model_def, table_def, dependencies,
+                responses, phase=phase)
+        for table in tables.values():
+            app.router.routes.extend(table.routes)
+        app.state.tables = tables
+        app.state.models = {
+            model_name: table.model for model_name, table in tables.items()}
+
+    if fastapi_config.openapi is not None:
+        from . import _openapi
+        with phase('openapi generation'):
+            # Building the document builds all the lazy datatables
+            _openapi.setup_openapi(
+                app, fastapi_config.openapi,
+                build=fastapi_config.lazy is None)
+    return app
+
+
+def _setup_metrics(app, metrics_config):
+    """Set up recording the metrics and the endpoint serving them.
+    """
+    from . import _database, _metrics
+    metrics_dir = None
+    if metrics_config.multiprocess_dir is not None:
+        metrics_dir = _metrics.MetricsDir(
+            metrics_config.multiprocess_dir, _metrics.REGISTRY,
+            flush_interval=metrics_config.flush_interval)
+        app.add_event_handler(
+            'shutdown', functools.partial(metrics_dir.flush, force=True))
+    _metrics.instrument_engine(_database.engine)
+    # Added after the compression middleware, i.e. wraps it and measures the
+    # compressed response sizes
+    app.add_middleware(_metrics.MetricsMiddleware, metrics_dir=metrics_dir)
+    dependencies = []
+    if metrics_config.authn:
+        dependencies = app.state.authn_dependencies
+    app.add_api_route(
+        metrics_config.path, _metrics.metrics_endpoint(metrics_dir),
+        methods=['GET'], dependencies=dependencies, include_in_schema=False)
+
+
+def _setup_slow_queries(app, fastapi_config):
+    """Set up the slow query log, in app.state.slow_queries, and the admin
+    endpoint serving the slowest statements.
+    """
+    from . import _database, _slowlog
+    slow_queries_config = fastapi_config.slow_queries
+    slow_queries = _slowlog.SlowQueryLog(
+        slow_queries_config.threshold, explain=slow_queries_config.explain,
+        top_n=slow_queries_config.top_n)
+    slow_queries.instrument(_database.engine)
+    app.state.slow_queries = slow_queries
+    if not slow_queries_config.endpoint:
+        return
+    if fastapi_config.authn is None:
+        # The statement parameters are data
+        logger.warning(
+            'The slow queries endpoint needs authn to be configured, '
+            'not exposed')
+        return
+
+    def slow_queries_endpoint():
+        """The slowest database statements, slowest first.
+        """
+        return slow_queries.slowest()
+
+    app.add_api_route(
+        '/admin/slow-queries', slow_queries_endpoint, methods=['GET'],
+        dependencies=app.state.authn_dependencies, include_in_schema=False)
+
+
+def _setup_profiling(app, fastapi_config):
+    """Set up profiling requests on demand and the admin endpoint serving
+    the reports.
+    """
+    if fastapi_config.authn is None:
+        logger.warning('Request profiling needs authn to be configured, off')
+        return
+    from . import _database, _request_profiling
+    profiling_config = fastapi_config.profiling
+    store = _request_profiling.ProfileStore(
+        keep=profiling_config.keep, directory=profiling_config.directory)
+    _request_profiling.instrument_engine(_database.engine)
+    app.add_middleware(_request_profiling.ProfilingMiddleware, store=store)
+    app.state.profiles = store
+
+    def profile_report(profile_id: str):
+        """The report of a profiled request.
+        """
+        report = store.get(profile_id)
+        if report is None:
+            raise HTTPException(status_code=404, detail='Unknown profile')
+        return PlainTextResponse(report)
+
+    authenticate = app.state.authn_dependencies[0].dependency
+    app.add_api_route(
+        '/admin/profiles/{profile_id}', profile_report, methods=['GET'],
+        dependencies=[Depends(_request_profiling.admin_check(
+            profiling_config.admins, authenticate))],
+        include_in_schema=False)
+
+
+def _setup_lazy(app, lazy_config):
+    """Set up building the datatables on demand, with per-datatable OpenAPI
+    documents + docs.
+    """
+    from . import _lazy
+
+    def build_table(model_name, model_def):
+        table_def = _models.read_table_def(
+            model_def, cache_dir=app.state.config.datarest.model_cache)
+        return _create_table(
+            app, model_name, model_def, table_def, app.state.dependencies,
+            app.state.responses)
+
+    tables = _lazy.LazyTables(
+        build_table, app.state.config.datarest.datatables,
+        max_warm=lazy_config.max_warm_tables)
+    app.state.tables = tables
+    app.state.models = _lazy.LazyModels(tables)
+
+    def openapi():
+        if app.openapi_schema is None:
+            app.openapi_schema = _lazy.openapi(app, tables)
+        return app.openapi_schema
+
+    app.openapi = openapi
+
+    def table_openapi(model_name: str):
+        if model_name not in tables:
+            raise HTTPException(status_code=404)
+        return tables.openapi(model_name, app)
+
+    def table_docs(request: Request, model_name: str):
+        if model_name not in tables:
+            raise HTTPException(status_code=404)
+        root_path = request.scope.get('root_path', '').rstrip('/')
+        return get_swagger_ui_html(
+            openapi_url=f'{root_path}/openapi/{model_name}.json',
+            title=f'{app.title}: {model_name} - Swagger UI')
+
+    app.add_api_route(
+        '/openapi/{model_name}.json', table_openapi, include_in_schema=False)
+    app.add_api_route(
+        '/docs/{model_name}', table_docs, include_in_schema=False)
+    # Add last, so that the app's own routes take precedence
+    app.router.routes.append(_lazy.LazyTablesRoute(tables))
+
+
+def _reload_lazy(app, config, dependencies_changed):
+    """Reload the lazy datatables: Drop the changed datatables, to be rebuilt
+    on their next request.
+    """
+    tables = app.state.tables
+    result = ReloadResult(*tables.update(config.datarest.datatables))
+    for model_name in list(result.unchanged):
+        table = tables.warm.get(model_name)
+        if table is None:
+            continue
+        table_def = _models.read_table_def(
+            table.model_def, cache_dir=config.datarest.model_cache)
+        if dependencies_changed or table_def != table.table_def:
+            tables.drop(model_name)
+            result.unchanged.remove(model_name)
+            result.changed.append(model_name)
+    return result
+
+
+def _reload_tables(app, config, dependencies, responses,
+                   dependencies_changed):
+    """Rebuild the added or changed datatables and swap their routes into the
+    app.
+
+    All of the datatables are rebuilt before swapping in any of them: If
+    rebuilding fails the app's models + routes are left as-is.
+    """
+    old_tables = app.state.tables
+    model_names = []
+    tables = {}
+    rebuild = {}
+    result = ReloadResult([], [], [], [])
+    for model_name, model_def in config.datarest.datatables.items():
+        model_names.append(model_name)
+        table_def = _models.read_table_def(
+            model_def, cache_dir=config.datarest.model_cache)
+        old_table = old_tables.get(model_name)
+        if (old_table is not None
+                and not dependencies_changed
+                and old_table.model_def == model_def
+                and old_table.table_def == table_def):
+            tables[model_name] = old_table
+            result.unchanged.append(model_name)
+            continue
+        if old_table is not None:
+            result.changed.append(model_name)
+        else:
+            result.added.append(model_name)
+        rebuild[model_name] = (model_def, table_def)
+    result.removed.extend(
+        model_name for model_name in old_tables
+        if model_name not in model_names)
+
+    # Make room for the new model classes' tables, put back if rebuilding
+    # fails
+    metadata = SQLModel.metadata
+    replaced = [
+        old_tables[model_name].model.resource_model.__table__
+        for model_name in result.changed]
+    for table in replaced:
+        metadata.remove(table)
+    kept = dict(metadata.tables)
+    try:
+        with warnings.catch_warnings():
+            # Replacing the model class of a changed table is intended
+            warnings.simplefilter('ignore', sa_exc.SAWarning)
+            for model_name, (model_def, table_def) in rebuild.items():
+                tables[model_name] = _create_table(
+                    app, model_name, model_def, table_def, dependencies,
+                    responses)
+    except Exception:
+        for key, table in list(metadata.tables.items()):
+            if kept.get(key) is not table:
+                metadata.remove(table)
+        for table in replaced:
+            # There's no public API for re-adding a removed table
+            metadata._add_table(table.name, table.schema, table)
+        raise
+    # In config order
+    tables = {model_name: tables[model_name] for model_name in model_names}
+
+    # Swap in the new routes in one go: Keep the non-datatable routes
+    # (e.g. docs) and replace all the datatable routes.
+    old_table_routes = set(
+        id(route) for table in old_tables.values()
+        for route in table.routes)
+    routes = [
+        route for route in app.router.routes
+        if id(route) not in old_table_routes]
+    for table in tables.values():
+        routes.extend(table.routes)
+    app.router.routes = routes
+    app.state.tables = tables
+    app.state.models = {
+        model_name: table.model for model_name, table in tables.items()}
+    return result
+
+
+def reload_app(app):
+    """Reload the app configuration and datatable schemas and swap the
+    rebuilt datatable routes into the running app.
+
+    Only added or changed datatables are rebuilt, unchanged datatables keep
+    their models + routes. If rebuilding fails the app routes are left as-is.
+
+    Returns: ReloadResult
+    """
+    with app.state.reload_lock:
+        old_config = app.state.config
+        config = _cfgfile.read_app_config(app.state.cfg_path)
+        fastapi_config = config.datarest.fastapi
+
+        if config.datarest.database != old_config.datarest.database:
+            logger.warning(
+                'Database configuration changes need a restart, ignored')
+
+        if fastapi_config.authn != old_config.datarest.fastapi.authn:
+            # The admin endpoints (e.g. this one) + token endpoint are
+            # protected by the authn they were set up with
+            logger.warning(
+                'Changes of the authn configuration need a restart, ignored')
+            fastapi_config.authn = old_config.datarest.fastapi.authn
+
+        dependencies = app.state.dependencies
+        responses = app.state.responses
+        dependencies_changed = any(
+            getattr(fastapi_config, name)
+            != getattr(old_config.datarest.fastapi, name)
+            for name in ['rate_limit', 'profiling'])
+        if dependencies_changed:
+            dependencies, responses = _route_dependencies(
+                app, fastapi_config)
+
+        lazy = old_config.datarest.fastapi.lazy is not None
+        if lazy != (fastapi_config.lazy is not None):
+            logger.warning(
+                'Switching lazy datatables on or off needs a restart, ignored')
+        for name in ['compression', 'metrics', 'slow_queries']:
+            if (getattr(fastapi_config, name)
+                    != getattr(old_config.datarest.fastapi, name)):
+                logger.warning(
+                    'Changes of the %s configuration need a restart, ignored',
+                    name)
+
+        if lazy:
+            # The datatables are rebuilt on demand, with the app's
+            # dependencies
+            app.state.dependencies = dependencies
+            app.state.responses = responses
+            result = _reload_lazy(app, config, dependencies_changed)
+        else:
+            result = _reload_tables(
+                app, config, dependencies, responses, dependencies_changed)
+            app.state.dependencies = dependencies
+            app.state.responses = responses
+        app.title = fastapi_config.app.title
+        app.description = fastapi_config.app.description
+        app.version = fastapi_config.app.version
+        app.openapi_schema = None
+
+        app.state.config = config
+        openapi_docs = getattr(app.state, 'openapi_docs', None)
+        if openapi_docs is not None:
+            openapi_docs.invalidate()
+            if not lazy:
+                openapi_docs.build()
+
+    logger.info(
+        'Reloaded %s: added %s, changed %s, removed %s, unchanged %s',
+        app.state.cfg_path, result.added, result.changed, result.removed,
+        len(result.unchanged))
+    return result
+
+
+async def _reload(app):
+    # Rebuild in a worker thread so that requests are served meanwhile.
+    try:
+        return await run_in_threadpool(reload_app, app)
+    except Exception:
+        logger.exception('Reloading %s failed', app.state.cfg_path)
+        raise
+
+
+def _watched_files(app):
+    config = app.state.config
+    paths = [app.state.cfg_path]
+    paths.extend(
+        model_def.schema_
+        for _, model_def in config.datarest.datatables.items()
+        if model_def.schema_spec == _cfgfile.SchemaSpecEnum.data_resource)
+    # The schema files referenced by the data resource files (of the built
+    # datatables, for lazy ones)
+    tables = app.state.tables
+    for table in list(getattr(tables, 'warm', tables).values()):
+        paths.extend(
+            path for path in table.table_def.get('schema_files', {})
+            if path not in paths)
+    return paths
+
+
+def _mtimes(paths):
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+
+async def _watch(app, interval):
+    """Poll the config + schema files and reload on changes.
+    """
+    mtimes = _mtimes(_watched_files(app))
+    while True:
+        await asyncio.sleep(interval)
+        current = _mtimes(_watched_files(app))
+        if current != mtimes:
+            with contextlib.suppress(Exception):
+                await _reload(app)
+            mtimes = _mtimes(_watched_files(app))
+
+
+def _setup_reload(app, fastapi_config, dependencies):
+    """Hook up the configured app reload triggers.
+    """
+    reload_config = fastapi_config.reload
+    if reload_config.endpoint and fastapi_config.authn is None:
+        # Anyone could make the app re-read its files
+        logger.warning(
+            'The reload endpoint needs authn to be configured, not exposed')
+    elif reload_config.endpoint:
+        async def reload():
+            """Reload the app configuration and datatable schemas.
+            """
+            return (await _reload(app))._asdict()
+
+        app.add_api_route(
+            '/admin/reload', reload, methods=['POST'],
+            dependencies=dependencies, include_in_schema=False)
+
+    async def start_reload_triggers():
+        loop = asyncio.get_running_loop()
+        if reload_config.signal and hasattr(signal, 'SIGHUP'):
+            loop.add_signal_handler(
+                signal.SIGHUP,
+                lambda: asyncio.ensure_future(_reload(app)))
+        if reload_config.watch_interval:
+            app.state.watch_task = asyncio.ensure_future(
+                _watch(app, reload_config.watch_interval))
+
+    async def stop_reload_triggers():
+        watch_task = getattr(app.state, 'watch_task', None)
+        if watch_task is not None:
+            watch_task.cancel()
+
+    app.add_event_handler('startup', start_reload_triggers)
+    app.add_event_handler('shutdown', stop_reload_triggers)
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import Type, Union
+from datetime import timedelta
+from typing import Optional, Type, Union
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import (
@@ -10,10 +11,18 @@ from . import _cfgfile
 from ._app_config import config
 
 
+# Path of the OAuth2 token endpoint
+TOKEN_PATH = '/token'
+
+
 @dataclass
 class AuthnScheme:
-    scheme: SecurityBase
-    CredentialsType: Union[Type[str], Type[HTTPBasicCredentials]]
+    scheme: Union[SecurityBase, Type[OAuth2PasswordRequestForm]]
+    CredentialsType: Union[
+        Type[str], Type[HTTPBasicCredentials],
+        Type[OAuth2PasswordRequestForm]]
+    # WWW-Authenticate challenge for 401 responses
+    challenge: str = 'Basic'
 
 
 def create_authn(authn: _cfgfile.Authn):
@@ -30,35 +39,100 @@ def create_authn(authn: _cfgfile.Authn):
         authn_deps =  [
             _ldap_authentication(
                 ldap=authn.ldap,
-                authn_scheme=_httpbasic_scheme())
+                authn_scheme=_httpbasic_scheme(),
+                cache=authn.cache)
             ]
     elif authn.authn_type == AuthnEnum.OAuth2PasswordBearer_LDAP:
+        # LDAP is used by the token endpoint only, see create_token_endpoint
+        from . import _jwt
         authn_deps = [
-            _ldap_authentication(
-                ldap=authn.ldap,
-                authn_scheme=_oauth2_passwordbearer_scheme()
+            _jwt_authentication(
+                jwt_keys=_jwt.JwtKeys.from_config(jwt_config(authn)),
+                authn_scheme=_oauth2_passwordbearer_scheme(),
                 )
             ]
 
     return authn_deps
 
 
+def issues_tokens(authn: Optional[_cfgfile.Authn]):
+    """Return True if the authentication config needs a token endpoint.
+    """
+    return (
+        authn is not None
+        and authn.authn_type == _cfgfile.AuthnEnum.OAuth2PasswordBearer_LDAP)
+
+
+def create_token_endpoint(authn: _cfgfile.Authn):
+    """Create and return the OAuth2 token endpoint, to be served at
+    TOKEN_PATH.
+
+    The endpoint authenticates the user against LDAP and issues a signed JWT,
+    so that the subsequent requests need no LDAP round-trip.
+    """
+    from . import _jwt
+    jwt_cfg = jwt_config(authn)
+    jwt_keys = _jwt.JwtKeys.from_config(jwt_cfg)
+    expires_delta = timedelta(minutes=jwt_cfg.expire_minutes)
+    authenticate = _ldap_authentication(
+        ldap=authn.ldap,
+        authn_scheme=_oauth2_passwordrequestform_scheme(),
+        cache=authn.cache,
+        )
+
+    def token(username: str = Depends(authenticate)) -> _jwt.Token:
+        """Issue an access token for the given LDAP credentials.
+        """
+        return _jwt.Token(
+            access_token=_jwt.create_access_token(
+                {'sub': username}, jwt_keys, expires_delta=expires_delta),
+            token_type='bearer',
+            )
+    return token
+
+
+def jwt_config(authn: _cfgfile.Authn):
+    """Return the _cfgfile.Jwt config of authn, defaults if unset.
+    """
+    return authn.jwt if authn.jwt is not None else _cfgfile.Jwt()
+
+
 def _httpbasic_scheme():
     return AuthnScheme(
         scheme=HTTPBasic(), CredentialsType=HTTPBasicCredentials )
 
 
-def _ldap_authentication(ldap: _cfgfile.LDAP, authn_scheme: AuthnScheme):
+def _ldap_authentication(
+        ldap: _cfgfile.LDAP,
+        authn_scheme: AuthnScheme,
+        cache: Optional[_cfgfile.AuthnCache] = None,
+        ):
     """Create and return an LDAP-backed auth function.
 
+    With cache, authentication results are cached, see
+    _authn_cache.CachedAuth.
+
     Returns:
         authenticate where authenticate is a callable that expects an
         authn_scheme.CredentialsType arg and returns the (authenticated)
         username on successful LDAP authentication.
     """
-    from . import _ldap_authn
-    authn_backend = _ldap_authn.LDAPAuth(
-        bind_dn=ldap.bind_dn, server=ldap.server)
+    from . import _ldap_authn, _metrics
+    authn_backend = _metrics.TimedAuth(
+        _ldap_authn.LDAPAuth(
+            bind_dn=ldap.bind_dn, server=ldap.server,
+            pool_size=ldap.pool_size, max_idle=ldap.max_idle),
+        invalid_error=_ldap_authn.InvalidCredentialsError,
+        )
+    if cache is not None:
+        from ._authn_cache import CachedAuth
+        authn_backend = CachedAuth(
+            authn_backend,
+            invalid_error=_ldap_authn.InvalidCredentialsError,
+            max_size=cache.max_size,
+            ttl=cache.ttl,
+            negative_ttl=cache.negative_ttl,
+            )
 
     def authenticate(
             credentials: authn_scheme.CredentialsType = Depends(
@@ -76,11 +150,53 @@ def _ldap_authentication(ldap: _cfgfile.LDAP, authn_scheme: AuthnScheme):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid credentials",
-                headers={"WWW-Authenticate": "Basic"},
+                headers={"WWW-Authenticate": authn_scheme.challenge},
                 )
         return credentials.username
     return authenticate
 
 
+def _jwt_authentication(jwt_keys, authn_scheme: AuthnScheme):
+    """Create and return a JWT-verifying auth function.
+
+    Returns:
+        authenticate where authenticate is a callable that expects a bearer
+        token arg and returns the username of a valid token. Tokens are
+        verified locally, i.e. without an authentication backend round-trip.
+    """
+    from . import _jwt
+
+    def authenticate(
+            token: authn_scheme.CredentialsType = Depends(
+                authn_scheme.scheme)
+            ):
+        """Authenticate the user of the given bearer token.
+
+        Returns: Authenticated username
+        """
+        try:
+            token_data = _jwt.decode_access_token(token, jwt_keys)
+        except _jwt.JWTError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token",
+                headers={"WWW-Authenticate": authn_scheme.challenge},
+                )
+        return token_data.username
+    return authenticate
+
+
 def _oauth2_passwordbearer_scheme():
-    raise NotImplementedError()
+    return AuthnScheme(
+        scheme=OAuth2PasswordBearer(tokenUrl=TOKEN_PATH.lstrip('/')),
+        CredentialsType=str,
+        challenge='Bearer',
+        )
+
+
+def _oauth2_passwordrequestform_scheme():
+    return AuthnScheme(
+        scheme=OAuth2PasswordRequestForm,
+        CredentialsType=OAuth2PasswordRequestForm,
+        challenge='Bearer',
+        )
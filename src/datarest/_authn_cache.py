@@ -0,0 +1,102 @@
+# Caching of authentication results, so that not every request costs an
+# authentication backend (e.g. LDAP) round-trip.
+
+import collections
+import hashlib
+import os
+import threading
+import time
+
+
+class CachedAuth:
+    """Wrap an authentication backend with a bounded TTL cache of successful
+    authentications and a separate, short-lived cache of failed ones.
+
+    Cache entries are keyed by username and a salted hash of the password, so
+    neither a changed password hits a cached result nor are plain passwords
+    kept in memory.
+
+    Args:
+        backend: authentication backend with an authenticate(username,
+            password) method that raises invalid_error on invalid
+            credentials
+        invalid_error: the backend's invalid credentials exception type
+        max_size: max number of cached (successful and failed)
+            authentications each, least recently used entries are dropped
+            first
+        ttl: seconds to cache successful authentications
+        negative_ttl: seconds to cache failed authentications, 0 disables
+            caching failures
+        clock: monotonic time source, for testing
+    """
+
+    def __init__(
+            self, backend, invalid_error, max_size=1024, ttl=300.0,
+            negative_ttl=5.0, clock=time.monotonic):
+        self.backend = backend
+        self.invalid_error = invalid_error
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._salt = os.urandom(16)
+        # {key: (expires, identity)}, identity is None for failures
+        self._valid = collections.OrderedDict()
+        self._invalid = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, username, password):
+        digest = hashlib.blake2b(
+            password.encode('utf8'), key=self._salt, digest_size=32)
+        return (username, digest.digest())
+
+    def _put(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_size:
+                cache.popitem(last=False)
+
+    def _get(self, cache, key):
+        # Return the cached value or None if there is no unexpired entry
+        with self._lock:
+            value = cache.get(key)
+            if value is None:
+                return None
+            if value[0] <= self.clock():
+                del cache[key]
+                return None
+            cache.move_to_end(key)
+            return value
+
+    def clear(self):
+        """Drop all cached authentications.
+        """
+        with self._lock:
+            self._valid.clear()
+            self._invalid.clear()
+
+    def authenticate(self, username, password):
+        """Authenticate with given credentials, preferably from the cache.
+
+        Returns:
+            the backend's identity of the authenticated user
+        """
+        key = self._key(username, password)
+        cached = self._get(self._valid, key)
+        if cached is not None:
+            return cached[1]
+        if self._get(self._invalid, key) is not None:
+            raise self.invalid_error('Invalid credentials (cached)')
+
+        try:
+            identity = self.backend.authenticate(username, password)
+        except self.invalid_error:
+            if self.negative_ttl > 0:
+                self._put(
+                    self._invalid, key,
+                    (self.clock() + self.negative_ttl, None))
+            raise
+        if self.ttl > 0:
+            self._put(self._valid, key, (self.clock() + self.ttl, identity))
+        return identity
@@ -60,6 +60,21 @@ class SchemaSpecEnum(StrEnum):
 
 # Helper classes to enforce intended field order.
 
+class RateLimit(BaseModel):
+    """Per-client request rate and concurrency limits, exceeding them
+    results in 429 Too Many Requests with a Retry-After header.
+
+    Clients are identified by their authenticated username or, without
+    authn, by their IP address. The limits apply per worker process.
+    """
+    # Requests per second (token bucket refill rate)
+    rate: Optional[float] = None
+    # Max requests in a burst (token bucket size), defaults to the rate
+    burst: Optional[int] = None
+    # Max concurrent requests
+    max_concurrent: Optional[int] = None
+
+
 # Common Table fields
 class _TableFields(BaseModel):
     dbtable: str
@@ -67,6 +82,8 @@ class _TableFields(BaseModel):
     expose_routes: Optional[List[ExposeRoutesEnum]] = [
         ExposeRoutesEnum.get_one]
     query_params: Optional[List[str]] = []
+    # Per-datatable limits, in addition to the app-wide ones
+    rate_limit: Optional[RateLimit] = None
 
 
 class _SQLAlchemyTableFields(BaseModel):
@@ -116,16 +133,163 @@ class App(BaseModel):
 class LDAP(BaseModel):
     bind_dn: str
     server: str
+    # Max number of open LDAP connections kept for re-binding, 0 opens a new
+    # connection per authentication
+    pool_size: int = 8
+    # Max seconds to keep an unused pooled connection
+    max_idle: float = 60
+
+
+class AuthnCache(BaseModel):
+    """Cache authentication results, so that not every request needs an
+    authentication backend (e.g. LDAP) round-trip.
+    """
+    # Max number of cached authentications
+    max_size: int = 1024
+    # Seconds to cache successful authentications
+    ttl: float = 300
+    # Seconds to cache failed authentications (0 disables caching failures)
+    negative_ttl: float = 5
+
+
+class Jwt(BaseModel):
+    """Signed JSON Web Tokens, issued by the OAuth2 token endpoint and
+    verified locally.
+    """
+    # Signing keys (shared secrets) by key id. The first key signs new
+    # tokens, all keys verify tokens: For key rotation add a new key in front
+    # and drop the old key once its tokens have expired.
+    keys: Dict[str, str] = {}
+    # Environment variable with the signing keys as "kid1=secret1,...",
+    # preferred over keys. Without any keys a random key is used.
+    keys_env: str = 'DATAREST_JWT_KEYS'
+    algorithm: str = 'HS256'
+    expire_minutes: float = 30
 
 
 class Authn(BaseModel):
     authn_type: AuthnEnum
     ldap: Optional[LDAP] = None
+    cache: Optional[AuthnCache] = None
+    # OAuth2PasswordBearer+LDAP tokens
+    jwt: Optional[Jwt] = None
+
+
+class Reload(BaseModel):
+    """Hot reload of app.yaml and the datatable schemas, without a restart.
+
+    Only changed datatables are rebuilt.
+    """
+    # Reload on SIGHUP
+    signal: bool = True
+    # Expose a POST /admin/reload endpoint (protected by the configured
+    # authn, not exposed without authn)
+    endpoint: bool = False
+    # Poll the config + schema files for changes every watch_interval seconds
+    watch_interval: Optional[float] = None
+
+
+class Lazy(BaseModel):
+    """Build each datatable's model + routes on its first request instead of
+    at startup, for configs with very many datatables.
+    """
+    # Keep at most max_warm_tables datatables built (least recently used
+    # datatables are dropped first)
+    max_warm_tables: int = 256
+
+
+class Openapi(BaseModel):
+    """Precomputed OpenAPI document, cached gzip-compressed next to app.yaml
+    and served with ETag support.
+    """
+    # Generate the document in the background after startup instead of at app
+    # creation
+    background: bool = False
+    # Cache the document in <app.yaml basename>.openapi.json.gz
+    cache: bool = True
+    # Include the data field examples in the document
+    examples: bool = True
+    # Serve per-tag (i.e. per-datatable) documents, for the docs UI to load
+    # one at a time
+    split_tags: bool = False
+
+
+class Compression(BaseModel):
+    """Compress responses, negotiated by the Accept-Encoding request header.
+
+    Streamed responses (e.g. CSV/Arrow get_all) are compressed as they are
+    streamed.
+    """
+    # Encodings by server preference: br needs the brotli package, zstd the
+    # zstandard package, encodings without their package are skipped
+    encodings: List[str] = ['zstd', 'br', 'gzip']
+    # Don't compress smaller (non-streamed) responses, in bytes
+    minimum_size: int = 1024
+    # {encoding: compression level}, the encoding's default level otherwise
+    levels: Dict[str, int] = {}
+
+
+class Metrics(BaseModel):
+    """Prometheus metrics endpoint: Request counts, latencies, response
+    sizes and rows returned per datatable + route, database statement
+    latencies and connection pool usage, LDAP authentication latencies.
+    """
+    # Path of the endpoint
+    path: str = '/metrics'
+    # Protect the endpoint by the configured authn
+    authn: bool = True
+    # Directory shared by the worker processes, to add up the metrics of all
+    # workers (per-process metrics otherwise)
+    multiprocess_dir: Optional[str] = None
+    # Write the process's metrics to multiprocess_dir every flush_interval
+    # seconds
+    flush_interval: float = 5
+
+
+class SlowQueries(BaseModel):
+    """Log the database statements slower than threshold, with their
+    parameters, datatable, route and caller.
+    """
+    # In seconds
+    threshold: float = 0.5
+    # Log the query plans of slow SELECT statements too (SQLite EXPLAIN QUERY
+    # PLAN, PostgreSQL/MySQL EXPLAIN), at the cost of an additional EXPLAIN
+    # statement per slow statement
+    explain: bool = False
+    # Keep the top_n slowest statements, per worker process
+    top_n: int = 50
+    # Serve them from GET /admin/slow-queries, protected by the configured
+    # authn (not exposed without authn)
+    endpoint: bool = False
+
+
+class Profiling(BaseModel):
+    """Profile single datatable requests on demand: Requests by the admins
+    with an X-Datarest-Profile: 1 header are profiled (cProfile + phase
+    timings), their report is served from GET /admin/profiles/{id}, with the
+    id in the X-Datarest-Profile-Id response header. Needs authn.
+    """
+    # The usernames allowed to profile requests and download the reports
+    admins: List[str]
+    # Keep the reports of the last keep profiled requests
+    keep: int = 20
+    # Keep the reports in this directory (e.g. shared by the workers), in
+    # memory per worker process otherwise
+    directory: Optional[str] = None
 
 
 class Fastapi(BaseModel):
     app: App
     authn: Optional[Authn] = None
+    reload: Optional[Reload] = None
+    lazy: Optional[Lazy] = None
+    openapi: Optional[Openapi] = None
+    # App-wide limits, for all datatables together
+    rate_limit: Optional[RateLimit] = None
+    compression: Optional[Compression] = None
+    metrics: Optional[Metrics] = None
+    slow_queries: Optional[SlowQueries] = None
+    profiling: Optional[Profiling] = None
 
 
 class Database(BaseModel):
@@ -136,6 +300,9 @@ class Datarest(BaseModel):
     fastapi: Fastapi
     database: Database
     datatables: Datatables
+    # Directory to cache table definitions derived from the data resource
+    # schemas in, for faster startup. Set to null to disable caching.
+    model_cache: Optional[str] = '.datarest_cache'
 
 
 class AppConfig(BaseModel):
@@ -157,8 +324,13 @@ def app_config(
         ldap_server=None,
         ):
     """Return AppConfig object.
+
+    table is either a single table name or a sequence of table names, each of
+    which gets its own datatable entry with the given expose_routes and
+    query_params.
     """
-    title = table if title is None else title
+    tables = [table] if isinstance(table, str) else list(table)
+    title = tables[0] if title is None else title
 
     authn = None
     ldap = None
@@ -196,6 +368,7 @@ def app_config(
                         expose_routes=expose_routes,
                         query_params=query_params,
                         )
+                    for table in tables
                     }
                 ),
             )
@@ -0,0 +1,229 @@
+# Response compression: gzip and, if their packages are installed, brotli
+# and zstd, negotiated by the Accept-Encoding request header. Streamed
+# responses (e.g. CSV/Arrow get_all) are compressed chunk by chunk as they
+# are streamed.
+
+import importlib.util
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+
+# {encoding: the module it needs}
+_modules = {
+    'gzip': 'zlib',
+    'br': 'brotli',
+    'zstd': 'zstandard',
+    }
+
+# Server preference, best first
+ENCODINGS = ['zstd', 'br', 'gzip']
+
+# Media types that are compressed already
+_compressed_media_types = {
+    'application/gzip',
+    'application/vnd.apache.parquet',
+    'application/zip',
+    }
+
+
+class _GzipEncoder:
+
+    def __init__(self, level=None):
+        self._compressor = zlib.compressobj(
+            6 if level is None else level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return (self._compressor.compress(data)
+                + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def finish(self, data=b''):
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class _BrotliEncoder:
+
+    def __init__(self, level=None):
+        import brotli
+        self._compressor = (
+            brotli.Compressor() if level is None
+            else brotli.Compressor(quality=level))
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data=b''):
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class _ZstdEncoder:
+
+    def __init__(self, level=None):
+        import zstandard
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(
+            **({} if level is None else {'level': level})).compressobj()
+
+    def compress(self, data):
+        return (self._compressor.compress(data)
+                + self._compressor.flush(self._flush_block))
+
+    def finish(self, data=b''):
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+_encoders = {
+    'gzip': _GzipEncoder,
+    'br': _BrotliEncoder,
+    'zstd': _ZstdEncoder,
+    }
+
+
+def available_encodings(encodings=ENCODINGS):
+    """Return the encodings whose packages are installed, in order.
+
+    Raises: ValueError for unknown encodings
+    """
+    unknown = [encoding for encoding in encodings
+               if encoding not in _modules]
+    if unknown:
+        raise ValueError(f'Unknown content encodings: {", ".join(unknown)}')
+    return [encoding for encoding in encodings
+            if importlib.util.find_spec(_modules[encoding]) is not None]
+
+
+def negotiate(accept_encoding, encodings):
+    """Return the encoding in encodings preferred by the Accept-Encoding
+    header value (ties resolved by the encodings order), or None for no
+    compression.
+    """
+    qualities = {}
+    for item in (accept_encoding or '').split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def encoder(encoding, level=None):
+    """Return a new encoder, with a compress(data) method returning the
+    compressed (and flushed) data so far and a finish(data=b'') method
+    returning the rest.
+    """
+    return _encoders[encoding](level)
+
+
+def compress(data, encoding, level=None):
+    """Return data compressed with encoding.
+    """
+    return encoder(encoding, level).finish(data)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses for a _cfgfile.Compression
+    config.
+
+    Responses with a Content-Encoding (e.g. precompressed ones) or of
+    compressed media types are left as-is, as are non-streamed responses
+    smaller than minimum_size.
+    """
+
+    def __init__(self, app, encodings=ENCODINGS, minimum_size=1024,
+                 levels=None):
+        self.app = app
+        self.encodings = available_encodings(encodings)
+        self.minimum_size = minimum_size
+        self.levels = levels or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            encoding = negotiate(
+                Headers(scope=scope).get('accept-encoding'), self.encodings)
+            if encoding is not None:
+                responder = _Responder(
+                    self.app, encoding, self.levels.get(encoding),
+                    self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _Responder:
+    # Compresses a single response
+
+    def __init__(self, app, encoding, level, minimum_size):
+        self.app = app
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        # None until the first body message decides it
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def _compressible(self, headers):
+        if 'content-encoding' in headers:
+            return False
+        media_type = headers.get('content-type', '').split(';')[0].strip()
+        return media_type.lower() not in _compressed_media_types
+
+    async def send_compressed(self, message):
+        if message['type'] == 'http.response.start':
+            # Held back until the first body message tells whether to
+            # compress
+            self.start_message = message
+            return
+        if message['type'] != 'http.response.body':
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self.start_message is not None:
+            start_message, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start_message['headers'])
+            if (not self._compressible(headers)
+                    or (not more_body and len(body) < self.minimum_size)):
+                self.passthrough = True
+            else:
+                self.encoder = encoder(self.encoding, self.level)
+                headers['Content-Encoding'] = self.encoding
+                headers.add_vary_header('Accept-Encoding')
+                if more_body:
+                    del headers['Content-Length']
+                else:
+                    body = self.encoder.finish(body)
+                    headers['Content-Length'] = str(len(body))
+                    message = {**message, 'body': body}
+                    await self.send(start_message)
+                    await self.send(message)
+                    return
+            await self.send(start_message)
+
+        if self.passthrough:
+            await self.send(message)
+            return
+        if more_body:
+            body = self.encoder.compress(body)
+        else:
+            body = self.encoder.finish(body)
+        await self.send({**message, 'body': body})
@@ -8,18 +8,25 @@
 # achieve these things.
 
 import dataclasses
+import datetime
+import decimal
 import textwrap
 from typing import Any, Callable, Dict, List, Optional, Type, TypeVar, Union
 
-from fastapi import Depends, HTTPException, Response, Query, status
+from fastapi import Depends, HTTPException, Request, Response, Query, status
+from fastapi.responses import StreamingResponse
 from fastapi_crudrouter import SQLAlchemyCRUDRouter
 from fastapi_crudrouter.core.sqlalchemy import (
     DEPENDENCIES, CALLABLE_LIST, PAGINATION, SCHEMA, Model, Session
     )
 import pydantic
-from sqlalchemy import and_
+from sqlalchemy import and_, select, true
 from typing_extensions import Annotated
 
+from . import _formats
+from . import _request_profiling
+from . import _sqltypes
+
 
 T = TypeVar("T", bound=pydantic.BaseModel)
 #ROUTE_DECORATOR_KWARGS = Dict[str, Any]
@@ -37,11 +44,32 @@ T = TypeVar("T", bound=pydantic.BaseModel)
 filter_type_mapping = {
     "int": int,
     "float": float,
+    "Decimal": decimal.Decimal,
+    "ConstrainedDecimalValue": decimal.Decimal,
     "bool": bool,
     "str": str,
     "ConstrainedStrValue": str,
+    # Dictionary-encoded string columns
+    "Literal": str,
+    "date": datetime.date,
+    "datetime": datetime.datetime,
+    "time": datetime.time,
 }
 
+# Ordered types that additionally get range filter query params, i.e.
+# <name>__gt, <name>__gte, <name>__lt, <name>__lte.
+range_filter_types = {
+    int, float, decimal.Decimal, datetime.date, datetime.datetime,
+    datetime.time,
+    }
+
+range_filter_ops = {
+    'gt': lambda column, value: column > value,
+    'gte': lambda column, value: column >= value,
+    'lt': lambda column, value: column < value,
+    'lte': lambda column, value: column <= value,
+    }
+
 # Customize some CRUDRouter status code defaults since they're suboptimal
 custom_routes_status = {
     'create': status.HTTP_201_CREATED,
@@ -85,6 +113,14 @@ def query_factory(
                 ]
             value = None 
             args_list.append((name, annotation, value))
+            if typ in range_filter_types:
+                for op in range_filter_ops:
+                    annotation = Annotated[
+                        Optional[typ],
+                        Query(description=f'{name} {op} range filter query '
+                                          f'parameter')
+                        ]
+                    args_list.append((f'{name}__{op}', annotation, None))
     if args_list:
         filter_params_cls = dataclasses.make_dataclass(
             'QueryParams', args_list)
@@ -93,6 +129,45 @@ def query_factory(
         return None
 
 
+def filter_expressions(db_model, filter_values):
+    """Yield the SQLAlchemy filter expressions for the filter query param
+    values.
+    """
+    for param_name, values in filter_values.items():
+        if values is None or values == []:
+            continue
+        name, _, op = param_name.rpartition('__')
+        if name and op in range_filter_ops:
+            yield range_filter_ops[op](getattr(db_model, name), values)
+        else:
+            column = getattr(db_model, param_name)
+            if isinstance(column.type, _sqltypes.DictionaryEncoded):
+                # Values not in the dictionary can't match (nor be encoded)
+                values = [value for value in values
+                          if value in column.type.codes]
+            yield column.in_(values)
+
+
+def _counted(request, rows):
+    """Yield the rows, counting them in request.state.rows (e.g. for the
+    metrics).
+    """
+    request.state.rows = 0
+    for row in rows:
+        request.state.rows += 1
+        yield row
+
+
+def _streamed_rows(request, engine, statement):
+    """Yield the rows of the select statement, streamed from a server-side
+    cursor of an own connection (the request's session may be closed before
+    the response is sent).
+    """
+    with engine.connect() as conn:
+        rows = conn.execution_options(stream_results=True).execute(statement)
+        yield from _counted(request, rows)
+
+
 class FilteringSQLAlchemyCRUDRouter(SQLAlchemyCRUDRouter):
     """Custom SQLAlchemyCRUDRouter that adds filter/query parameter support.
 
@@ -169,22 +244,62 @@ class FilteringSQLAlchemyCRUDRouter(SQLAlchemyCRUDRouter):
             if error_responses
             else None
         )
+        if getattr(endpoint, 'tabular_formats', False):
+            responses = dict(responses or {})
+            responses[200] = {'content': {
+                media_type: {} for media_type in _formats.media_types.values()
+                }}
         super().add_api_route(
-            path, endpoint, dependencies=dependencies, responses=responses,
+            path, _request_profiling.profiled(endpoint),
+            dependencies=dependencies, responses=responses,
             response_model_exclude_none=self.response_model_exclude_none,
             **kwargs
         )
 
+    def _select(self, filter_values, skip, limit):
+        # Core select of the filtered get_all page, for streaming the rows
+        table = self.db_model.__table__
+        return (
+            select(*table.columns)
+            .where(and_(true(), *filter_expressions(
+                self.db_model, filter_values)))
+            .order_by(getattr(self.db_model, self._pk))
+            .limit(limit)
+            .offset(skip)
+            )
+
+    def _tabular_response(self, request, fmt, db, filter_values, skip,
+                          limit):
+        """Return the StreamingResponse of the get_all page in tabular format
+        fmt, see _formats.
+        """
+        if fmt in _formats.arrow_formats and not _formats.pyarrow_available():
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=f'{fmt} responses need pyarrow to be installed')
+        statement = self._select(filter_values, skip, limit)
+        return StreamingResponse(
+            _formats.streams[fmt](
+                list(statement.selected_columns),
+                _streamed_rows(request, db.get_bind(), statement)),
+            media_type=_formats.media_types[fmt])
+
     # Override the base class method to hook our filter query params in.
     def _get_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
         Filter = self.filter_params_cls
         if Filter is None:
             def route(
+                    request: Request,
                     db: Session = Depends(self.db_func),
                     pagination: PAGINATION = self.pagination,
                     ) -> List[Model]:
                 skip, limit = pagination.get("skip"), pagination.get("limit")
 
+                fmt = _formats.negotiate(request.headers.get('accept'))
+                if fmt is not None:
+                    return self._tabular_response(
+                        request, fmt, db, {}, skip, limit)
+
                 db_model = self.db_model
                 db_models: List[Model] = (
                     db.query(self.db_model)
@@ -193,21 +308,26 @@ class FilteringSQLAlchemyCRUDRouter(SQLAlchemyCRUDRouter):
                     .offset(skip)
                     .all()
                 )
+                request.state.rows = len(db_models)
                 return db_models
         else:
             def route(
+                    request: Request,
                     db: Session = Depends(self.db_func),
                     pagination: PAGINATION = self.pagination,
                     filter_: Filter = Depends(Filter)
                     ) -> List[Model]:
                 skip, limit = pagination.get("skip"), pagination.get("limit")
 
+                filter_values = dataclasses.asdict(filter_)
+                fmt = _formats.negotiate(request.headers.get('accept'))
+                if fmt is not None:
+                    return self._tabular_response(
+                        request, fmt, db, filter_values, skip, limit)
+
                 db_model = self.db_model
-                filter_expression = and_(
-                    getattr(db_model, name).in_(values)
-                    for name, values in dataclasses.asdict(filter_).items()
-                    if values
-                    )
+                filter_expression = and_(true(), *filter_expressions(
+                    db_model, filter_values))
                 db_models: List[Model] = (
                     db.query(self.db_model)
                     .filter(filter_expression)
@@ -216,6 +336,9 @@ class FilteringSQLAlchemyCRUDRouter(SQLAlchemyCRUDRouter):
                     .offset(skip)
                     .all()
                 )
+                request.state.rows = len(db_models)
                 return db_models
 
+        # Document the tabular response formats, see _add_api_route()
+        route.tabular_formats = True
         return route
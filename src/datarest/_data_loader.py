@@ -0,0 +1,237 @@
+# Batched, resumable loading of tabular data resources into database tables.
+#
+# Each batch of rows is inserted and committed together with a load checkpoint
+# (source, row offset, hash of the batch rows) in the datarest_load_checkpoint
+# state table, so an interrupted load can be resumed from the last committed
+# batch.
+
+import datetime
+import hashlib
+import itertools
+import json
+import os
+
+import sqlalchemy as sa
+from frictionless.formats.sql import SqlMapper
+
+from ._data_resource_tools import chunked, non_biz_id_types
+from ._sqltypes import BinaryId, DictionaryEncoded, lookup_table_name
+
+
+# Number of rows to insert + commit in one go.
+LOAD_BATCH_SIZE = 10000
+
+# The load checkpoint state table lives in its own metadata, it's not part of
+# the exposed datatables.
+checkpoint_metadata = sa.MetaData()
+
+checkpoint_table = sa.Table(
+    'datarest_load_checkpoint',
+    checkpoint_metadata,
+    sa.Column('dbtable', sa.String(255), primary_key=True),
+    sa.Column('source', sa.Text, nullable=False),
+    sa.Column('row_offset', sa.Integer, nullable=False),
+    sa.Column('batch_rows', sa.Integer, nullable=False),
+    sa.Column('batch_hash', sa.String(64), nullable=False),
+    sa.Column('complete', sa.Boolean, nullable=False),
+    sa.Column('updated', sa.DateTime, nullable=False),
+    )
+
+
+class CheckpointMismatchError(ValueError):
+    """The data to resume loading from doesn't match the load checkpoint.
+    """
+
+
+def hash_fields(resource):
+    """Return the names of the resource fields to use for the batch hash.
+
+    Generated random ids differ between load runs, so leave them out.
+    """
+    field_names = resource.schema.field_names
+    pk_info = resource.schema.custom.get('x_datarest_primary_key_info', {})
+    if pk_info.get('id_type') in non_biz_id_types:
+        primary_key = set(resource.schema.primary_key)
+        field_names = [
+            name for name in field_names if name not in primary_key]
+    return field_names
+
+
+def dictionaries(resource):
+    """Return {field name: DictionaryEncoded} for the dictionary-encoded
+    resource fields.
+    """
+    return {
+        field.name: DictionaryEncoded(field.constraints['enum'])
+        for field in resource.schema.fields
+        if field.custom.get('x_datarest_dictionary')}
+
+
+def binary_ids(resource):
+    """Return {field name: BinaryId} for the resource id field if it's
+    stored in binary form.
+    """
+    pk_info = resource.schema.custom.get('x_datarest_primary_key_info', {})
+    if not pk_info.get('id_binary'):
+        return {}
+    return {
+        name: BinaryId(pk_info['id_type'])
+        for name in resource.schema.primary_key}
+
+
+def write_lookup_tables(resource, engine, dbtable):
+    """(Re-)create the lookup tables of the dictionary-encoded resource
+    fields, for SQL access to the codes' values.
+    """
+    for name, dictionary in dictionaries(resource).items():
+        table = dictionary.lookup_table(lookup_table_name(dbtable, name))
+        with engine.begin() as conn:
+            table.drop(conn, checkfirst=True)
+            table.create(conn)
+            conn.execute(table.insert(), dictionary.lookup_rows())
+
+
+def _encoder(column_types, dialect):
+    # Return a callable that replaces the values of custom type columns
+    # (dictionary-encoded, binary ids) by their stored form in an insert item.
+    def encode(item):
+        for name, column_type in column_types.items():
+            value = item.get(name)
+            if value is not None:
+                item[name] = column_type.process_bind_param(value, dialect)
+        return item
+
+    return encode
+
+
+def batch_hash(items, field_names):
+    """Return the sha256 hexdigest of the field_names values of the insert
+    items.
+    """
+    hash_ = hashlib.sha256()
+    for item in items:
+        values = [item.get(name) for name in field_names]
+        hash_.update(json.dumps(values, default=str).encode('utf8'))
+        hash_.update(b'\n')
+    return hash_.hexdigest()
+
+
+def read_checkpoint(engine, dbtable):
+    """Return the load checkpoint row for dbtable or None if there is none.
+    """
+    with engine.connect() as conn:
+        return conn.execute(
+            sa.select(checkpoint_table).where(
+                checkpoint_table.c.dbtable == dbtable)
+            ).first()
+
+
+def _write_checkpoint(conn, dbtable, **values):
+    values['updated'] = datetime.datetime.utcnow()
+    updated = conn.execute(
+        checkpoint_table.update().where(
+            checkpoint_table.c.dbtable == dbtable).values(**values)
+        )
+    if not updated.rowcount:
+        conn.execute(
+            checkpoint_table.insert().values(dbtable=dbtable, **values))
+
+
+def normalized_source(source):
+    """Return the real path of a data file path source, e.g. the same for
+    ./x.csv and x.csv, URLs as-is.
+    """
+    if '://' in source:
+        return source
+    return os.path.realpath(source)
+
+
+def load_resource(
+        resource,
+        engine,
+        dbtable,
+        source,
+        resume=False,
+        batch_size=LOAD_BATCH_SIZE,
+        ):
+    """Load the resource rows into the (existing) dbtable database table.
+
+    Rows are inserted in batches of batch_size rows, each committed along with
+    a load checkpoint.
+
+    Parameters:
+        resource: a frictionless tabular resource
+        engine: SQLAlchemy engine
+        dbtable: database table name
+        source: the resource data source (e.g. data file path), recorded in
+            the load checkpoint (see normalized_source())
+        resume: If True continue loading after the last committed batch
+            instead of starting from the first row
+        batch_size: number of rows to insert + commit in one go
+
+    Returns: the number of rows loaded.
+    """
+    source = normalized_source(source)
+    checkpoint_metadata.create_all(engine)
+    checkpoint = read_checkpoint(engine, dbtable) if resume else None
+    if checkpoint is not None:
+        if normalized_source(checkpoint.source) != source:
+            raise CheckpointMismatchError(
+                f'Load checkpoint source {checkpoint.source} for table '
+                f'{dbtable} does not match {source}'
+                )
+        if checkpoint.complete:
+            return 0
+        row_offset = checkpoint.row_offset
+    else:
+        row_offset = 0
+        with engine.begin() as conn:
+            _write_checkpoint(
+                conn, dbtable,
+                source=source,
+                row_offset=0,
+                batch_rows=0,
+                batch_hash='',
+                complete=False,
+                )
+
+    table = sa.Table(dbtable, sa.MetaData(), autoload_with=engine)
+    mapper = SqlMapper(engine.dialect.name)
+    loaded = 0
+
+    with resource:
+        field_names = hash_fields(resource)
+        encode = _encoder(
+            {**dictionaries(resource), **binary_ids(resource)},
+            engine.dialect)
+        items = (
+            encode(mapper.write_row(row)) for row in resource.row_stream)
+        if row_offset:
+            # Skip the already loaded rows, making sure the last committed
+            # batch still matches the source data.
+            batch_start = row_offset - checkpoint.batch_rows
+            last_batch = list(
+                itertools.islice(items, batch_start, row_offset))
+            if (len(last_batch) != checkpoint.batch_rows
+                    or batch_hash(last_batch, field_names)
+                    != checkpoint.batch_hash):
+                raise CheckpointMismatchError(
+                    f'Data for table {dbtable} does not match its load '
+                    f'checkpoint at row {row_offset}'
+                    )
+
+        for batch in chunked(items, batch_size):
+            with engine.begin() as conn:
+                conn.execute(table.insert(), batch)
+                row_offset += len(batch)
+                _write_checkpoint(
+                    conn, dbtable,
+                    row_offset=row_offset,
+                    batch_rows=len(batch),
+                    batch_hash=batch_hash(batch, field_names),
+                    )
+            loaded += len(batch)
+
+    with engine.begin() as conn:
+        _write_checkpoint(conn, dbtable, complete=True)
+    return loaded
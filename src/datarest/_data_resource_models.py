@@ -1,64 +1,260 @@
+import datetime
+import hashlib
+import json
+import os
 from typing import Optional
 
-import frictionless
+import pydantic
+import yaml
+from sqlalchemy import Column
 from sqlmodel import Field
+from typing_extensions import Literal
 
 from . import _sqlmodel_ext
+from . import _sqltypes
 from . import _resource_ids
 
 
-# Map tableschema type names to Python types.
+# Map tableschema type names to Python types. SQLModel derives the (native)
+# SQL column types from these.
 tableschema_type_map = {
-    'date': str,
+    'date': datetime.date,
+    'datetime': datetime.datetime,
+    'time': datetime.time,
+    'year': int,
     'string': str,
+    # Decimals for numbers with a precision, see create_model_from_table_def()
     'number': float,
     'integer': int,
     'complex': complex,
     'boolean': bool
 }
 
+# Bump this whenever the table definition format changes, to invalidate
+# existing cache entries.
+TABLE_DEF_VERSION = 5
 
-def create_model(model_name, model_def):
-    resource = frictionless.Resource(model_def.schema_)
-    (id_columns, model) = create_model_from_tableschema(
-        model_name, schema=resource.schema)
-    return (id_columns, model)
+
+def create_model(model_name, model_def, cache_dir=None):
+    """Create the SQLModel class for the data resource schema of the config
+    model definition.
+
+    If cache_dir is given the table definition derived from the data
+    resource schema is cached there, so that subsequent calls for an unchanged
+    schema file don't need to parse it again.
+
+    Returns: (id_columns, model)
+    """
+    table_def = read_table_def(model_def.schema_, cache_dir=cache_dir)
+    return create_model_from_table_def(model_name, table_def)
 
 
 def create_model_from_tableschema(model_name, schema):
-    id_columns = schema.primary_key
+    table_def = table_def_from_tableschema(schema)
+    return create_model_from_table_def(model_name, table_def)
+
+
+def table_def_from_tableschema(schema):
+    """Return the table definition for a frictionless schema.
+
+    The table definition is a JSON-serializable dict that holds everything
+    needed to create a model class, i.e. ID columns, ID type and fields.
+    """
+    return table_def_from_descriptor({'schema': schema.to_dict()})
+
+
+def table_def_from_descriptor(descriptor, basepath=''):
+    """Return the table definition for a data resource descriptor dict, as
+    read from a data resource YAML file.
+
+    This avoids using frictionless for reading data resource schemas, which is
+    comparably heavy on import and parsing. A schema given as a path is read
+    relative to basepath, its path and content hash are recorded in the
+    table definition's schema_files.
+    """
+    schema = descriptor['schema']
+    schema_files = {}
+    if isinstance(schema, str):
+        schema_path = os.path.join(basepath, schema)
+        with open(schema_path, 'rb') as schema_file:
+            content = schema_file.read()
+        schema_files[schema_path] = hashlib.sha256(content).hexdigest()
+        schema = yaml.safe_load(content)
+
+    id_columns = schema.get('primaryKey', [])
     # The tableschema spec allows for both a list or a string for the
-    # primaryKey attribute, we make it a tuple.
+    # primaryKey attribute, we make it a list.
     if isinstance(id_columns, str):
-        id_columns = (id_columns,)
+        id_columns = [id_columns]
+    else:
+        id_columns = list(id_columns)
+
+    def field_table_def(field_def):
+        constraints = field_def.get('constraints', {})
+        dictionary = None
+        if field_def.get('x_datarest_dictionary'):
+            dictionary = list(constraints['enum'])
+        return {
+            'name': field_def['name'],
+            # "any" is the tableschema default field type
+            'type': field_def.get('type', 'any'),
+            'required': bool(constraints.get('required', False)),
+            'description': field_def.get('description'),
+            'example': field_def.get('example'),
+            # Storage constraints, see _data_resource_tools.field_stats()
+            'max_length': constraints.get('maxLength'),
+            'minimum': constraints.get('minimum'),
+            'maximum': constraints.get('maximum'),
+            'dictionary': dictionary,
+            # Exact decimals: Total + fractional digits
+            'precision': field_def.get('x_datarest_precision'),
+            'scale': field_def.get('x_datarest_scale'),
+        }
+
+    pk_info = schema['x_datarest_primary_key_info']
+    return {
+        'version': TABLE_DEF_VERSION,
+        'id_columns': id_columns,
+        'id_type': str(pk_info['id_type']),
+        'id_src_fields': list(pk_info['id_src_fields']),
+        # Store the ids in their compact binary form
+        'id_binary': bool(pk_info.get('id_binary', False)),
+        # {path: sha256 hex digest} of a schema file referenced by path
+        'schema_files': schema_files,
+        'fields': [
+            field_table_def(field_def)
+            for field_def in schema.get('fields', [])
+            ],
+        }
+
+
+def _table_def_cache_path(schema_path, cache_dir):
+    # Cache entries are keyed by the schema file content hash.
+    with open(schema_path, 'rb') as schema_file:
+        digest = hashlib.sha256(schema_file.read())
+    digest.update(f'{TABLE_DEF_VERSION}'.encode())
+    return os.path.join(cache_dir, f'{digest.hexdigest()}.json')
+
+
+def _schema_files_unchanged(table_def):
+    # The cache entries are keyed by the data resource file only, check
+    # that the schema files it references are unchanged, too.
+    for path, hexdigest in table_def.get('schema_files', {}).items():
+        try:
+            with open(path, 'rb') as schema_file:
+                content = schema_file.read()
+        except OSError:
+            return False
+        if hashlib.sha256(content).hexdigest() != hexdigest:
+            return False
+    return True
+
+
+def read_table_def(schema_path, cache_dir=None):
+    """Return the table definition for the data resource schema file at
+    schema_path, preferably from the cache in cache_dir.
+
+    Cache failures are never fatal, the schema file is read instead.
+    """
+    cache_path = None
+    if cache_dir is not None and os.path.isfile(schema_path):
+        cache_path = _table_def_cache_path(schema_path, cache_dir)
+        try:
+            with open(cache_path, encoding='utf-8') as cache_file:
+                table_def = json.load(cache_file)
+            if (table_def.get('version') == TABLE_DEF_VERSION
+                    and _schema_files_unchanged(table_def)):
+                return table_def
+        except (OSError, ValueError):
+            pass
+
+    # Cache miss
+    if os.path.isfile(schema_path):
+        with open(schema_path, 'rb') as schema_file:
+            descriptor = yaml.safe_load(schema_file)
+        table_def = table_def_from_descriptor(
+            descriptor, basepath=os.path.dirname(schema_path))
     else:
-        id_columns = tuple(id_columns)
+        # Not a local file, e.g. a URL: Let frictionless handle it.
+        import frictionless
+        resource = frictionless.Resource(schema_path)
+        table_def = table_def_from_tableschema(resource.schema)
+
+    if cache_path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file first, so concurrently starting
+            # workers never read a partially written cache entry.
+            tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp_path, encoding='utf-8', mode='w') as cache_file:
+                json.dump(table_def, cache_file, default=str)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return table_def
+
+
+def create_model_from_table_def(model_name, table_def):
+    """Create the SQLModel class from a table definition.
+
+    Returns: (id_columns, model)
+    """
+    id_columns = tuple(table_def['id_columns'])
 
     id_default_func = _resource_ids.create_id_default(
-        id_type=schema.custom['x_datarest_primary_key_info']['id_type'],
-        primary_key=tuple(
-            schema.custom['x_datarest_primary_key_info']['id_src_fields']),
+        id_type=table_def['id_type'],
+        primary_key=tuple(table_def['id_src_fields']),
     )
 
     attributes = {}
-    for field_def in schema.fields:
-        name = field_def.name
-        typ = tableschema_type_map[field_def.type]
+    for field_def in table_def['fields']:
+        name = field_def['name']
+        typ = tableschema_type_map[field_def['type']]
         primary_key = True if name in id_columns else False
-        # SQLModel uses Optional type annotations for nullability
-        if not field_def.required and not primary_key:
-            typ = Optional[typ]
-        description = field_def.description
-        example = field_def.example
+        nullable = not field_def['required'] and not primary_key
+        description = field_def['description']
+        example = field_def['example']
         sa_column_kwargs = {}
         if primary_key and id_default_func is not None:
             sa_column_kwargs['default'] = id_default_func
+
+        # Compact storage types, derived from data statistics
+        sa_type = None
+        max_length = field_def.get('max_length')
+        dictionary = field_def.get('dictionary')
+        if primary_key and table_def.get('id_binary'):
+            max_length = None
+            sa_type = _sqltypes.BinaryId(table_def['id_type'])
+        elif dictionary:
+            max_length = None
+            sa_type = _sqltypes.DictionaryEncoded(dictionary)
+            typ = Literal[tuple(dictionary)]
+        elif field_def['type'] == 'integer' and not primary_key:
+            sa_type = _sqltypes.integer_type(
+                field_def.get('minimum'), field_def.get('maximum'))
+        elif (field_def['type'] == 'number'
+                and field_def.get('precision') is not None):
+            precision = field_def['precision']
+            scale = field_def.get('scale') or 0
+            typ = pydantic.condecimal(
+                max_digits=precision, decimal_places=scale)
+            sa_type = _sqltypes.ExactDecimal(precision, scale)
+        column_kwargs = {'sa_column_kwargs': sa_column_kwargs}
+        if sa_type is not None:
+            column_kwargs = {'sa_column': Column(
+                name, sa_type, primary_key=primary_key, nullable=nullable,
+                **sa_column_kwargs)}
+
+        # SQLModel uses Optional type annotations for nullability
+        if nullable:
+            typ = Optional[typ]
         attributes[name] = (
             typ,
             Field(description=description,
                   primary_key=primary_key,
+                  max_length=max_length,
                   schema_extra={'example': example},
-                  sa_column_kwargs=sa_column_kwargs)
+                  **column_kwargs)
         )
     model = _sqlmodel_ext.create_model(
         model_name, __cls_kwargs__={'table': True},  **attributes)
@@ -1,13 +1,23 @@
 # Support for adding and modifying resource schema and field metadata.
 # Custom transformation steps for adding resource IDs.
 
+import dataclasses
 import enum
 import functools
+import hashlib
+import itertools
 import re
+from typing import Dict, List, Optional
 
 import frictionless
 
-from ._resource_ids import IdEnum, id_type_funcs
+from ._resource_ids import (
+    IdEnum, DuplicateIdEnum, binary_id_types, id_type_funcs,
+    id_type_batch_funcs)
+
+
+# Number of rows to generate resource ids for in one go.
+ID_BATCH_SIZE = 1024
 
 
 def add_attr(resource, attr_name, **field_attrs):
@@ -38,6 +48,84 @@ def add_examples(resource):
     return resource
 
 
+@dataclasses.dataclass
+class FieldStats:
+    """Data statistics of a resource field.
+    """
+    minimum: object = None
+    maximum: object = None
+    max_length: int = 0
+    # Number of (non-null) values
+    count: int = 0
+    # Distinct values, None if there are more than max_distinct
+    values: object = dataclasses.field(default_factory=set)
+
+
+def field_stats(resource, max_distinct=256):
+    """Read the resource data and return {field name: FieldStats} for its
+    integer and string fields.
+    """
+    stats = {
+        field.name: FieldStats() for field in resource.schema.fields
+        if field.type in ('integer', 'string')}
+    with resource:
+        for row in resource.row_stream:
+            for name, field_stats_ in stats.items():
+                value = row[name]
+                if value is None:
+                    continue
+                field_stats_.count += 1
+                if isinstance(value, int):
+                    if (field_stats_.minimum is None
+                            or value < field_stats_.minimum):
+                        field_stats_.minimum = value
+                    if (field_stats_.maximum is None
+                            or value > field_stats_.maximum):
+                        field_stats_.maximum = value
+                else:
+                    field_stats_.max_length = max(
+                        field_stats_.max_length, len(value))
+                    if field_stats_.values is not None:
+                        field_stats_.values.add(value)
+                        if len(field_stats_.values) > max_distinct:
+                            field_stats_.values = None
+    return stats
+
+
+def add_storage_constraints(resource, stats, dictionary_max=0):
+    """Add field constraints from data statistics for compact column storage:
+    The value range of integers, the maximum length of strings.
+
+    Integer primary keys are left as-is, they need to hold the ids of
+    created resources (and SQLite only autoincrements INTEGER primary
+    keys).
+
+    String fields with at most dictionary_max distinct values, each repeated
+    on average (and that are not part of the primary key) are marked for
+    dictionary encoding, with the values as enum constraint.
+    """
+    primary_key = resource.schema.primary_key
+    for field in resource.schema.fields:
+        field_stats_ = stats.get(field.name)
+        if field_stats_ is None:
+            continue
+        if field.type == 'integer':
+            if (field_stats_.minimum is not None
+                    and field.name not in primary_key):
+                field.constraints['minimum'] = field_stats_.minimum
+                field.constraints['maximum'] = field_stats_.maximum
+        elif field.type == 'string':
+            field.constraints['maxLength'] = max(field_stats_.max_length, 1)
+            if (dictionary_max
+                    and field.name not in primary_key
+                    and field_stats_.values
+                    and len(field_stats_.values) <= dictionary_max
+                    and 2 * len(field_stats_.values) <= field_stats_.count):
+                field.constraints['enum'] = sorted(field_stats_.values)
+                field.custom['x_datarest_dictionary'] = True
+    return resource
+
+
 def identifier_field_name(name, prefix='f_'):
     """Change resource field names to valid identifiers.
     """
@@ -94,13 +182,38 @@ def modify_resource_fields(resource, *modifiers):
     return resource
 
 
+def chunked(iterable, size):
+    """Yield lists of (at most) size items from iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def batch_id_func(id_):
+    """Return a batch id generation callable with signature
+    ids_(rows, concat_sep) that applies the single-row id_ callable to each
+    primary key fields row.
+    """
+    def ids_(rows, concat_sep='.'):
+        return [id_(*fields, concat_sep=concat_sep) for fields in rows]
+
+    return ids_
+
+
 def composite_id_step(
         id_,
         id_type,
         primary_key,
         field_names,
         id_field_name='id_',
-        concat_sep='.'
+        concat_sep='.',
+        ids_=None,
+        batch_size=ID_BATCH_SIZE,
+        id_binary=False,
     ):
     """Return a custom frictionless resource transform step that uses the
     provided id_ generation callable to derive a unique key from a composite
@@ -114,7 +227,16 @@ def composite_id_step(
         field_names: the table schema field names list
         id_field_name: name to use for the generated composite id field
         concat_sep: separator to use for key field concatenation
+        ids_: an optional batch callable with signature ids_(rows, concat_sep)
+            to generate the IDs for a list of primary key field rows at once.
+            Defaults to applying id_ to each row.
+        batch_size: number of rows to generate IDs for in one ids_ call
+        id_binary: store the IDs in their compact binary form, see
+            _resource_ids.binary_id_types
     """
+    if ids_ is None:
+        ids_ = batch_id_func(id_)
+
     # Get the given PK field indexes for use in the transform step
     pk_indexes = [
         i for (i, field_name) in enumerate(field_names)
@@ -133,14 +255,17 @@ def composite_id_step(
 
             def data():
                 with current:
-                    for line in current.cell_stream:
+                    for lines in chunked(current.cell_stream, batch_size):
                         # can't use operator.itemgetter here since it doesn't
                         # always return tuples but a single value for a single
                         # index arg
-                        pk_fields = (line[i] for i in pk_indexes)
-                        composite_id = id_(*pk_fields, concat_sep=concat_sep)
-                        line.insert(0, composite_id)
-                        yield line
+                        pk_rows = [
+                            [line[i] for i in pk_indexes] for line in lines]
+                        composite_ids = ids_(pk_rows, concat_sep=concat_sep)
+                        # lines may be tuples, e.g. when coming from a
+                        # previous (petl-based) transform step
+                        for line, composite_id in zip(lines, composite_ids):
+                            yield [composite_id, *line]
 
             # Meta
             resource.data = data
@@ -151,17 +276,169 @@ def composite_id_step(
                     )
                 )
             resource.schema.primary_key = [id_field_name]
-            resource.schema.custom['x_datarest_primary_key_info'] = {
+            pk_info = {
                 'id_type': str(id_type),
                 'id_src_fields': list(primary_key)
                 }
+            if id_binary:
+                pk_info['id_binary'] = True
+            resource.schema.custom['x_datarest_primary_key_info'] = pk_info
 
     return _composite_id_step
 
 
 # These ID types do not use business keys i.e. existing field data but
 # generated unique IDs (UUID, GUID).
-non_biz_id_types = set([IdEnum.uuid4_base64])
+non_biz_id_types = set([
+    IdEnum.uuid4_base64, IdEnum.ulid, IdEnum.uuid7_base64])
+
+
+@dataclasses.dataclass
+class DuplicateIds:
+    """Duplicate resource IDs found in a resource.
+
+    Attributes:
+        id_field_name: the resource ID field name
+        rows: {id: [row_number, ...]} dict of the row numbers of all but the
+            first occurrence of each duplicate ID
+        positions: {id: [position, ...]} dict of the 0-based positions of
+            these rows among the resource rows
+        source_rows: optional {id: [row_number, ...]} dict of these rows'
+            row numbers in the source (e.g. data file) of a transformed
+            resource, see add_source_rows()
+    """
+    id_field_name: str
+    rows: Dict[str, List[int]] = dataclasses.field(default_factory=dict)
+    positions: Dict[str, List[int]] = dataclasses.field(default_factory=dict)
+    source_rows: Optional[Dict[str, List[int]]] = None
+
+    @property
+    def count(self):
+        """Number of duplicate rows.
+        """
+        return sum(len(row_numbers) for row_numbers in self.rows.values())
+
+    def __bool__(self):
+        return bool(self.rows)
+
+    def __str__(self):
+        lines = [
+            f'{self.count} duplicate {self.id_field_name} value(s) for '
+            f'{len(self.rows)} ID(s):'
+            ]
+        rows = self.rows if self.source_rows is None else self.source_rows
+        lines.extend(
+            f'  {id_}: rows {", ".join(map(str, row_numbers))}'
+            for id_, row_numbers in rows.items()
+            )
+        return '\n'.join(lines)
+
+
+class DuplicateIdError(ValueError):
+    """Duplicate resource IDs found.
+    """
+
+    def __init__(self, duplicates):
+        super().__init__(str(duplicates))
+        self.duplicates = duplicates
+
+    def __reduce__(self):
+        # Keep the duplicates when pickled, e.g. raised in a worker process
+        return type(self), (self.duplicates,)
+
+
+def _id_digest(id_):
+    # Keep track of seen IDs by their fixed size digest rather than the (up to
+    # 64 character) ID string itself, to keep the seen set compact.
+    return hashlib.blake2b(str(id_).encode('utf8'), digest_size=16).digest()
+
+
+def find_duplicate_ids(resource, id_field_name='id_'):
+    """Read all resource rows and return the DuplicateIds of the
+    id_field_name field.
+    """
+    seen = set()
+    duplicates = DuplicateIds(id_field_name=id_field_name)
+    with resource:
+        for position, row in enumerate(resource.row_stream):
+            id_ = row[id_field_name]
+            digest = _id_digest(id_)
+            if digest in seen:
+                duplicates.rows.setdefault(id_, []).append(row.row_number)
+                duplicates.positions.setdefault(id_, []).append(position)
+            else:
+                seen.add(digest)
+    return duplicates
+
+
+def add_source_rows(duplicates, source):
+    """Set the duplicates.source_rows to the row numbers of the duplicate
+    rows in the source resource.
+
+    Transformed resources number their rows anew, i.e. not by the source's
+    lines (e.g. with a header row other than the first one). source is the
+    resource the duplicates' resource is transformed from, row by row.
+    """
+    ids = {
+        position: id_
+        for id_, positions in duplicates.positions.items()
+        for position in positions}
+    source_rows = {}
+    with source:
+        for position, row in enumerate(source.row_stream):
+            id_ = ids.get(position)
+            if id_ is not None:
+                source_rows.setdefault(id_, []).append(row.row_number)
+    duplicates.source_rows = source_rows
+    return duplicates
+
+
+def dedup_step(duplicates: DuplicateIds, policy: DuplicateIdEnum):
+    """Return a custom frictionless resource transform step that removes the
+    rows with duplicate IDs according to policy.
+
+    Parameters:
+        duplicates: the resource DuplicateIds, as returned by
+            find_duplicate_ids()
+        policy: a DuplicateIdEnum
+    """
+    if policy == DuplicateIdEnum.fail:
+        raise ValueError(f'Duplicate ID policy {policy} does not dedup')
+
+    id_field_name = duplicates.id_field_name
+    if policy == DuplicateIdEnum.skip:
+        skip_rows = set(itertools.chain.from_iterable(
+            duplicates.rows.values()))
+
+        def keep(row):
+            return row.row_number not in skip_rows
+    else:
+        last_rows = {
+            id_: row_numbers[-1]
+            for id_, row_numbers in duplicates.rows.items()
+            }
+
+        def keep(row):
+            last_row = last_rows.get(row[id_field_name])
+            return last_row is None or last_row == row.row_number
+
+    class _dedup_step(frictionless.Step):
+
+        def transform_resource(self, resource):
+            current = resource.to_copy()
+
+            # Data
+
+            def data():
+                with current:
+                    yield current.schema.field_names
+                    for row in current.row_stream:
+                        if keep(row):
+                            yield row.to_list()
+
+            resource.data = data
+
+    return _dedup_step
 
 
 def primary_key_step(
@@ -170,11 +447,19 @@ def primary_key_step(
         primary_key=(),
         create_exposed=False,
         id_field_name='id_',
-        concat_sep='.'
+        concat_sep='.',
+        id_binary=False,
     ):
     """Return a custom frictionless resource transform step to add a single
     primary key field to a given resource.
+
+    With id_binary the IDs are stored in their compact binary form, which is
+    supported for hash and UUID/ULID id types only.
     """
+    if id_binary and id_type not in binary_id_types:
+        raise ValueError(
+            f'ID type {id_type} does not support binary storage')
+
     fields = resource.schema.fields
     field_names = resource.schema.field_names
 
@@ -220,6 +505,7 @@ def primary_key_step(
                 )
 
         id_ = id_type_funcs[id_type]
+        ids_ = id_type_batch_funcs[id_type]
 
         step = composite_id_step(
             id_=id_,
@@ -227,7 +513,9 @@ def primary_key_step(
             primary_key=primary_key,
             field_names=field_names,
             id_field_name=id_field_name,
-            concat_sep=concat_sep
+            concat_sep=concat_sep,
+            ids_=ids_,
+            id_binary=id_binary,
             )
 
         return step
@@ -0,0 +1,206 @@
+# Tabular response formats besides JSON: CSV, Arrow IPC stream and Parquet,
+# negotiated by the Accept request header and streamed in batches straight
+# from the database rows.
+
+import csv
+import datetime
+import decimal
+import io
+
+
+# Number of rows per CSV chunk/Arrow record batch/Parquet row group
+BATCH_SIZE = 10000
+
+# {format: media type}
+media_types = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+    }
+
+# Media types of the formats, including aliases
+_formats = {
+    **{media_type: fmt for fmt, media_type in media_types.items()},
+    'application/x-parquet': 'parquet',
+    }
+
+# Formats that need pyarrow
+arrow_formats = {'arrow', 'parquet'}
+
+
+def negotiate(accept):
+    """Return the tabular format preferred by the Accept header value, or
+    None for JSON (also the default without any acceptable format).
+    """
+    candidates = []
+    for position, item in enumerate((accept or '').split(',')):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, media_type.lower()))
+    for _, _, media_type in sorted(candidates):
+        if media_type in _formats:
+            return _formats[media_type]
+        if media_type in ('application/json', '*/*', 'application/*'):
+            return None
+    return None
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def csv_stream(columns, rows, batch_size=BATCH_SIZE):
+    """Yield the CSV encoded header + rows, in chunks of batch_size rows.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+    writer.writerow([column.name for column in columns])
+    for batch in _batches(rows, batch_size):
+        writer.writerows([[_csv_value(value) for value in row]
+                          for row in batch])
+        yield buffer.getvalue().encode('utf8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only
+        yield buffer.getvalue().encode('utf8')
+
+
+def arrow_type(column):
+    """Return the pyarrow type for a SQLAlchemy column.
+    """
+    import pyarrow as pa
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return pa.string()
+    if python_type is bool:
+        return pa.bool_()
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    if python_type is decimal.Decimal:
+        precision = getattr(column.type, 'precision', None)
+        scale = getattr(column.type, 'scale', None)
+        if precision is not None and scale is not None:
+            return pa.decimal128(precision, scale)
+        return pa.float64()
+    if python_type is datetime.datetime:
+        return pa.timestamp('us')
+    if python_type is datetime.date:
+        return pa.date32()
+    if python_type is datetime.time:
+        return pa.time64('us')
+    return pa.string()
+
+
+def arrow_schema(columns):
+    """Return the pyarrow schema for the SQLAlchemy columns.
+    """
+    import pyarrow as pa
+    return pa.schema([
+        pa.field(column.name, arrow_type(column), nullable=column.nullable)
+        for column in columns])
+
+
+def _record_batch(schema, batch):
+    import pyarrow as pa
+    arrays = []
+    for i, field in enumerate(schema):
+        values = [row[i] for row in batch]
+        if pa.types.is_string(field.type):
+            values = [None if value is None else str(value)
+                      for value in values]
+        elif pa.types.is_floating(field.type):
+            # E.g. unscaled decimals
+            values = [None if value is None else float(value)
+                      for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _Sink(io.BytesIO):
+    # A buffer to stream writer output from: The writers close their sink
+    # when done, keep it open to drain the remaining output.
+
+    def close(self):
+        pass
+
+    def drain(self):
+        data = self.getvalue()
+        self.seek(0)
+        self.truncate()
+        return data
+
+
+def arrow_stream(columns, rows, batch_size=BATCH_SIZE):
+    """Yield the Arrow IPC stream of the rows, one record batch per
+    batch_size rows.
+    """
+    import pyarrow as pa
+    schema = arrow_schema(columns)
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in _batches(rows, batch_size):
+            writer.write_batch(_record_batch(schema, batch))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def parquet_stream(columns, rows, batch_size=BATCH_SIZE):
+    """Yield the Parquet file of the rows, one row group per batch_size rows.
+
+    The file metadata comes last, i.e. clients can only read the file once
+    complete.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = arrow_schema(columns)
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in _batches(rows, batch_size):
+            writer.write_table(
+                pa.Table.from_batches([_record_batch(schema, batch)]))
+            yield sink.drain()
+    yield sink.drain()
+
+
+streams = {
+    'csv': csv_stream,
+    'arrow': arrow_stream,
+    'parquet': parquet_stream,
+    }
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
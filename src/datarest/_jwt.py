@@ -1,3 +1,6 @@
+import functools
+import logging
+import os
 import secrets
 from datetime import datetime, timedelta
 from typing import Union
@@ -5,12 +8,9 @@ from typing import Union
 from jose import JWTError, jwt
 from pydantic import BaseModel
 
-# FIXME: For dev purposes only:
-# - Decide if asymmetric crypto makes more sense here
-# - Move secret key to separate source (read from env, vault, sops, at least
-# some separate secrets config file)
-# - Decide if some form of key rotation is sensible
-SECRET_KEY = secrets.token_hex(32)
+
+logger = logging.getLogger('uvicorn.error')
+
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
@@ -24,8 +24,83 @@ class TokenData(BaseModel):
     username: Union[str, None] = None
 
 
+def parse_keys(value):
+    """Parse a "kid1=secret1,kid2=secret2" signing keys str into a
+    {kid: secret} dict.
+    """
+    keys = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        kid, sep, secret = item.partition('=')
+        if not sep or not kid.strip() or not secret:
+            raise ValueError(f'Invalid JWT signing key {kid.strip()!r}')
+        keys[kid.strip()] = secret
+    return keys
+
+
+def keys_configured(jwt_config):
+    """Return True if signing keys are configured for the _cfgfile.Jwt
+    config, i.e. no random per-process key is needed.
+    """
+    return bool(
+        os.environ.get(jwt_config.keys_env, '').strip() or jwt_config.keys)
+
+
+@functools.lru_cache(maxsize=None)
+def _ephemeral_keys():
+    # A random per-process key: Tokens don't survive restarts and aren't
+    # valid in other processes, i.e. other (non-forked) workers.
+    logger.warning(
+        'No JWT signing keys configured, using a random key, issued tokens '
+        'become invalid on restart and are only valid in this process')
+    return (('ephemeral', secrets.token_hex(32)), )
+
+
+class JwtKeys:
+    """Signing keys for JWTs, by key id.
+
+    The first key signs new tokens, all keys verify tokens. This allows for
+    key rotation: Add a new key in front, drop the old key once the tokens it
+    signed have expired.
+    """
+
+    def __init__(self, keys, algorithm=ALGORITHM):
+        if not keys:
+            raise ValueError('No JWT signing keys')
+        self.keys = dict(keys)
+        self.algorithm = algorithm
+        self.signing_kid = next(iter(self.keys))
+
+    @classmethod
+    def from_config(cls, jwt_config):
+        """Return the JwtKeys for a _cfgfile.Jwt config, preferring the keys
+        from its keys_env environment variable over the configured keys.
+        """
+        keys = parse_keys(os.environ.get(jwt_config.keys_env, ''))
+        if not keys:
+            keys = jwt_config.keys or dict(_ephemeral_keys())
+        return cls(keys, algorithm=jwt_config.algorithm)
+
+    def encode(self, claims):
+        return jwt.encode(
+            claims, self.keys[self.signing_kid], algorithm=self.algorithm,
+            headers={'kid': self.signing_kid})
+
+    def decode(self, token):
+        """Return the claims of the verified token.
+
+        Raises: JWTError for invalid, expired or unknown key tokens
+        """
+        kid = jwt.get_unverified_header(token).get('kid')
+        if kid not in self.keys:
+            raise JWTError('Unknown signing key')
+        return jwt.decode(token, self.keys[kid], algorithms=[self.algorithm])
+
+
 def create_access_token(
         data: dict,
+        keys: JwtKeys,
         expires_delta: Union[timedelta, None] = None
         ):
     to_encode = data.copy()
@@ -34,5 +109,20 @@ def create_access_token(
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = keys.encode(to_encode)
     return encoded_jwt
+
+
+def decode_access_token(token: str, keys: JwtKeys):
+    """Verify the access token locally, without contacting the
+    authentication backend.
+
+    Raises: JWTError for invalid tokens
+
+    Returns: TokenData
+    """
+    claims = keys.decode(token)
+    username = claims.get('sub')
+    if username is None:
+        raise JWTError('Token without subject')
+    return TokenData(username=username)
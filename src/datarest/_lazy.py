@@ -0,0 +1,247 @@
+# Lazy datatables: Build each datatable's model + routes on its first request
+# instead of at startup, keeping a bounded set of recently used datatables
+# built ("warm").
+
+import collections
+import collections.abc
+import threading
+import warnings
+
+from fastapi.openapi.utils import get_openapi
+from sqlalchemy import exc as sa_exc
+from sqlmodel import SQLModel
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import URL
+from starlette.responses import PlainTextResponse, RedirectResponse
+from starlette.routing import BaseRoute, Match, NoMatchFound
+
+
+class LazyTables:
+    """The datatables of an app, built on demand.
+
+    At most max_warm datatables are kept built, the least recently used
+    datatable is dropped when building another one.
+    """
+
+    def __init__(self, build_table, datatables, max_warm):
+        # build_table(model_name, model_def) returns a TableState
+        self.build_table = build_table
+        self._set_model_defs(datatables)
+        self.max_warm = max_warm
+        self.warm = collections.OrderedDict()
+        self.openapi_docs = {}
+        # Guards the bookkeeping, the builds are guarded by the per datatable
+        # _build_locks
+        self._lock = threading.RLock()
+        self._build_locks = {}
+        # Incremented when dropping datatables
+        self._generation = 0
+
+    def __contains__(self, model_name):
+        return model_name in self.model_defs
+
+    def _set_model_defs(self, datatables):
+        self.model_defs = dict(datatables.items())
+        # {route path prefix: model name}, CRUDRouter uses the lowercased
+        # resource name as path prefix
+        self.prefixes = {
+            model_name.lower(): model_name for model_name in self.model_defs}
+
+    def get(self, model_name):
+        """Return the TableState for model_name, building it if needed.
+
+        Built datatables are served right away, also while others are being
+        built: Only the building of a datatable is serialized (per
+        datatable).
+        """
+        with self._lock:
+            table = self._warm_table(model_name)
+            if table is not None:
+                return table
+            build_lock = self._build_locks.setdefault(
+                model_name, threading.Lock())
+        with build_lock:
+            with self._lock:
+                # Built by a concurrent request meanwhile?
+                table = self._warm_table(model_name)
+                if table is not None:
+                    return table
+                model_def = self.model_defs[model_name]
+                generation = self._generation
+            with warnings.catch_warnings():
+                # Re-creating the model class of a dropped table is intended
+                warnings.simplefilter('ignore', sa_exc.SAWarning)
+                table = self.build_table(model_name, model_def)
+            with self._lock:
+                if generation != self._generation:
+                    # Datatables were dropped (e.g. reloaded) meanwhile: Serve
+                    # this request, but don't keep a possibly outdated table
+                    self._drop_table(table)
+                    return table
+                while len(self.warm) >= self.max_warm:
+                    _, cold = self.warm.popitem(last=False)
+                    self._drop_table(cold)
+                self.warm[model_name] = table
+            return table
+
+    def _warm_table(self, model_name):
+        table = self.warm.get(model_name)
+        if table is not None:
+            self.warm.move_to_end(model_name)
+        return table
+
+    def _drop_table(self, table):
+        # Make room for re-creating the model class' table later on
+        SQLModel.metadata.remove(table.model.resource_model.__table__)
+
+    def update(self, datatables):
+        """Update the datatable definitions, dropping the changed or removed
+        datatables.
+
+        Returns: ReloadResult-like tuple of lists (added, changed, removed,
+        unchanged)
+        """
+        added, changed, removed, unchanged = [], [], [], []
+        model_defs = dict(datatables.items())
+        with self._lock:
+            for model_name, model_def in model_defs.items():
+                old_model_def = self.model_defs.get(model_name)
+                if old_model_def is None:
+                    added.append(model_name)
+                elif old_model_def == model_def:
+                    unchanged.append(model_name)
+                else:
+                    changed.append(model_name)
+            removed.extend(
+                model_name for model_name in self.model_defs
+                if model_name not in model_defs)
+            for model_name in changed + removed:
+                self.drop(model_name)
+            self._set_model_defs(datatables)
+        return added, changed, removed, unchanged
+
+    def drop(self, model_name):
+        """Drop the model_name datatable, if built.
+        """
+        with self._lock:
+            self._generation += 1
+            self.openapi_docs.pop(model_name, None)
+            table = self.warm.pop(model_name, None)
+            if table is not None:
+                self._drop_table(table)
+
+    def clear(self):
+        """Drop all built datatables.
+        """
+        with self._lock:
+            self._generation += 1
+            for table in self.warm.values():
+                self._drop_table(table)
+            self.warm.clear()
+            self.openapi_docs.clear()
+
+    def openapi(self, model_name, app):
+        """Return the OpenAPI document for the model_name datatable routes.
+        """
+        doc = self.openapi_docs.get(model_name)
+        if doc is None:
+            table = self.get(model_name)
+            doc = get_openapi(
+                title=f'{app.title}: {model_name}',
+                version=app.version,
+                openapi_version=app.openapi_version,
+                description=app.description,
+                routes=table.routes,
+                )
+            self.openapi_docs[model_name] = doc
+        return doc
+
+
+class LazyModels(collections.abc.Mapping):
+    """Read-only {model_name: ModelCombo} mapping of lazy datatables.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def __getitem__(self, model_name):
+        if model_name not in self.tables:
+            raise KeyError(model_name)
+        return self.tables.get(model_name).model
+
+    def __iter__(self):
+        return iter(self.tables.model_defs)
+
+    def __len__(self):
+        return len(self.tables.model_defs)
+
+
+def openapi(app, tables):
+    """Return the OpenAPI document for app, including all lazy datatables.
+    """
+    doc = get_openapi(
+        title=app.title,
+        version=app.version,
+        openapi_version=app.openapi_version,
+        description=app.description,
+        routes=app.routes,
+        )
+    paths = doc.setdefault('paths', {})
+    schemas = doc.setdefault('components', {}).setdefault('schemas', {})
+    for model_name in list(tables.model_defs):
+        table_doc = tables.openapi(model_name, app)
+        paths.update(table_doc.get('paths', {}))
+        schemas.update(table_doc.get('components', {}).get('schemas', {}))
+    return doc
+
+
+class LazyTablesRoute(BaseRoute):
+    """Route dispatching to the (lazily built) datatable routes by the first
+    path segment.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def matches(self, scope):
+        if scope['type'] == 'http':
+            prefix = scope['path'].split('/', 2)[1]
+            if prefix in self.tables.prefixes:
+                return Match.FULL, {}
+        return Match.NONE, {}
+
+    async def handle(self, scope, receive, send):
+        model_name = self.tables.prefixes[scope['path'].split('/', 2)[1]]
+        table = await run_in_threadpool(self.tables.get, model_name)
+
+        partial = None
+        for route in table.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                scope.update(child_scope)
+                await route.handle(scope, receive, send)
+                return
+            if match == Match.PARTIAL and partial is None:
+                partial = route, child_scope
+        if partial is not None:
+            # Let the route respond with 405 Method Not Allowed
+            route, child_scope = partial
+            scope.update(child_scope)
+            await route.handle(scope, receive, send)
+            return
+
+        path = scope['path']
+        if path.endswith('/'):
+            # Redirect like the app's router does for the eager datatables
+            redirect_scope = dict(scope, path=path.rstrip('/'))
+            if any(route.matches(redirect_scope)[0] != Match.NONE
+                   for route in table.routes):
+                response = RedirectResponse(
+                    url=str(URL(scope=redirect_scope)))
+                await response(scope, receive, send)
+                return
+        response = PlainTextResponse('Not Found', status_code=404)
+        await response(scope, receive, send)
+
+    def url_path_for(self, name, **path_params):
+        raise NoMatchFound(name, path_params)
@@ -2,37 +2,144 @@ import attr
 import ldap3
 import functools
 import ssl
+import threading
+import time
 
 
 InvalidCredentialsError = ldap3.core.exceptions.LDAPBindError
 
+# LDAP result code for a bind with invalid credentials
+_INVALID_CREDENTIALS = 49
 
-# a helper to set proper ldap TLS 
+
+# a helper to set proper ldap TLS
 _SSLServer = functools.partial(
     ldap3.Server, use_ssl=True, tls=ldap3.Tls(validate=ssl.CERT_REQUIRED))
 
 
+def _close(conn):
+    # Close conn, ignoring errors of already broken connections
+    try:
+        conn.unbind()
+    except ldap3.core.exceptions.LDAPException:
+        pass
+
+
 @attr.s
 class LDAPAuth:
     """LDAP (user, password) authentication.
 
     Uses TLS for LDAP connection.
 
+    With a pool_size, up to pool_size open connections are kept and re-bound
+    for each authentication, saving the TCP + TLS handshake. Connections idle
+    for longer than max_idle seconds or found closed are replaced, a
+    connection failing during the bind is reconnected once.
+
     Args:
         bind_dn: LDAP bind dn for user authentication ("login") against the
             LDAP server. The username is put into the {uid} placeholder.
         server: LDAP server name
+        pool_size: max number of kept open connections, 0 to open a new
+            connection per authentication
+        max_idle: max seconds to keep an unused connection
+        client_strategy: ldap3 client strategy
     """
     bind_dn: str = attr.ib()
     server: ldap3.Server = attr.ib(converter=_SSLServer)
-    
+    pool_size: int = attr.ib(default=0)
+    max_idle: float = attr.ib(default=60.0)
+    client_strategy: str = attr.ib(default=ldap3.SYNC)
+    # [(connection, last used time), ...]
+    _pool: list = attr.ib(init=False, factory=list, repr=False)
+    _lock: threading.Lock = attr.ib(
+        init=False, factory=threading.Lock, repr=False)
+
     def authenticate(self, username, password):
         """Authenticate with given credentials.
 
         Returns:
             LDAP identity of the bound user
         """
+        if self.pool_size:
+            return self._pooled_authenticate(username, password)
         with ldap3.Connection(
                 self.server, self.bind_dn.format(uid=username), password,
+                client_strategy=self.client_strategy,
                 auto_bind=True) as conn:
             return conn.extend.standard.who_am_i()
+
+    def _connect(self):
+        conn = ldap3.Connection(
+            self.server, client_strategy=self.client_strategy, read_only=True)
+        conn.open(read_server_info=False)
+        return conn
+
+    def _checkout(self):
+        # Return a healthy pooled connection or a new one
+        now = time.monotonic()
+        stale = []
+        conn = None
+        with self._lock:
+            while self._pool:
+                pooled, last_used = self._pool.pop()
+                if not pooled.closed and now - last_used < self.max_idle:
+                    conn = pooled
+                    break
+                stale.append(pooled)
+        for pooled in stale:
+            _close(pooled)
+        return conn if conn is not None else self._connect()
+
+    def _checkin(self, conn):
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append((conn, time.monotonic()))
+                return
+        _close(conn)
+
+    @staticmethod
+    def _bind(conn, user, password):
+        conn.user = user
+        conn.password = password
+        conn.authentication = ldap3.SIMPLE
+        return conn.bind(read_server_info=False)
+
+    def _pooled_authenticate(self, username, password):
+        user = self.bind_dn.format(uid=username)
+        if not password:
+            # An empty password would be an unauthenticated bind
+            raise InvalidCredentialsError('Password is mandatory')
+
+        conn = self._checkout()
+        try:
+            try:
+                bound = self._bind(conn, user, password)
+            except ldap3.core.exceptions.LDAPCommunicationError:
+                # E.g. closed by the server in the meantime: Reconnect once
+                _close(conn)
+                conn = self._connect()
+                bound = self._bind(conn, user, password)
+        except BaseException:
+            _close(conn)
+            raise
+        result = conn.result
+        self._checkin(conn)
+
+        if not bound:
+            if result.get('result') == _INVALID_CREDENTIALS:
+                raise InvalidCredentialsError(result.get('description'))
+            raise ldap3.core.exceptions.LDAPOperationResult(
+                result=result.get('result'),
+                description=result.get('description'),
+                message=result.get('message'))
+        # Same as who_am_i() without the extra round-trip
+        return f'dn:{user}'
+
+    def close(self):
+        """Close the pooled connections.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, []
+        for conn, _ in pool:
+            _close(conn)
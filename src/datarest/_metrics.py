@@ -0,0 +1,567 @@
+# Prometheus metrics: A small in-process metrics registry, exposed in the
+# Prometheus text format, with the per-route HTTP, database and LDAP metrics.
+#
+# With several worker processes each worker writes snapshots of its metrics
+# to a directory shared by the workers, a scrape (answered by any worker)
+# adds up the snapshots of all workers.
+
+import bisect
+import contextlib
+import functools
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+import weakref
+
+from fastapi import Response
+from sqlalchemy import event
+
+from . import _request_context
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+logger = logging.getLogger('uvicorn.error')
+
+# Starlette adds the charset
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+class _Metric:
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        """Return the [[label values], value] samples.
+        """
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """A histogram, its sample values are [bucket counts (not cumulative,
+    the last one for +Inf), sum].
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                sample = self._values[key] = [
+                    [0] * (len(self.buckets) + 1), 0]
+            sample[0][index] += 1
+            sample[1] += value
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]]
+                    for key, (counts, total) in self._values.items()]
+
+
+class Registry:
+    """The metrics, by name, and collector callables to update gauges right
+    before taking a snapshot.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _metric(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._metric(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._metric(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=LATENCY_BUCKETS):
+        return self._metric(
+            Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def snapshot(self):
+        """Return a JSON-serializable snapshot of the metrics.
+        """
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception('Metrics collector failed')
+        return {
+            'pid': os.getpid(),
+            'metrics': {
+                metric.name: {
+                    'kind': metric.kind,
+                    'help': metric.documentation,
+                    'labelnames': list(metric.labelnames),
+                    'buckets': list(getattr(metric, 'buckets', [])),
+                    'samples': metric.samples(),
+                    }
+                for metric in metrics},
+            }
+
+
+def merge(snapshots):
+    """Return the snapshots' metrics added up, i.e. {name: metric dict} with
+    {label values tuple: value} samples.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot['metrics'].items():
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = {**metric, 'samples': {}}
+            samples = target['samples']
+            for labelvalues, value in metric['samples']:
+                key = tuple(labelvalues)
+                current = samples.get(key)
+                if current is None:
+                    samples[key] = value
+                elif metric['kind'] == 'histogram':
+                    samples[key] = [
+                        [a + b for a, b in zip(current[0], value[0])],
+                        current[1] + value[1]]
+                else:
+                    samples[key] = current + value
+    return merged
+
+
+def _escape(value):
+    return (value.replace('\\', r'\\').replace('\n', r'\n')
+            .replace('"', r'\"'))
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def expose(merged):
+    """Return the merged metrics in the Prometheus text format.
+    """
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f'# HELP {name} {metric["help"]}')
+        lines.append(f'# TYPE {name} {metric["kind"]}')
+        names = metric['labelnames']
+        for key in sorted(metric['samples']):
+            value = metric['samples'][key]
+            if metric['kind'] != 'histogram':
+                lines.append(f'{name}{_labels(names, key)} {_number(value)}')
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(
+                    list(metric['buckets']) + [math.inf], counts):
+                cumulative += count
+                le = (('le', _number(bound)), )
+                lines.append(
+                    f'{name}_bucket{_labels(names, key, le)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(names, key)} {_number(total)}')
+            lines.append(
+                f'{name}_count{_labels(names, key)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsDir:
+    """A directory shared by the worker processes, each writing snapshots of
+    its metrics to a metrics-<pid>-<uuid>.json file in it (pids get reused).
+
+    The counters + histograms of exited workers still count, their gauges
+    don't: Their snapshots are folded into the ARCHIVE snapshot, so that the
+    totals never decrease.
+    """
+
+    ARCHIVE = 'archived.json'
+
+    def __init__(self, directory, registry, flush_interval=5):
+        self.directory = directory
+        self.registry = registry
+        self.flush_interval = flush_interval
+        self._flushed = None
+        self._process = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self):
+        # Unique per process, also for the workers forked after creation
+        pid = os.getpid()
+        if self._process is None or self._process[0] != pid:
+            self._process = (pid, os.path.join(
+                self.directory, f'metrics-{pid}-{uuid.uuid4().hex}.json'))
+            self._flushed = None
+        return self._process[1]
+
+    def flush(self, force=False):
+        """Write a snapshot of this process's metrics, at most every
+        flush_interval seconds unless forced.
+
+        Returns: The snapshot written, None if not written
+        """
+        path = self._path()
+        now = time.monotonic()
+        with self._lock:
+            if (not force and self._flushed is not None
+                    and now - self._flushed < self.flush_interval):
+                return None
+            self._flushed = now
+        snapshot = self.registry.snapshot()
+        _write_json(path, snapshot)
+        return snapshot
+
+    @contextlib.contextmanager
+    def _locked(self):
+        if fcntl is None:
+            # No folding without locking, the snapshots of exited workers
+            # just stay around
+            yield False
+            return
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield True
+
+    def snapshots(self):
+        """Return the current snapshots of all (also exited) workers.
+        """
+        own = self.flush(force=True)
+        own_path = self._path()
+        archive_path = os.path.join(self.directory, self.ARCHIVE)
+        with self._locked() as folding:
+            archive = _read_json(archive_path) or {
+                'pid': None, 'folded': [], 'metrics': {}}
+            folded = set(archive['folded'])
+            live = []
+            dead = {}
+            for path in glob.glob(
+                    os.path.join(self.directory, 'metrics-*.json')):
+                name = os.path.basename(path)
+                if path == own_path or name in folded:
+                    continue
+                snapshot = _read_json(path)
+                if snapshot is None:
+                    continue
+                if _pid_alive(snapshot['pid']):
+                    live.append(snapshot)
+                    continue
+                snapshot['metrics'] = {
+                    metric_name: metric
+                    for metric_name, metric in snapshot['metrics'].items()
+                    if metric['kind'] != 'gauge'}
+                if folding:
+                    dead[name] = snapshot
+                else:
+                    live.append(snapshot)
+            if dead:
+                archive = {
+                    'pid': None,
+                    # Skipped until removed, also if removing them fails
+                    'folded': sorted(folded | set(dead)),
+                    'metrics': _snapshot_metrics(
+                        merge([archive, *dead.values()])),
+                    }
+                _write_json(archive_path, archive)
+            if folding and archive['folded']:
+                remaining = []
+                for name in archive['folded']:
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        pass
+                    except OSError:
+                        remaining.append(name)
+                archive['folded'] = remaining
+                _write_json(archive_path, archive)
+        return [own, archive, *live]
+
+
+def _read_json(path):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, obj):
+    tmp_path = f'{path}.tmp'
+    try:
+        with open(tmp_path, 'w') as json_file:
+            json.dump(obj, json_file)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        logger.warning('Writing the metrics to %s failed: %s', path, exc)
+
+
+def _snapshot_metrics(merged):
+    # The reverse of merge(): The snapshot metrics of the merged metrics
+    return {
+        name: {**metric, 'samples': [
+            [list(key), value] for key, value in metric['samples'].items()]}
+        for name, metric in merged.items()}
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'datarest_http_requests_total', 'HTTP requests',
+    ['table', 'route', 'method', 'status'])
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'datarest_http_request_duration_seconds', 'HTTP request latency',
+    ['table', 'route'])
+HTTP_RESPONSE_SIZE = REGISTRY.histogram(
+    'datarest_http_response_size_bytes', 'HTTP response body size',
+    ['table', 'route'], buckets=SIZE_BUCKETS)
+ROWS_RETURNED = REGISTRY.histogram(
+    'datarest_rows_returned', 'Rows returned per get_all request',
+    ['table', 'route'], buckets=ROWS_BUCKETS)
+DB_STATEMENT_DURATION = REGISTRY.histogram(
+    'datarest_db_statement_duration_seconds', 'Database statement latency',
+    ['table', 'statement'])
+DB_POOL_CHECKOUT_DURATION = REGISTRY.histogram(
+    'datarest_db_pool_checkout_seconds',
+    'Database connection pool checkout wait')
+DB_POOL_SIZE = REGISTRY.gauge(
+    'datarest_db_pool_size', 'Database connection pool size')
+DB_POOL_CHECKED_OUT = REGISTRY.gauge(
+    'datarest_db_pool_checked_out', 'Database connections checked out')
+LDAP_AUTHENTICATION_DURATION = REGISTRY.histogram(
+    'datarest_ldap_authentication_duration_seconds',
+    'LDAP authentication latency, by outcome (success, invalid, error)',
+    ['outcome'])
+
+
+class TimedAuth:
+    """An authn backend wrapper recording the authentication latency and
+    outcome in LDAP_AUTHENTICATION_DURATION.
+    """
+
+    def __init__(self, backend, invalid_error):
+        self.backend = backend
+        self.invalid_error = invalid_error
+
+    def authenticate(self, username, password):
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            identity = self.backend.authenticate(username, password)
+            outcome = 'success'
+            return identity
+        except self.invalid_error:
+            outcome = 'invalid'
+            raise
+        finally:
+            LDAP_AUTHENTICATION_DURATION.observe(
+                time.perf_counter() - start, outcome=outcome)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+def _before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('datarest_metrics_start', []).append(
+        time.perf_counter())
+
+
+def _after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['datarest_metrics_start'].pop()
+    table, _ = _request_context.route_labels(
+        _request_context.current_scope.get())
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement else ''
+    DB_STATEMENT_DURATION.observe(
+        time.perf_counter() - start, table=table, statement=verb)
+
+
+def _collect_pool(engine_ref):
+    engine = engine_ref()
+    if engine is None:
+        return
+    pool = engine.pool
+    if hasattr(pool, 'size'):
+        DB_POOL_SIZE.set(pool.size())
+    if hasattr(pool, 'checkedout'):
+        DB_POOL_CHECKED_OUT.set(pool.checkedout())
+
+
+_instrumented_engines = weakref.WeakSet()
+
+
+def _time_pool_checkout(engine):
+    # The pool has no event before checkout, time its connect() instead
+    pool = engine.pool
+    connect = pool.connect
+
+    @functools.wraps(connect)
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_CHECKOUT_DURATION.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+
+
+def instrument_engine(engine):
+    """Record the statement latency, pool checkout wait and pool size of the
+    SQLAlchemy engine (once per engine).
+    """
+    if engine in _instrumented_engines:
+        return
+    _instrumented_engines.add(engine)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    _time_pool_checkout(engine)
+    # Engine.dispose() replaces the pool, e.g. in forked worker processes
+    event.listen(engine, 'engine_disposed', _time_pool_checkout)
+    REGISTRY.add_collector(
+        functools.partial(_collect_pool, weakref.ref(engine)))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the per-route HTTP metrics, and flushing
+    the metrics to the shared metrics_dir (a MetricsDir) if any.
+    """
+
+    def __init__(self, app, metrics_dir=None):
+        self.app = app
+        self.metrics_dir = metrics_dir
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+        size = 0
+        # The routes set the rows returned as request.state.rows
+        state = scope.setdefault('state', {})
+
+        async def send_measured(message):
+            nonlocal status, size
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_measured)
+        finally:
+            table, route = _request_context.route_labels(scope)
+            HTTP_REQUESTS.inc(
+                table=table, route=route, method=scope['method'],
+                status=status)
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start, table=table, route=route)
+            HTTP_RESPONSE_SIZE.observe(size, table=table, route=route)
+            rows = state.get('rows')
+            if rows is not None:
+                ROWS_RETURNED.observe(rows, table=table, route=route)
+            if self.metrics_dir is not None:
+                self.metrics_dir.flush()
+
+
+def metrics_endpoint(metrics_dir=None, registry=REGISTRY):
+    """Return the endpoint serving the metrics, of all workers sharing
+    metrics_dir if any.
+    """
+    def metrics():
+        if metrics_dir is not None:
+            snapshots = metrics_dir.snapshots()
+        else:
+            snapshots = [registry.snapshot()]
+        return Response(expose(merge(snapshots)), media_type=CONTENT_TYPE)
+    return metrics
@@ -17,7 +17,23 @@ ModelCombo = collections.namedtuple(
      'id_columns', 'expose_routes', 'query_params', 'paginate'])
 
 
-def create_model(model_name, model_def):
+def read_table_def(model_def, cache_dir=None):
+    """Read the table definition for a config model definition.
+
+    Parameters:
+       model_def: model definition from config file
+       cache_dir: optional directory to cache derived table definitions in
+
+    Returns: A table definition dict
+    """
+    if model_def.schema_spec == _cfgfile.SchemaSpecEnum.data_resource:
+        return _data_resource_models.read_table_def(
+            model_def.schema_, cache_dir=cache_dir)
+
+    raise ValueError('Unsupported data schema specification')
+
+
+def create_model(model_name, model_def, cache_dir=None, table_def=None):
     """Dynamically create pydantic model from config model definition.
 
     FastAPI uses pydantic models to describe endpoint input/output data.
@@ -25,43 +41,48 @@ def create_model(model_name, model_def):
     Parameters:
        model_name: resource name string
        model_def: model definition from config file
+       cache_dir: optional directory to cache derived table definitions in
+       table_def: optional table definition, as returned by read_table_def()
+           for model_def (read if not given)
 
     Returns: A ModelCombo object
     """
+    if table_def is None:
+        table_def = read_table_def(model_def, cache_dir=cache_dir)
+
     # Create resource + collection model class names using standard Python
     # naming conventions
     model_cls_name = model_name.title()
     collection_model_cls_name = f'{model_cls_name}CollectionModel'
 
-    if model_def.schema_spec == _cfgfile.SchemaSpecEnum.data_resource:
-        # TODO: Unify model creation code (parts are in _data_resource_models,
-        # others in _sqlmodel_ext)
-        id_columns, model = _data_resource_models.create_model(
-            model_cls_name, model_def)
-        collection_model = _sqlmodel_ext.create_model(
-            collection_model_cls_name, **{model_name: (List[model], ...)})
-        return ModelCombo(
-            resource_name=model_name,
-            resource_model=model,
-            resource_collection_model=collection_model,
-            dbtable=model_def.dbtable,
-            id_columns=id_columns,
-            expose_routes=model_def.expose_routes,
-            query_params=model_def.query_params,
-            paginate=model_def.paginate)
-
-    raise ValueError('Unsupported data schema specification')
+    # TODO: Unify model creation code (parts are in _data_resource_models,
+    # others in _sqlmodel_ext)
+    id_columns, model = _data_resource_models.create_model_from_table_def(
+        model_cls_name, table_def)
+    collection_model = _sqlmodel_ext.create_model(
+        collection_model_cls_name, **{model_name: (List[model], ...)})
+    return ModelCombo(
+        resource_name=model_name,
+        resource_model=model,
+        resource_collection_model=collection_model,
+        dbtable=model_def.dbtable,
+        id_columns=id_columns,
+        expose_routes=model_def.expose_routes,
+        query_params=model_def.query_params,
+        paginate=model_def.paginate)
 
 
-def create_models(datatables: _cfgfile.Datatables):
+def create_models(datatables: _cfgfile.Datatables, cache_dir=None):
     """Loop over config data resources to create pydantic models.
 
     Parameters:
         datatables: Datatables model
+        cache_dir: optional directory to cache derived table definitions in
 
     Returns: (model_name, model)-dictionary
     """
     models = {}
     for model_name, model_def in datatables.items():
-        models[model_name] = create_model(model_name, model_def)
+        models[model_name] = create_model(
+            model_name, model_def, cache_dir=cache_dir)
     return models
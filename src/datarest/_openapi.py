@@ -0,0 +1,321 @@
+# Precomputed OpenAPI documents: Generate the app's OpenAPI document once (at
+# app creation or in the background after startup), cache it gzip-compressed
+# next to app.yaml and serve it with ETag support, optionally split by tag.
+
+import asyncio
+import copy
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from fastapi import HTTPException, Request, Response
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+from starlette.concurrency import run_in_threadpool
+
+from . import _compression
+from .version import __version__
+
+
+logger = logging.getLogger('uvicorn.error')
+
+# {encoding: level} to precompress the documents with
+_max_levels = {'gzip': 9, 'br': 11, 'zstd': 19}
+
+# Bump to invalidate cached OpenAPI documents on format changes.
+OPENAPI_CACHE_VERSION = 1
+
+
+def openapi_cache_path(cfg_path):
+    """Return the path of the cached OpenAPI document for the cfg_path config
+    file.
+    """
+    root, _ = os.path.splitext(cfg_path)
+    return f'{root}.openapi.json.gz'
+
+
+def openapi_cache_key(config, cfg_path):
+    """Return a key identifying the OpenAPI document generated from the
+    cfg_path config file and its datatables' table definitions (which record
+    the schema files they're read from), None if it can't be cached.
+
+    Datatable schemas that aren't local files (e.g. URLs) can change
+    unnoticed, such documents aren't cached.
+    """
+    from . import _models
+    key = hashlib.sha256(
+        f'{OPENAPI_CACHE_VERSION}:{__version__}:'.encode())
+    with open(cfg_path, 'rb') as cfg_file:
+        key.update(cfg_file.read())
+    for model_name, model_def in config.datarest.datatables.items():
+        if not os.path.isfile(model_def.schema_):
+            return None
+        table_def = _models.read_table_def(
+            model_def, cache_dir=config.datarest.model_cache)
+        key.update(json.dumps(
+            [model_name, table_def], sort_keys=True, default=str).encode())
+    return key.hexdigest()
+
+
+def strip_examples(doc):
+    """Remove the field examples from the doc component schemas, in place.
+    """
+    schemas = doc.get('components', {}).get('schemas', {})
+    for schema in schemas.values():
+        schema.pop('example', None)
+        for prop in schema.get('properties', {}).values():
+            prop.pop('example', None)
+    return doc
+
+
+def _refs(obj):
+    """Yield the component schema names referenced in obj.
+    """
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key == '$ref' and isinstance(value, str):
+                yield value.rsplit('/', 1)[-1]
+            else:
+                yield from _refs(value)
+    elif isinstance(obj, list):
+        for value in obj:
+            yield from _refs(value)
+
+
+def tags(doc):
+    """Return the list of operation tags in doc, in order of appearance.
+    """
+    tag_names = {}
+    for path_item in doc.get('paths', {}).values():
+        for operation in path_item.values():
+            for tag in operation.get('tags', []):
+                tag_names.setdefault(tag)
+    return list(tag_names)
+
+
+def split_by_tag(doc, tag):
+    """Return a copy of doc reduced to the operations tagged with tag and the
+    component schemas they use.
+    """
+    paths = {}
+    for path, path_item in doc.get('paths', {}).items():
+        operations = {
+            method: operation for method, operation in path_item.items()
+            if tag in operation.get('tags', [])}
+        if operations:
+            paths[path] = operations
+
+    schemas = doc.get('components', {}).get('schemas', {})
+    used = set()
+    pending = list(_refs(paths))
+    while pending:
+        name = pending.pop()
+        if name not in used and name in schemas:
+            used.add(name)
+            pending.extend(_refs(schemas[name]))
+
+    tag_doc = {
+        key: copy.deepcopy(value) for key, value in doc.items()
+        if key not in ('paths', 'components')}
+    tag_doc['paths'] = copy.deepcopy(paths)
+    components = {
+        key: copy.deepcopy(value)
+        for key, value in doc.get('components', {}).items()
+        if key != 'schemas'}
+    components['schemas'] = {
+        name: copy.deepcopy(schemas[name]) for name in sorted(used)}
+    tag_doc['components'] = components
+    return tag_doc
+
+
+class EncodedDoc:
+    """An OpenAPI document, JSON-encoded + precompressed, with its ETag.
+
+    The gzip variant is compressed right away, the brotli/zstd variants (if
+    their packages are installed) on their first request.
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self.encodings = _compression.available_encodings()
+        self.compressed = {'gzip': gzip.compress(body)}
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(json.dumps(doc, separators=(',', ':')).encode())
+
+    def _compressed(self, encoding):
+        compressed = self.compressed.get(encoding)
+        if compressed is None:
+            # Compressed once per document, at the best compression level
+            compressed = _compression.compress(
+                self.body, encoding, level=_max_levels.get(encoding))
+            self.compressed[encoding] = compressed
+        return compressed
+
+    def response(self, request):
+        """Return the Response for request, honoring If-None-Match and
+        Accept-Encoding.
+        """
+        headers = {
+            'ETag': self.etag,
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+            }
+        if_none_match = request.headers.get('if-none-match', '')
+        if self.etag in (etag.strip() for etag in if_none_match.split(',')):
+            return Response(status_code=304, headers=headers)
+        encoding = _compression.negotiate(
+            request.headers.get('accept-encoding'), self.encodings)
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+            return Response(
+                self._compressed(encoding), media_type='application/json',
+                headers=headers)
+        return Response(
+            self.body, media_type='application/json', headers=headers)
+
+
+class OpenapiDocs:
+    """The precomputed OpenAPI document(s) of an app.
+    """
+
+    def __init__(self, app, openapi_config):
+        self.app = app
+        self.openapi_config = openapi_config
+        self.doc = None
+        self.tag_docs = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Drop the documents, e.g. after reloading the app configuration.
+        """
+        with self._lock:
+            self.doc = None
+            self.tag_docs = {}
+
+    def _generate(self):
+        app = self.app
+        app.openapi_schema = None
+        doc = app.openapi()
+        if not self.openapi_config.examples:
+            doc = strip_examples(copy.deepcopy(doc))
+        return doc
+
+    def _read_cache(self, cache_path, key):
+        try:
+            with open(cache_path, 'rb') as cache_file:
+                gzipped = cache_file.read()
+            cached = json.loads(gzip.decompress(gzipped))
+        except (OSError, ValueError, EOFError):
+            return None
+        if cached.get('key') != key:
+            return None
+        return cached['openapi']
+
+    def _write_cache(self, cache_path, key, doc):
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as cache_file:
+                cache_file.write(gzip.compress(
+                    json.dumps({'key': key, 'openapi': doc}).encode()))
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            logger.warning('Could not cache OpenAPI document in %s',
+                           cache_path)
+
+    def build(self):
+        """Build the OpenAPI document(s), reading from or writing to the cache
+        file.
+
+        Returns: The OpenAPI document EncodedDoc
+        """
+        with self._lock:
+            if self.doc is not None:
+                return self.doc
+            state = self.app.state
+            doc = None
+            key = None
+            if self.openapi_config.cache:
+                cache_path = openapi_cache_path(state.cfg_path)
+                key = openapi_cache_key(state.config, state.cfg_path)
+                if key is not None:
+                    doc = self._read_cache(cache_path, key)
+            if doc is None:
+                doc = self._generate()
+                if key is not None:
+                    self._write_cache(cache_path, key, doc)
+            if self.openapi_config.split_tags:
+                self.tag_docs = {
+                    tag: EncodedDoc.from_doc(split_by_tag(doc, tag))
+                    for tag in tags(doc)}
+            self.doc = EncodedDoc.from_doc(doc)
+            return self.doc
+
+    async def get(self):
+        """Return the OpenAPI document EncodedDoc, building it if needed.
+        """
+        if self.doc is not None:
+            return self.doc
+        return await run_in_threadpool(self.build)
+
+
+def setup_openapi(app, openapi_config, build=True):
+    """Serve precomputed OpenAPI documents + docs for app.
+
+    app must have been created without its own openapi_url and have all its
+    routes added. With build False the documents are only built on their
+    first request (e.g. for lazy datatables, which they'd all build).
+    """
+    docs = OpenapiDocs(app, openapi_config)
+    app.state.openapi_docs = docs
+    openapi_url = '/openapi.json'
+
+    async def openapi(request: Request):
+        return (await docs.get()).response(request)
+
+    async def tag_openapi(request: Request, tag: str):
+        await docs.get()
+        tag_doc = docs.tag_docs.get(tag)
+        if tag_doc is None:
+            raise HTTPException(status_code=404)
+        return tag_doc.response(request)
+
+    async def swagger_ui(request: Request):
+        root_path = request.scope.get('root_path', '').rstrip('/')
+        swagger_ui_parameters = None
+        if openapi_config.split_tags:
+            # Let the docs UI load one tag's document at a time
+            await docs.get()
+            swagger_ui_parameters = {'urls': [
+                {'url': f'{root_path}/openapi/tags/{tag}.json', 'name': tag}
+                for tag in docs.tag_docs]}
+        return get_swagger_ui_html(
+            openapi_url=root_path + openapi_url,
+            title=f'{app.title} - Swagger UI',
+            swagger_ui_parameters=swagger_ui_parameters)
+
+    async def redoc(request: Request):
+        root_path = request.scope.get('root_path', '').rstrip('/')
+        return get_redoc_html(
+            openapi_url=root_path + openapi_url,
+            title=f'{app.title} - ReDoc')
+
+    app.add_api_route(openapi_url, openapi, include_in_schema=False)
+    app.add_api_route(
+        '/openapi/tags/{tag}.json', tag_openapi, include_in_schema=False)
+    app.add_api_route('/docs', swagger_ui, include_in_schema=False)
+    app.add_api_route('/redoc', redoc, include_in_schema=False)
+
+    if build and openapi_config.background:
+        async def build_in_background():
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(None, docs.build)
+
+        app.add_event_handler('startup', build_in_background)
+    elif build:
+        docs.build()
+    return docs
@@ -0,0 +1,182 @@
+# A preforking multi-worker server.
+#
+# Builds the app (config, models, routers) once in the parent process and then
+# forks the uvicorn worker processes, which share the parent's memory pages
+# copy-on-write instead of each importing and building the app themselves.
+
+import gc
+import logging
+import os
+import signal
+import time
+
+
+# Log along with uvicorn's server messages.
+logger = logging.getLogger('uvicorn.error')
+
+# Delay (seconds) of restarting a dead worker, doubled for each consecutive
+# fast failure up to MAX_RESTART_DELAY
+RESTART_DELAY = 0.5
+MAX_RESTART_DELAY = 30.0
+# Workers dying within MIN_UPTIME seconds of their start failed fast, after
+# MAX_FAST_FAILURES consecutive fast failures serving is given up
+MIN_UPTIME = 10.0
+MAX_FAST_FAILURES = 5
+
+
+class _Restarts:
+    """Keep track of the worker starts to tell the restart delay for a dead
+    worker, or that it's not worth restarting it.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.started = {}
+        self.fast_failures = 0
+
+    def start(self, pid):
+        self.started[pid] = self.clock()
+
+    def delay(self, pid):
+        """Return the delay before restarting the dead pid worker, None to
+        give up.
+        """
+        uptime = self.clock() - self.started.pop(pid, self.clock())
+        if uptime >= MIN_UPTIME:
+            self.fast_failures = 0
+            return 0.0
+        self.fast_failures += 1
+        if self.fast_failures >= MAX_FAST_FAILURES:
+            return None
+        return min(
+            RESTART_DELAY * 2 ** (self.fast_failures - 1), MAX_RESTART_DELAY)
+
+
+def _run_worker(config, sock):
+    """Run a uvicorn server for the (already built) app in a forked worker.
+    """
+    import uvicorn
+    from . import _database
+
+    # Never share pooled database connections with the parent or sibling
+    # workers: Start with a fresh pool, leaving the inherited connections
+    # alone (see "Using Connection Pools with Multiprocessing or os.fork()" in
+    # the SQLAlchemy docs).
+    _database.engine.dispose(close=False)
+
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def _spawn_worker(config, sock):
+    """Fork a worker process, return its pid.
+    """
+    pid = os.fork()
+    if pid == 0:
+        # Worker process: Restore default signal handling, uvicorn installs
+        # its own handlers for graceful shutdown.
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            _run_worker(config, sock)
+        except BaseException:
+            logger.exception('Worker %s failed', os.getpid())
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    logger.info('Started worker process [%s]', pid)
+    return pid
+
+
+def serve(host='127.0.0.1', port=8000, workers=1, log_level='info'):
+    """Build the datarest app once and serve it from workers forked worker
+    processes.
+
+    Workers that die unexpectedly are replaced, with increasing delays if
+    they keep dying right after their start, until serving is given up
+    (raising a RuntimeError). SIGINT or SIGTERM shut down all workers
+    gracefully, SIGHUP is passed on to the workers (to reload the app
+    configuration, see the fastapi.reload config).
+    """
+    if not hasattr(os, 'fork'):
+        raise RuntimeError('Preforking is not supported on this platform')
+
+    import uvicorn
+
+    # Build the app, models + routers in the parent.
+    from ._app import app
+
+    config = uvicorn.Config(
+        app, host=host, port=port, log_level=log_level, workers=workers)
+    sock = config.bind_socket()
+
+    # Move everything allocated so far into the permanent generation, so that
+    # garbage collection in the workers doesn't touch (and thus copy) the
+    # shared pages.
+    gc.collect()
+    gc.freeze()
+
+    pids = set()
+    restarts = _Restarts()
+    stopping = False
+    failed = False
+
+    def stop(signum=None, frame=None):
+        nonlocal stopping
+        stopping = True
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def spawn():
+        pid = _spawn_worker(config, sock)
+        restarts.start(pid)
+        pids.add(pid)
+
+    def forward(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, forward)
+
+    for _ in range(workers):
+        spawn()
+
+    while pids:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        pids.discard(pid)
+        if stopping:
+            continue
+        delay = restarts.delay(pid)
+        if delay is None:
+            logger.error(
+                'Worker process [%s] died (status %s), %s workers failed '
+                'right after their start in a row, giving up', pid, status,
+                MAX_FAST_FAILURES)
+            failed = True
+            stop()
+            continue
+        logger.warning(
+            'Worker process [%s] died (status %s), restarting in %.1fs', pid,
+            status, delay)
+        time.sleep(delay)
+        if not stopping:
+            spawn()
+
+    sock.close()
+    if failed:
+        raise RuntimeError('Worker processes keep failing')
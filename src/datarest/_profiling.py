@@ -0,0 +1,195 @@
+# Startup profiling: Time the phases of bringing up the datarest app, module
+# import times and peak memory usage.
+
+import collections
+import contextlib
+import dataclasses
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+
+# The modules imported for creating the app (see _app.py), without creating
+# it.
+app_import_modules = [
+    'datarest._app_config',
+    'datarest._app_factory',
+    'datarest._database',
+    ]
+
+
+@dataclasses.dataclass
+class PhaseTiming:
+    name: str
+    table: Optional[str]
+    seconds: float
+
+
+@dataclasses.dataclass
+class ImportTiming:
+    module: str
+    self_seconds: float
+    cumulative_seconds: float
+
+
+@dataclasses.dataclass
+class StartupProfile:
+    """Startup phase timings, module import timings and peak memory usage.
+    """
+    phases: List[PhaseTiming] = dataclasses.field(default_factory=list)
+    imports: List[ImportTiming] = dataclasses.field(default_factory=list)
+    # Peak resident set size in bytes (None if unknown)
+    peak_rss: Optional[int] = None
+
+    @contextlib.contextmanager
+    def phase(self, name, table=None):
+        """Context manager to time a startup phase (for a table).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append(
+                PhaseTiming(name, table, time.perf_counter() - start))
+
+    def phase_totals(self):
+        """Return {phase name: total seconds} dict, in phase order.
+        """
+        totals = collections.OrderedDict()
+        for timing in self.phases:
+            totals[timing.name] = totals.get(timing.name, 0) + timing.seconds
+        return totals
+
+    def table_totals(self):
+        """Return {table: total seconds} dict, slowest tables first.
+        """
+        totals = collections.Counter()
+        for timing in self.phases:
+            if timing.table is not None:
+                totals[timing.table] += timing.seconds
+        return dict(totals.most_common())
+
+    def report(self, top=10):
+        """Return a printable report string, listing the top slowest tables
+        and module imports.
+        """
+        lines = ['Startup phases:']
+        phase_totals = self.phase_totals()
+        for name, seconds in phase_totals.items():
+            lines.append(f'  {name:<24} {seconds * 1000:10.1f} ms')
+        lines.append(
+            f'  {"total":<24} {sum(phase_totals.values()) * 1000:10.1f} ms')
+
+        table_totals = self.table_totals()
+        if table_totals:
+            lines.append(f'Slowest tables (of {len(table_totals)}):')
+            table_phases = collections.defaultdict(dict)
+            for timing in self.phases:
+                if timing.table is not None:
+                    table_phases[timing.table][timing.name] = timing.seconds
+            for table, seconds in list(table_totals.items())[:top]:
+                details = ', '.join(
+                    f'{name} {phase_seconds * 1000:.1f}'
+                    for name, phase_seconds in table_phases[table].items())
+                lines.append(
+                    f'  {table:<24} {seconds * 1000:10.1f} ms ({details})')
+
+        if self.imports:
+            lines.append('Slowest imports (cumulative):')
+            imports = sorted(
+                self.imports, key=lambda timing: timing.cumulative_seconds,
+                reverse=True)
+            for timing in imports[:top]:
+                lines.append(
+                    f'  {timing.module:<40} '
+                    f'{timing.cumulative_seconds * 1000:10.1f} ms '
+                    f'(self {timing.self_seconds * 1000:.1f} ms)')
+
+        if self.peak_rss is not None:
+            lines.append(f'Peak memory (RSS): {self.peak_rss / 2**20:.1f} MiB')
+        return '\n'.join(lines)
+
+
+# python -X importtime output lines look like
+# import time:       345 |        789 | package.module
+_importtime_re = re.compile(
+    r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(\s*)(\S+)\s*$')
+
+
+def import_times(modules=app_import_modules, cwd=None):
+    """Return a list of ImportTiming for importing modules in a fresh Python
+    interpreter.
+    """
+    statement = '; '.join(f'import {module}' for module in modules)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=cwd, capture_output=True, text=True, check=True)
+    timings = []
+    for line in completed.stderr.splitlines():
+        match = _importtime_re.match(line)
+        if match:
+            self_us, cumulative_us, _, module = match.groups()
+            timings.append(ImportTiming(
+                module, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return timings
+
+
+def peak_rss():
+    """Return the peak resident set size of the current process in bytes, or
+    None if unavailable on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def profile_startup(cfg_path='app.yaml', imports=True):
+    """Create the datarest app from the cfg_path config file, timing each
+    phase.
+
+    The app modules read the config file on import (see _app_config), so
+    they mustn't have been imported for another config file before.
+
+    Returns: StartupProfile
+    """
+    os.environ['DATAREST_APP_CONFIG'] = cfg_path
+    profile = StartupProfile()
+    if imports:
+        profile.imports = import_times()
+
+    with profile.phase('imports'):
+        from . import _app_config
+        from . import _cfgfile
+        from . import _app_factory
+        from . import _database
+    if (os.path.abspath(_app_config.cfg_path)
+            != os.path.abspath(cfg_path)):
+        raise RuntimeError(
+            f'The app modules were imported for {_app_config.cfg_path} '
+            f'already')
+
+    with profile.phase('config parse'):
+        config = _cfgfile.read_app_config(cfg_path)
+
+    app = _app_factory.create_app(
+        config, phase=profile.phase, cfg_path=cfg_path)
+
+    fastapi_config = config.datarest.fastapi
+    # The precomputed OpenAPI document (fastapi.openapi) is timed by
+    # create_app(), lazy datatables would all be built for the document
+    if fastapi_config.openapi is None and fastapi_config.lazy is None:
+        with profile.phase('openapi generation'):
+            app.openapi()
+
+    with profile.phase('engine connect'):
+        _database.engine.connect().close()
+
+    profile.peak_rss = peak_rss()
+    return profile
@@ -0,0 +1,133 @@
+# Per-client request rate limits and concurrency quotas.
+#
+# Clients are identified by their authenticated username or, without authn,
+# by their IP address. The limiter state is kept in-process, i.e. the limits
+# apply per worker process.
+
+import collections
+import math
+import threading
+import time
+
+from fastapi import Depends, HTTPException, Request, status
+
+
+class TokenBucket:
+    """A token bucket of burst tokens, refilled at rate tokens per second.
+    """
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now):
+        """Take a token.
+
+        Returns: 0 on success, otherwise the seconds until a token is
+        available
+        """
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """The token buckets and concurrent request counts of the clients, by
+    (scope, client).
+
+    A scope is e.g. the whole app or a single datatable, each with its own
+    _cfgfile.RateLimit limits. At most max_clients buckets are kept, least
+    recently used first dropped (a dropped bucket starts full again).
+    """
+
+    def __init__(self, max_clients=10000, clock=time.monotonic):
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = collections.OrderedDict()
+        self._concurrent = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _take(self, key, limits, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            burst = limits.burst or max(1, math.ceil(limits.rate))
+            bucket = TokenBucket(limits.rate, burst, now)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(now)
+
+    def acquire(self, scope, client, limits):
+        """Count a request of client in scope against the limits.
+
+        Raises: HTTPException 429 Too Many Requests, with a Retry-After header
+        if a limit is exceeded
+
+        Returns: A release() callable to call once the request is done
+        """
+        key = (scope, client)
+        with self._lock:
+            if limits.rate:
+                retry_after = self._take(key, limits, self.clock())
+                if retry_after:
+                    raise HTTPException(
+                        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                        detail='Request rate limit exceeded',
+                        headers={
+                            'Retry-After': str(math.ceil(retry_after))},
+                        )
+            if limits.max_concurrent:
+                if self._concurrent[key] >= limits.max_concurrent:
+                    raise HTTPException(
+                        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                        detail='Concurrent requests limit exceeded',
+                        headers={'Retry-After': '1'},
+                        )
+                self._concurrent[key] += 1
+
+        def release():
+            if limits.max_concurrent:
+                with self._lock:
+                    self._concurrent[key] -= 1
+                    if self._concurrent[key] <= 0:
+                        del self._concurrent[key]
+        return release
+
+    def dependency(self, scope, limits, authenticate=None):
+        """Return a FastAPI dependency that applies the limits of scope to
+        each request.
+
+        Clients are identified by the username returned by the authenticate
+        authn dependency (a cached dependency, i.e. the request is
+        authenticated once only) or by their IP address.
+        """
+        def acquire(request, username=None):
+            client = username
+            if client is None:
+                client = request.client.host if request.client else ''
+            return self.acquire(scope, client, limits)
+
+        if authenticate is None:
+            async def rate_limit(request: Request):
+                release = acquire(request)
+                try:
+                    yield
+                finally:
+                    release()
+        else:
+            async def rate_limit(
+                    request: Request, username: str = Depends(authenticate)):
+                release = acquire(request, username)
+                try:
+                    yield
+                finally:
+                    release()
+        return rate_limit
@@ -0,0 +1,62 @@
+# The request being handled, for instrumentation outside of the request
+# handling code (e.g. SQLAlchemy engine events), and the datatable + route
+# labels of requests.
+
+import contextvars
+
+
+# The ASGI scope of the current request, None outside of requests
+current_scope = contextvars.ContextVar('current_scope', default=None)
+
+# {endpoint: route path} of the routes not tagged by tag_routes()
+_route_paths = {}
+
+
+def tag_routes(model_name, routes):
+    """Tag the endpoints of the datatable model_name's routes with their
+    datatable and route path, see route_labels().
+    """
+    for route in routes:
+        route.endpoint.datarest_table = model_name
+        route.endpoint.datarest_route = route.path
+
+
+def route_labels(scope):
+    """Return (datatable, route path) of the request scope, empty strings if
+    unknown, e.g. for not found or non-datatable routes.
+    """
+    if scope is None:
+        return '', ''
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+        return '', ''
+    table = getattr(endpoint, 'datarest_table', '')
+    path = getattr(endpoint, 'datarest_route', None)
+    if path is None:
+        path = _route_paths.get(endpoint)
+        if path is None:
+            app = scope.get('app')
+            routes = app.router.routes if app is not None else []
+            path = next(
+                (route.path for route in routes
+                 if getattr(route, 'endpoint', None) == endpoint), '')
+            _route_paths[endpoint] = path
+    return table, path
+
+
+class RequestContextMiddleware:
+    """ASGI middleware setting current_scope for each request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
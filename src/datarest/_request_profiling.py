@@ -0,0 +1,340 @@
+# On-demand per-request profiling: Requests with an X-Datarest-Profile: 1
+# header by an admin user are profiled (cProfile + phase timings), their
+# report is kept for download from an admin endpoint.
+#
+# Profiling starts once the authorization() dependency has authenticated an
+# admin user: The event loop thread is profiled from then on until the
+# response is sent, i.e. including other concurrently handled requests' async
+# code, the sync endpoints in the threadpool while they run (see profiled()).
+
+import asyncio
+import collections
+import contextvars
+import cProfile
+import functools
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import event
+from starlette.datastructures import Headers, MutableHeaders
+
+
+HEADER = 'X-Datarest-Profile'
+ID_HEADER = 'X-Datarest-Profile-Id'
+
+# The RequestProfile of the current request, None if not profiled
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+# (file name ending, function name) of the JSON encoding functions, run in
+# the event loop thread
+_encoding_functions = [
+    (os.path.join('fastapi', 'encoders.py'), 'jsonable_encoder'),
+    (os.path.join('starlette', 'responses.py'), 'render'),
+    ]
+
+_profile_id_re = re.compile(r'^[0-9a-f]{32}$')
+
+# Only one request at a time is profiled: A thread can run a single profiler
+# only
+_profiling = threading.Lock()
+
+
+class RequestProfile:
+    """The profilers + timestamps of a profiled request.
+    """
+
+    def __init__(self, method, path, clock=time.perf_counter):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.clock = clock
+        self.start = clock()
+        self.endpoint_start = None
+        self.endpoint_end = None
+        self.response_start = None
+        self.end = None
+        self.status = None
+        self.sql_seconds = 0.0
+        self.statements = 0
+        # Set by start_profiling() for admin users
+        self.authorized = False
+        self._loop_profiler = None
+        self._profilers = []
+        self._lock = threading.Lock()
+
+    def profiler(self):
+        """Return a new cProfile.Profile, for a thread of the request.
+        """
+        profiler = cProfile.Profile()
+        with self._lock:
+            self._profilers.append(profiler)
+        return profiler
+
+    def start_profiling(self):
+        """Start profiling the (event loop) thread for the rest of the
+        request, unless another request is profiled already. Return whether
+        the request is profiled.
+        """
+        if self.authorized:
+            return True
+        if not _profiling.acquire(blocking=False):
+            return False
+        self.authorized = True
+        self._loop_profiler = self.profiler()
+        self._loop_profiler.enable()
+        return True
+
+    def stop_profiling(self):
+        """Stop a profiling started by start_profiling().
+        """
+        if self._loop_profiler is not None:
+            self._loop_profiler.disable()
+            self._loop_profiler = None
+            _profiling.release()
+
+    def add_statement(self, seconds):
+        with self._lock:
+            self.sql_seconds += seconds
+            self.statements += 1
+
+    def stats(self, stream=None):
+        """Return the pstats.Stats of all the request's profilers.
+        """
+        stats = pstats.Stats(stream=stream)
+        for profiler in self._profilers:
+            profiler.create_stats()
+            if profiler.stats:
+                stats.add(profiler)
+        return stats
+
+    def _encoding_seconds(self, stats):
+        seconds = 0.0
+        for (filename, _, name), (_, _, _, cumulative, _) in (
+                stats.stats.items()):
+            if any(filename.endswith(ending) and name == function
+                   for ending, function in _encoding_functions):
+                seconds += cumulative
+        return seconds
+
+    def phases(self, stats):
+        """Return {phase: seconds or None (if not reached)}.
+
+        The ORM hydration phase is the endpoint run time besides the SQL
+        statements, the response validation phase the time between endpoint
+        return and response start besides the JSON encoding.
+        """
+        def span(start, end):
+            if start is None or end is None:
+                return None
+            return max(0.0, end - start)
+
+        endpoint = span(self.endpoint_start, self.endpoint_end)
+        serialization = span(self.endpoint_end, self.response_start)
+        encoding = self._encoding_seconds(stats)
+        return collections.OrderedDict([
+            ('dependencies', span(self.start, self.endpoint_start)),
+            ('sql execution', self.sql_seconds),
+            ('orm hydration',
+             None if endpoint is None
+             else max(0.0, endpoint - self.sql_seconds)),
+            ('response validation',
+             None if serialization is None
+             else max(0.0, serialization - encoding)),
+            ('json encoding', encoding),
+            ('sending', span(self.response_start, self.end)),
+            ])
+
+    def report(self, top=30):
+        """Return a printable report string: The phase timings and the top
+        functions by cumulative time.
+        """
+        stream = io.StringIO()
+        stats = self.stats(stream=stream)
+        lines = [
+            f'Profile {self.id}: {self.method} {self.path} -> {self.status}',
+            'Phases:']
+        for name, seconds in self.phases(stats).items():
+            timing = '       n/a' if seconds is None else (
+                f'{seconds * 1000:10.1f} ms')
+            lines.append(f'  {name:<24} {timing}')
+        total = (self.end or self.clock()) - self.start
+        lines.append(f'  {"total":<24} {total * 1000:10.1f} ms')
+        lines.append(f'SQL statements: {self.statements}')
+        stats.sort_stats('cumulative').print_stats(top)
+        lines.append(stream.getvalue())
+        return '\n'.join(lines)
+
+
+def profiled(endpoint):
+    """Decorate a sync endpoint to profile it in its (threadpool) thread
+    for profiled requests.
+    """
+    if asyncio.iscoroutinefunction(endpoint):
+        # Run in the (profiled) event loop thread
+        return endpoint
+
+    @functools.wraps(endpoint)
+    def profiled_endpoint(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None or not profile.authorized:
+            return endpoint(*args, **kwargs)
+        profile.endpoint_start = profile.clock()
+        profiler = profile.profiler()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: The event loop thread's profiler profiles all
+            # threads already
+            profiler = None
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            profile.endpoint_end = profile.clock()
+    return profiled_endpoint
+
+
+def authorization(admins, authenticate):
+    """Return a dependency starting the profiling of the current request (if
+    it asks for it) if the authenticate authn dependency returns an admin
+    user.
+    """
+    async def authorize_profile(username: str = Depends(authenticate)):
+        profile = current_profile.get()
+        if profile is not None and username in admins:
+            profile.start_profiling()
+    return authorize_profile
+
+
+def admin_check(admins, authenticate):
+    """Return a dependency that rejects non-admin users.
+    """
+    async def check_admin(username: str = Depends(authenticate)):
+        if username not in admins:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail='Admin users only')
+    return check_admin
+
+
+def _before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is not None and profile.authorized:
+        conn.info.setdefault('datarest_profile_start', []).append(
+            profile.clock())
+
+
+def _after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    starts = conn.info.get('datarest_profile_start')
+    if profile is not None and starts:
+        profile.add_statement(profile.clock() - starts.pop())
+
+
+def instrument_engine(engine):
+    """Time the SQL statements of profiled requests on the SQLAlchemy
+    engine.
+    """
+    if not event.contains(
+            engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class ProfileStore:
+    """The reports of the last keep profiled requests, in memory (per worker
+    process) or in a directory (e.g. shared by the workers).
+    """
+
+    def __init__(self, keep=20, directory=None):
+        self.keep = keep
+        self.directory = directory
+        self._reports = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, profile_id):
+        return os.path.join(self.directory, f'{profile_id}.txt')
+
+    def add(self, profile_id, report):
+        if self.directory is None:
+            with self._lock:
+                self._reports[profile_id] = report
+                while len(self._reports) > self.keep:
+                    self._reports.popitem(last=False)
+            return
+        with open(self._path(profile_id), 'w') as report_file:
+            report_file.write(report)
+        paths = sorted(
+            (os.path.join(self.directory, name)
+             for name in os.listdir(self.directory)
+             if _profile_id_re.match(name[:-len('.txt')])),
+            key=os.path.getmtime)
+        for path in paths[:-self.keep]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, profile_id):
+        """Return the report of profile_id, None if unknown.
+        """
+        if not _profile_id_re.match(profile_id):
+            return None
+        if self.directory is None:
+            with self._lock:
+                return self._reports.get(profile_id)
+        try:
+            with open(self._path(profile_id)) as report_file:
+                return report_file.read()
+        except OSError:
+            return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware tracking the requests with a HEADER: 1 header, these
+    are profiled once authorized (see authorization()), their reports kept in
+    store and their id returned in the ID_HEADER response header.
+    """
+
+    def __init__(self, app, store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http'
+                or Headers(scope=scope).get(HEADER) != '1'):
+            await self.app(scope, receive, send)
+            return
+        query = scope.get('query_string', b'').decode('latin-1')
+        profile = RequestProfile(
+            scope['method'], scope['path'] + (f'?{query}' if query else ''))
+        token = current_profile.set(profile)
+
+        async def send_profiled(message):
+            if message['type'] == 'http.response.start':
+                profile.response_start = profile.clock()
+                profile.status = message['status']
+                if profile.authorized:
+                    headers = MutableHeaders(scope=message)
+                    headers[ID_HEADER] = profile.id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            profile.stop_profiling()
+            profile.end = profile.clock()
+            current_profile.reset(token)
+        if profile.authorized:
+            self.store.add(profile.id, profile.report())
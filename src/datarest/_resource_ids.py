@@ -1,7 +1,9 @@
 # support for different resource IDs
 
 import enum
-from base64 import b64encode
+import os
+import time
+from base64 import b64decode, b64encode
 from hashlib import md5, sha256
 from uuid import uuid4
 
@@ -18,12 +20,20 @@ class IdEnum(str, enum.Enum):
     biz_hash_sha256: Add sha256-hashed concatenated primary key fields as single
         field ID
     uuid4_base64: Add a URL-safe base64 encoded UUID v4 id
+    ulid: Add a time-ordered ULID, Crockford base32 encoded
+    uuid7_base64: Add a time-ordered UUID v7, encoded with a sort
+        order-preserving URL-safe base64 alphabet
+
+    The time-ordered ids sort by creation time (in ms) so inserts go to the
+    end of the primary key index instead of scattering all over it.
     """
     biz_key = 'biz_key'
     biz_key_composite = 'biz_key_composite'
     biz_hash_md5 = 'biz_hash_md5'
     biz_hash_sha256 = 'biz_hash_sha256'
     uuid4_base64 = 'uuid4_base64'
+    ulid = 'ulid'
+    uuid7_base64 = 'uuid7_base64'
     # TODO:
     # uuid4_base58 = 'uuid4_base58'  # uuid4 base58 encoded
     # (see e.g. https://www.skitoy.com/p/base58-unique-ids/638/)
@@ -38,6 +48,24 @@ class IdEnum(str, enum.Enum):
         return self.value
 
 
+@enum.unique
+class DuplicateIdEnum(str, enum.Enum):
+    """Enumeration of policies for handling duplicate resource IDs.
+
+    fail: Raise a DuplicateIdError
+    skip: Keep the first row for an ID, skip the subsequent duplicates
+    last_wins: Keep the last row for an ID, skip the previous duplicates
+    """
+    fail = 'fail'
+    skip = 'skip'
+    last_wins = 'last_wins'
+
+    def __str__(self):
+        # Avoid DuplicateIdEnum.xxx output of Enum class, provide actual string
+        # value
+        return self.value
+
+
 # TODO: Refactor create_id_default, the *_id generation functions and the
 # stuff in _dataresoure_tools into some class-base approach, i.e. a class that
 # provices both the dispatch to the ID func implementations and the resource
@@ -78,6 +106,144 @@ def uuid4_base64_id(*fields, concat_sep='.'):
     return b64encode(uuid4().bytes, altchars=b'_-').decode()[:-2]
 
 
+# Alphabets for encoding time-ordered ids: Both are URL-safe and in ASCII
+# order, so that the fixed-length encoded ids sort like their binary value.
+crockford_base32_alphabet = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+sortable_base64_alphabet = (
+    '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz')
+
+
+def _encode_int(value, alphabet, length):
+    # Encode the non-negative int value as length digits of alphabet.
+    base = len(alphabet)
+    digits = []
+    for _ in range(length):
+        value, digit = divmod(value, base)
+        digits.append(alphabet[digit])
+    return ''.join(reversed(digits))
+
+
+def _timestamp_ms():
+    return time.time_ns() // 1_000_000
+
+
+def _ulid(timestamp_ms, randomness):
+    # 48 bit timestamp + 80 bit randomness, 26 base32 digits
+    value = (timestamp_ms << 80) | int.from_bytes(randomness, 'big')
+    return _encode_int(value, crockford_base32_alphabet, 26)
+
+
+def _uuid7_base64(timestamp_ms, randomness):
+    # RFC 9562 UUID v7: 48 bit timestamp, 4 bit version, 12 bit rand_a,
+    # 2 bit variant, 62 bit rand_b; 22 base64 digits
+    rand = int.from_bytes(randomness, 'big')
+    value = (
+        (timestamp_ms << 80)
+        | (0x7 << 76)
+        | ((rand >> 62) & 0xfff) << 64
+        | (0b10 << 62)
+        | (rand & (2**62 - 1))
+        )
+    return _encode_int(value, sortable_base64_alphabet, 22)
+
+
+def ulid_id(*fields, concat_sep='.'):
+    """Return a str containing a new ULID, Crockford base32 encoded.
+    """
+    return _ulid(_timestamp_ms(), os.urandom(10))
+
+
+def uuid7_base64_id(*fields, concat_sep='.'):
+    """Return a str containing a new UUID v7, sort order-preserving
+    base64-encoded.
+    """
+    # 74 random bits are needed, use the 10 bytes' least significant ones
+    return _uuid7_base64(_timestamp_ms(), os.urandom(10))
+
+
+# Batch variants of the *_id functions: These take a sequence of primary key
+# field rows and return a list of ids, one per row. They produce the same ids
+# as their single-row counterparts but avoid the per-row call overhead when
+# adding ids to large tables.
+
+def biz_key_composite_ids(rows, concat_sep='.'):
+    """Return a list of fields concatenated with separator concat_sep, for
+    each fields row in rows.
+    """
+    join = concat_sep.join
+    return [join(map(str, fields)) for fields in rows]
+
+
+def biz_hash_md5_ids(rows, concat_sep='.'):
+    """Return a list of md5 hash hexdigests of fields concatenated with
+    separator concat_sep, for each fields row in rows.
+    """
+    join = concat_sep.join
+    return [
+        md5(join(map(str, fields)).encode('utf8')).hexdigest()
+        for fields in rows
+        ]
+
+
+def biz_hash_sha256_ids(rows, concat_sep='.'):
+    """Return a list of sha256 hash hexdigests of fields concatenated with
+    separator concat_sep, for each fields row in rows.
+    """
+    join = concat_sep.join
+    return [
+        sha256(
+            join(str(field).strip() for field in fields).encode('utf8')
+            ).hexdigest()
+        for fields in rows
+        ]
+
+
+def uuid4_base64_ids(rows, concat_sep='.'):
+    """Return a list of str containing URL-safe base64-encoded uuid4
+    representations, without trailing '==', one for each row in rows.
+
+    The random bytes for all uuids are read in one go and split into 16 byte
+    chunks, with the uuid version 4 and variant bits set like uuid.uuid4()
+    does.
+    """
+    count = len(rows)
+    random_bytes = bytearray(os.urandom(16 * count))
+    # version 4: 4 most significant bits of byte 6
+    random_bytes[6::16] = bytes(
+        (b & 0x0f) | 0x40 for b in random_bytes[6::16])
+    # RFC 4122 variant: 2 most significant bits of byte 8
+    random_bytes[8::16] = bytes(
+        (b & 0x3f) | 0x80 for b in random_bytes[8::16])
+    return [
+        b64encode(random_bytes[i:i + 16], altchars=b'_-').decode()[:-2]
+        for i in range(0, 16 * count, 16)
+        ]
+
+
+def _time_ordered_ids(encode, count):
+    # Return count ids that share a timestamp, sorted to keep the batch's ids
+    # in ascending order, too.
+    timestamp_ms = _timestamp_ms()
+    random_bytes = os.urandom(10 * count)
+    return sorted(
+        encode(timestamp_ms, random_bytes[i:i + 10])
+        for i in range(0, 10 * count, 10))
+
+
+def ulid_ids(rows, concat_sep='.'):
+    """Return a list of new ULIDs, one for each row in rows, in ascending
+    order.
+    """
+    return _time_ordered_ids(_ulid, len(rows))
+
+
+def uuid7_base64_ids(rows, concat_sep='.'):
+    """Return a list of new base64-encoded UUID v7s, one for each row in
+    rows, in ascending order.
+    """
+    return _time_ordered_ids(_uuid7_base64, len(rows))
+
+
 # Map id types to id-generating functions
 id_type_funcs = {
     IdEnum.biz_key: None,
@@ -85,6 +251,75 @@ id_type_funcs = {
     IdEnum.biz_hash_md5: biz_hash_md5_id,
     IdEnum.biz_hash_sha256: biz_hash_sha256_id,
     IdEnum.uuid4_base64: uuid4_base64_id,
+    IdEnum.ulid: ulid_id,
+    IdEnum.uuid7_base64: uuid7_base64_id,
+    }
+
+# Map id types to batch id-generating functions
+id_type_batch_funcs = {
+    IdEnum.biz_key: None,
+    IdEnum.biz_key_composite: biz_key_composite_ids,
+    IdEnum.biz_hash_md5: biz_hash_md5_ids,
+    IdEnum.biz_hash_sha256: biz_hash_sha256_ids,
+    IdEnum.uuid4_base64: uuid4_base64_ids,
+    IdEnum.ulid: ulid_ids,
+    IdEnum.uuid7_base64: uuid7_base64_ids,
+    }
+
+
+def _decode_int(id_, alphabet):
+    # Decode the alphabet-encoded id_ to an int.
+    value = 0
+    base = len(alphabet)
+    for char in id_:
+        value = value * base + alphabet.index(char)
+    return value
+
+
+def _hex_codec(length):
+    # Codec for hex digest ids of length bytes
+    def to_bytes(id_):
+        if len(id_) != 2 * length:
+            raise ValueError(f'Invalid id {id_}')
+        return bytes.fromhex(id_)
+
+    return length, to_bytes, bytes.hex
+
+
+def _uuid4_base64_to_bytes(id_):
+    raw = b64decode(id_ + '==', altchars=b'_-', validate=True)
+    if len(raw) != 16:
+        raise ValueError(f'Invalid id {id_}')
+    return raw
+
+
+def _uuid4_base64_from_bytes(raw):
+    return b64encode(raw, altchars=b'_-').decode()[:-2]
+
+
+def _sortable_codec(alphabet, length):
+    # Codec for alphabet-encoded 128 bit ids with length digits
+    def to_bytes(id_):
+        if len(id_) != length:
+            raise ValueError(f'Invalid id {id_}')
+        return _decode_int(id_, alphabet).to_bytes(16, 'big')
+
+    def from_bytes(raw):
+        return _encode_int(int.from_bytes(raw, 'big'), alphabet, length)
+
+    return 16, to_bytes, from_bytes
+
+
+# Map id types that can be stored in binary form to
+# (byte length, to_bytes(id_), from_bytes(raw)) codecs, converting between
+# their str and bytes representations.
+binary_id_types = {
+    IdEnum.biz_hash_md5: _hex_codec(16),
+    IdEnum.biz_hash_sha256: _hex_codec(32),
+    IdEnum.uuid4_base64: (
+        16, _uuid4_base64_to_bytes, _uuid4_base64_from_bytes),
+    IdEnum.ulid: _sortable_codec(crockford_base32_alphabet, 26),
+    IdEnum.uuid7_base64: _sortable_codec(sortable_base64_alphabet, 22),
     }
 
 
@@ -0,0 +1,144 @@
+# Slow-query log: Log the database statements slower than a threshold with
+# their parameters, datatable, route, caller and optionally their query plan,
+# and keep the slowest ones for an admin endpoint.
+
+import datetime
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+import traceback
+
+from sqlalchemy import event
+
+from . import _request_context
+
+
+logger = logging.getLogger('uvicorn.error')
+
+# {dialect name: EXPLAIN statement prefix}
+_explain_prefixes = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+    'mariadb': 'EXPLAIN ',
+    }
+
+# Frames of these packages don't count as the caller of a statement
+_skipped_packages = tuple(
+    os.sep + os.path.join(package, '') for package in [
+        'sqlalchemy', 'sqlmodel', 'starlette', 'anyio', 'concurrent'])
+
+# Max length of the logged parameters repr
+MAX_PARAMETERS_LENGTH = 500
+
+
+def _caller():
+    # The innermost frame outside of SQLAlchemy + this module
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if (frame.filename != __file__
+                and not any(package in frame.filename
+                            for package in _skipped_packages)):
+            return f'{frame.filename}:{frame.lineno} in {frame.name}'
+    return ''
+
+
+def _truncated(value, max_length=MAX_PARAMETERS_LENGTH):
+    text = repr(value)
+    if len(text) > max_length:
+        text = text[:max_length] + '...'
+    return text
+
+
+class SlowQueryLog:
+    """Log the statements of instrumented engines taking threshold seconds
+    or longer, keeping the top_n slowest ones.
+
+    With explain, the query plans of slow SELECT statements are captured too
+    (an additional EXPLAIN statement, sent on the statement's connection).
+    """
+
+    def __init__(self, threshold, explain=False, top_n=50,
+                 clock=time.perf_counter):
+        self.threshold = threshold
+        self.explain = explain
+        self.top_n = top_n
+        self.clock = clock
+        # Min-heap of (duration, seq, entry) of the slowest statements
+        self._slowest = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def instrument(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(
+            self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('datarest_slowlog_start', []).append(
+            self.clock())
+
+    def _after_execute(
+            self, conn, cursor, statement, parameters, context, executemany):
+        duration = self.clock() - conn.info['datarest_slowlog_start'].pop()
+        if duration >= self.threshold:
+            self.record(conn, statement, parameters, duration, executemany)
+
+    def _query_plan(self, conn, statement, parameters):
+        prefix = _explain_prefixes.get(conn.dialect.name)
+        if prefix is None or not statement.lstrip().upper().startswith(
+                'SELECT'):
+            return None
+        # On the DBAPI connection, i.e. without triggering the engine events
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+        except Exception as exc:
+            return f'EXPLAIN failed: {exc}'
+        finally:
+            cursor.close()
+
+    def record(self, conn, statement, parameters, duration,
+               executemany=False):
+        """Log a slow statement and keep it if among the slowest.
+        """
+        table, route = _request_context.route_labels(
+            _request_context.current_scope.get())
+        entry = {
+            'duration': duration,
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'statement': statement,
+            'parameters': _truncated(parameters),
+            'table': table,
+            'route': route,
+            'caller': _caller(),
+            'plan': None,
+            }
+        if self.explain and not executemany:
+            entry['plan'] = self._query_plan(conn, statement, parameters)
+        logger.warning(
+            'Slow query (%.3fs) table=%r route=%r caller=%s: %s '
+            'parameters=%s%s',
+            duration, table, route, entry['caller'], statement,
+            entry['parameters'],
+            f'\nQuery plan:\n{entry["plan"]}' if entry['plan'] else '')
+        with self._lock:
+            item = (duration, next(self._seq), entry)
+            if len(self._slowest) < self.top_n:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+
+    def slowest(self):
+        """Return the kept slowest statements, slowest first.
+        """
+        with self._lock:
+            items = sorted(self._slowest, reverse=True)
+        return [entry for _, _, entry in items]
+
+    def clear(self):
+        with self._lock:
+            self._slowest = []
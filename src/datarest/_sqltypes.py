@@ -0,0 +1,187 @@
+# Custom SQLAlchemy column types.
+
+import decimal
+import uuid
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# Integer column types by value range, narrowest first.
+integer_types = [
+    (sa.SmallInteger, -2**15, 2**15 - 1),
+    (sa.Integer, -2**31, 2**31 - 1),
+    (sa.BigInteger, -2**63, 2**63 - 1),
+    ]
+
+
+def integer_type(minimum=None, maximum=None):
+    """Return the narrowest SQLAlchemy integer type for the value range, or
+    None for an unknown range.
+    """
+    if minimum is None or maximum is None:
+        return None
+    for int_type, type_min, type_max in integer_types:
+        if type_min <= minimum and maximum <= type_max:
+            return int_type
+    return None
+
+
+def lookup_table_name(dbtable, column_name):
+    """Return the name of the lookup table of a dictionary-encoded column.
+    """
+    return f'{dbtable}__{column_name}'
+
+
+class DictionaryEncoded(sa.types.TypeDecorator):
+    """Store the values of a low-cardinality column as small integer codes,
+    i.e. their index in the values dictionary.
+
+    The codes are transparently expanded to their values on reading.
+    """
+    impl = sa.SmallInteger
+    cache_ok = True
+
+    def __init__(self, values):
+        super().__init__()
+        self.values = tuple(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return self.codes[value]
+        except KeyError:
+            raise ValueError(
+                f'{value!r} is not in the column dictionary') from None
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.values[value]
+
+    @property
+    def python_type(self):
+        return str
+
+    def lookup_table(self, name, metadata=None):
+        """Return the SQLAlchemy lookup table (code, value) for the
+        dictionary.
+        """
+        return sa.Table(
+            name, sa.MetaData() if metadata is None else metadata,
+            sa.Column('code', sa.SmallInteger, primary_key=True),
+            sa.Column('value', sa.String(
+                max((len(value) for value in self.values), default=1))),
+            )
+
+    def lookup_rows(self):
+        """Return the lookup table rows, as list of dicts.
+        """
+        return [
+            {'code': code, 'value': value}
+            for code, value in enumerate(self.values)]
+
+
+class BinaryId(sa.types.TypeDecorator):
+    """Store str resource ids of an id type in their compact, fixed-width
+    binary form: UUID (16 byte ids) or BYTEA on PostgreSQL, BINARY(n) on
+    MySQL, BLOB otherwise.
+
+    The API keeps using the str ids, these are converted at the database
+    boundary.
+    """
+    impl = sa.LargeBinary
+    cache_ok = True
+
+    def __init__(self, id_type):
+        from ._resource_ids import binary_id_types
+        super().__init__()
+        self.id_type = id_type
+        self.length, self.to_bytes, self.from_bytes = binary_id_types[
+            id_type]
+
+    def _native_uuid(self, dialect):
+        return dialect.name == 'postgresql' and self.length == 16
+
+    def load_dialect_impl(self, dialect):
+        if self._native_uuid(dialect):
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=True))
+        if dialect.name in ('mysql', 'mariadb'):
+            return dialect.type_descriptor(sa.BINARY(self.length))
+        return dialect.type_descriptor(sa.LargeBinary(self.length))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            raw = self.to_bytes(value)
+        except (ValueError, OverflowError):
+            # Not a valid id of this type so it can't match any stored id:
+            # Look up an (all but) impossible value, i.e. result in 404 Not
+            # Found.
+            raw = bytes(self.length)
+        if self._native_uuid(dialect):
+            return uuid.UUID(bytes=raw)
+        return raw
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, uuid.UUID):
+            value = value.bytes
+        return self.from_bytes(bytes(value))
+
+    @property
+    def python_type(self):
+        return str
+
+
+class ExactDecimal(sa.types.TypeDecorator):
+    """Store decimals of a fixed precision + scale exactly: NUMERIC(p, s),
+    on SQLite (which stores NUMERIC values as floats) as integers scaled by
+    10**scale.
+
+    More than 18 digits don't fit SQLite's 64 bit integers, these are
+    stored as fixed-width digit strings, offset by 10**precision to be
+    non-negative, so that comparing the strings compares the values.
+    """
+    impl = sa.Numeric
+    cache_ok = True
+
+    # Max precision of the scaled integers on SQLite (64 bit)
+    max_scaled_precision = 18
+
+    def __init__(self, precision, scale=0):
+        super().__init__(precision=precision, scale=scale, asdecimal=True)
+        self.precision = precision
+        self.scale = scale
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name != 'sqlite':
+            return dialect.type_descriptor(
+                sa.Numeric(self.precision, self.scale, asdecimal=True))
+        if self.precision <= self.max_scaled_precision:
+            return dialect.type_descriptor(sa.BigInteger())
+        return dialect.type_descriptor(sa.String(self.precision + 1))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != 'sqlite':
+            return value
+        scaled = int(decimal.Decimal(str(value)).scaleb(self.scale)
+                     .to_integral_value())
+        if self.precision <= self.max_scaled_precision:
+            return scaled
+        return f'{scaled + 10**self.precision:0{self.precision + 1}d}'
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name != 'sqlite':
+            return value
+        if self.precision > self.max_scaled_precision:
+            value = int(value) - 10**self.precision
+        return decimal.Decimal(value).scaleb(-self.scale)
+
+    @property
+    def python_type(self):
+        return decimal.Decimal
@@ -1,4 +1,7 @@
 # The datarest command line interface
+import concurrent.futures
+import functools
+import glob
 import os
 import string
 import time
@@ -6,16 +9,12 @@ from pathlib import Path
 import shutil
 from typing import List, Optional
 
-import frictionless
-from frictionless import formats
-
+# Keep the module level imports light: Everything needed for init only
+# (frictionless, SQL models, data resource tools) is imported on use, so that
+# the run command doesn't pay for it.
 from . import _cfgfile
-from . import _models
 from . import _yaml_tools
-from ._resource_ids import IdEnum
-from ._data_resource_tools import (
-    add_descriptions, add_examples, modify_resource_fields,
-    field_name_normalizer, field_type_mapper, primary_key_step)
+from ._resource_ids import IdEnum, DuplicateIdEnum
 
 
 # Make Decimal objects work with pyyaml (needed for examples)
@@ -34,6 +33,346 @@ def _dict_from(colon_str_seq):
     return dct
 
 
+# Data file types picked up when a directory is given to init datafile.
+datafile_suffixes = ('.csv', '.tsv', '.xls', '.xlsx')
+
+excel_suffixes = ('.xls', '.xlsx')
+
+
+def _expand_datafiles(datafiles):
+    """Return the list of data files for the given data file, directory or
+    glob pattern args.
+
+    Directories are expanded to the contained files with one of the
+    datafile_suffixes, glob patterns to the matching files. Anything else
+    (e.g. a URL) is passed through as-is.
+    """
+    expanded = []
+    for datafile in datafiles:
+        if os.path.isdir(datafile):
+            expanded.extend(
+                str(path) for path in sorted(Path(datafile).iterdir())
+                if path.suffix.lower() in datafile_suffixes)
+        elif glob.has_magic(datafile):
+            expanded.extend(sorted(glob.glob(datafile)))
+        else:
+            expanded.append(datafile)
+    return expanded
+
+
+def _table_name(datafile):
+    """Return the table name for the given data file.
+    """
+    # TODOS: This is a hack, we're applying Path to a potential URL.
+    # While it works this is obviously less than ideal.
+    return Path(datafile).stem.lower()
+
+
+def _datafile_dialect(datafile, sheet=None, header_row=1):
+    """Return a frictionless Dialect to read datafile with.
+
+    For spreadsheets, sheet selects the sheet by name or (1-based) number.
+    header_row is the (1-based) row number of the table header row.
+    """
+    import frictionless
+    from frictionless import formats
+
+    controls = []
+    if Path(datafile).suffix.lower() in excel_suffixes:
+        if sheet is not None and sheet.isdigit():
+            sheet = int(sheet)
+        # Frictionless doesn't fill merged cells by default, so it opens the
+        # workbook in openpyxl read-only mode and streams its rows already.
+        excel_control = formats.ExcelControl()
+        if sheet is not None:
+            excel_control.sheet = sheet
+        controls.append(excel_control)
+    return frictionless.Dialect(header_rows=[header_row], controls=controls)
+
+
+def _skip_field_names(field_names, skip_fields):
+    """Return the names of the fields to skip, given as field names or
+    (1-based) field numbers in skip_fields.
+    """
+    names = []
+    for skip_field in skip_fields:
+        if skip_field.isdigit():
+            try:
+                skip_field = field_names[int(skip_field) - 1]
+            except IndexError:
+                raise ValueError(
+                    f'Skip field number {skip_field} out of range') from None
+        elif skip_field not in field_names:
+            raise ValueError(
+                f'Skip field {skip_field} not in table fields {field_names}')
+        names.append(skip_field)
+    return names
+
+
+def _describe_datafile(
+        datafile,
+        encoding=None,
+        resource_id_type=IdEnum.uuid4_base64,
+        primary_key=(),
+        create_exposed=False,
+        field_description=None,
+        rewrite_datafile=False,
+        sheet=None,
+        header_row=1,
+        skip_fields=(),
+        on_duplicate_id=DuplicateIdEnum.fail,
+        compact_types=False,
+        dictionary_max=0,
+        binary_ids=False,
+        echo=print,
+        ):
+    """Describe datafile and write its <table>.yaml data resource file, with
+    the primary key added.
+
+    Duplicate IDs are handled according to the on_duplicate_id policy and
+    reported using the echo callable.
+
+    With compact_types, the data is profiled to add storage constraints for
+    narrower column types, string fields with at most dictionary_max distinct
+    values get dictionary-encoded.
+
+    With binary_ids, the resource ids are stored in their compact binary form.
+
+    Returns the (picklable) description to get the data resource from with
+    _datafile_resource(), e.g. in another process.
+    """
+    import frictionless
+    from ._data_resource_tools import (
+        add_descriptions, add_examples, modify_resource_fields,
+        field_name_normalizer, field_type_mapper, non_biz_id_types,
+        DuplicateIdError, add_source_rows, find_duplicate_ids, field_stats,
+        add_storage_constraints)
+
+    table = _table_name(datafile)
+
+    if rewrite_datafile:
+        # backup table data file
+        timestamp = int(time.time())
+        datafile_path = Path(datafile)
+        datafile_bak = datafile_path.with_name(
+            f'{datafile_path.name}.{timestamp}.bak')
+        shutil.copyfile(datafile, datafile_bak)
+
+    datafile_resource = frictionless.describe(
+        datafile,
+        encoding=encoding,
+        dialect=_datafile_dialect(
+            datafile, sheet=sheet, header_row=header_row),
+        )
+    described = {
+        'datafile': datafile,
+        'encoding': datafile_resource.encoding,
+        'dialect': datafile_resource.dialect.to_descriptor(),
+        'source_schema': datafile_resource.schema.to_descriptor(),
+        'skip_names': [],
+        'primary_key': {
+            'id_type': resource_id_type,
+            'primary_key': list(primary_key),
+            'create_exposed': create_exposed,
+            'id_binary': binary_ids,
+            },
+        'duplicates': None,
+        'on_duplicate_id': on_duplicate_id,
+        'resource_schema': None,
+        }
+
+    if skip_fields:
+        described['skip_names'] = _skip_field_names(
+            datafile_resource.schema.field_names, skip_fields)
+    datafile_resource = _source_resource(described)
+
+    # Normalize table headers to be valid identifiers, use string
+    # instead of any tableschema datatype.
+    # See https://github.com/frictionlessdata/framework/issues/812 for
+    # background to CSV any detection.
+    # TODO: Should this better be done with transform steps?
+    # Is there a simple way to modify header names and avoid rewriting
+    # the data?
+    datafile_resource = modify_resource_fields(
+        datafile_resource,
+        field_name_normalizer(),
+        field_type_mapper(any='string')
+        )
+
+    if field_description:
+        add_descriptions(datafile_resource, **_dict_from(field_description))
+
+    add_examples(datafile_resource)
+    described['schema'] = datafile_resource.schema.to_descriptor()
+
+    # Inject primary key into the resource schema. Depending on the
+    # used id type this adds a single generated id field to the tabular
+    # resource data.
+    resource_with_pk = _datafile_resource(described)
+
+    # Check for duplicate IDs before loading anything into the database.
+    # Generated (random) IDs differ on every read, so there's no point in
+    # checking these.
+    if resource_id_type not in non_biz_id_types:
+        duplicates = find_duplicate_ids(
+            resource_with_pk,
+            id_field_name=resource_with_pk.schema.primary_key[0])
+        if duplicates:
+            # Report the data file row numbers
+            add_source_rows(
+                duplicates, _source_resource(described, skip_fields=False))
+            if on_duplicate_id == DuplicateIdEnum.fail:
+                raise DuplicateIdError(duplicates)
+            echo(f'Table {table}: {duplicates}')
+            echo(f'Table {table}: Removing duplicates ({on_duplicate_id})')
+            described['duplicates'] = duplicates
+            resource_with_pk = _datafile_resource(described)
+
+    if compact_types:
+        # Profile the data for compact column storage types
+        stats = field_stats(resource_with_pk, max_distinct=dictionary_max)
+        add_storage_constraints(
+            resource_with_pk, stats, dictionary_max=dictionary_max)
+    described['resource_schema'] = resource_with_pk.schema.to_descriptor()
+
+    # Create data resource yaml file
+    resource_path = f'{table}.yaml'
+    resource_with_pk.to_yaml(resource_path)
+
+    if rewrite_datafile:
+        # write id (primary key)-enhanced + normalized data file
+        resource_with_pk.write(datafile)
+
+    return described
+
+
+def _source_resource(described, skip_fields=True):
+    # The data file resource as described, without the skipped fields unless
+    # skip_fields is False
+    import frictionless
+    from frictionless import steps
+
+    resource = frictionless.Resource(
+        described['datafile'],
+        encoding=described['encoding'],
+        dialect=frictionless.Dialect.from_descriptor(described['dialect']),
+        schema=frictionless.Schema.from_descriptor(
+            described['source_schema']),
+        )
+    if skip_fields and described['skip_names']:
+        resource = frictionless.transform(
+            resource,
+            steps=[steps.field_remove(names=described['skip_names'])])
+    return resource
+
+
+def _datafile_resource(described):
+    """Return the id-enhanced data resource of a data file described by
+    _describe_datafile().
+
+    This doesn't read the data, the resource rows are transformed when
+    read.
+    """
+    import frictionless
+    from ._data_resource_tools import primary_key_step, dedup_step
+
+    resource = _source_resource(described)
+    resource.schema = frictionless.Schema.from_descriptor(
+        described['schema'])
+    add_pk_step = primary_key_step(resource, **described['primary_key'])
+    resource = frictionless.transform(resource, steps=[add_pk_step()])
+    if described['duplicates']:
+        resource = frictionless.transform(
+            resource,
+            steps=[dedup_step(
+                described['duplicates'], described['on_duplicate_id'])()])
+    if described['resource_schema'] is not None:
+        # Including the storage constraints
+        resource.schema = frictionless.Schema.from_descriptor(
+            described['resource_schema'])
+    return resource
+
+
+def _load_datafile(described, resume=False, echo=print):
+    """Load the data of a data file described by _describe_datafile() into
+    its (existing) database table.
+    """
+    from . import _data_loader
+    from . import _database
+
+    table = _table_name(described['datafile'])
+    resource = _datafile_resource(described)
+    _data_loader.write_lookup_tables(
+        resource, engine=_database.engine, dbtable=table)
+    loaded = _data_loader.load_resource(
+        resource,
+        engine=_database.engine,
+        dbtable=table,
+        source=described['datafile'],
+        resume=resume,
+        )
+    echo(f'Loaded {loaded} rows into table {table}')
+
+
+def _check_multi_worker_authn(cfg_path='app.yaml'):
+    """Raise a click.UsageError if the app issues JWTs without configured
+    signing keys: Each (non-forked) worker would use its own random key.
+    """
+    import click
+
+    if not os.path.isfile(cfg_path):
+        return
+    authn = _cfgfile.read_app_config(cfg_path).datarest.fastapi.authn
+    from . import _authn
+    if _authn.issues_tokens(authn):
+        from . import _jwt
+        if not _jwt.keys_configured(_authn.jwt_config(authn)):
+            raise click.UsageError(
+                'Multiple workers need configured JWT signing keys (see the '
+                'authn.jwt config), or use datarest serve --workers')
+
+
+def _check_compact_types(compact_types, expose):
+    """Raise a click.UsageError for compact types with create/update routes:
+    The profiled maximum, maxLength and enum constraints would reject new
+    data beyond the loaded data's range.
+    """
+    import click
+
+    writing = {_cfgfile.ExposeRoutesEnum.create,
+               _cfgfile.ExposeRoutesEnum.update}
+    if compact_types and writing.intersection(expose or ()):
+        raise click.UsageError(
+            '--compact-types limits fields to the loaded data\'s value '
+            'ranges, lengths and values, it can\'t be used with --expose '
+            'create or update')
+
+
+def _init_pool_process():
+    # Don't use the database connections inherited from the parent process
+    from . import _database
+    _database.engine.dispose(close=False)
+
+
+def _map_parallel(func, items, max_workers):
+    """Apply func to each of items using a pool of at most max_workers
+    processes: Describing and loading data files is CPU-bound, threads would
+    take turns on the GIL.
+
+    func, the items and the results need to be picklable. With a single
+    worker, func is applied in this process.
+
+    Returns the list of results, in items order. Raises the first exception
+    raised by any of the func calls.
+    """
+    max_workers = max(1, min(max_workers, len(items)))
+    if max_workers == 1:
+        return list(map(func, items))
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers, initializer=_init_pool_process) as executor:
+        return list(executor.map(func, items))
+
+
 def cli():
     # uvicorn uses click, so we are able to integrate it with the typer cli
     import click
@@ -50,7 +389,9 @@ def cli():
     # define our own exposed cli commands & params
     @init_app.command()
     def datafile(
-            datafile: str = typer.Argument(...),
+            datafiles: List[str] = typer.Argument(
+                ..., help='Data file(s), directories or glob patterns, one '
+                'table per data file'),
             encoding: Optional[str] = typer.Option(None),
             connect_string: Optional[str] = typer.Option("sqlite:///app.db"),
             expose: Optional[List[_cfgfile.ExposeRoutesEnum]] = typer.Option(
@@ -74,97 +415,120 @@ def cli():
                 None, help='LDAP bind dn'),
             ldap_server: Optional[str] = typer.Option(
                 None, help='LDAP server'),
+            jobs: int = typer.Option(
+                4, min=1, help='Number of data files to process in parallel'),
+            sheet: Optional[str] = typer.Option(
+                None, help='Spreadsheet sheet name or number (default: 1st '
+                'sheet)'),
+            header_row: int = typer.Option(
+                1, min=1, help='Number of the table header row'),
+            skip_fields: List[str] = typer.Option(
+                [], help='Provide one or more field name(s) or number(s) to '
+                'skip'),
+            resume: bool = typer.Option(
+                False, help='Resume an interrupted data load from its last '
+                'checkpoint'),
+            on_duplicate_id: DuplicateIdEnum = typer.Option(
+                'fail', help='How to handle rows with duplicate resource IDs'),
+            compact_types: bool = typer.Option(
+                False, help='Profile the data to use compact column types '
+                '(narrow integers, bounded strings), for read-only APIs'),
+            dictionary_max: int = typer.Option(
+                0, min=0, help='Dictionary-encode string fields with at most '
+                'this many distinct values (needs --compact-types)'),
+            binary_ids: bool = typer.Option(
+                False, help='Store hash and UUID/ULID resource IDs in '
+                'compact binary columns'),
             ):
+        _check_compact_types(compact_types, expose)
         cfg_path = Path('app.yaml')
-        if cfg_path.exists():
+        if resume:
+            if not cfg_path.exists():
+                typer.echo(f'No {cfg_path.name} found, nothing to resume.')
+                raise typer.Exit(1)
+            if rewrite_datafile:
+                typer.echo('Cannot rewrite data files when resuming.')
+                raise typer.Exit(1)
+        elif cfg_path.exists():
             typer.echo(f'Found existing {cfg_path.name}, skipping init.')
             raise typer.Exit(1)
         try:
-            if rewrite_datafile:
-                # backup table data file
-                timestamp = int(time.time())
-                datafile_bak = datafile.with_name(
-                    f'{datafile.name}.{timestamp}.bak')
-                shutil.copyfile(datafile, datafile_bak)
-
-            # TODOS: This is a hack, we're applying Path to a potential URL.
-            # While it works this is obviously less than ideal.
-            table = Path(datafile).stem.lower()
-
-            # write main app.yaml config file
-            _cfgfile.write_app_config(
-                cfg_path,
-                app_config=_cfgfile.app_config(
-                    table=table,
-                    title=table.title(),
-                    description=description,
-                    version='0.1.0',
-                    connect_string=connect_string,
-                    expose_routes=expose,
-                    query_params=query,
-                    authn_type=authn,
-                    ldap_bind_dn=ldap_bind_dn,
-                    ldap_server=ldap_server,
+            datafiles = _expand_datafiles(datafiles)
+            if not datafiles:
+                raise ValueError('No data files found')
+            tables = [_table_name(datafile) for datafile in datafiles]
+            duplicates = sorted(
+                set(table for table in tables if tables.count(table) > 1))
+            if duplicates:
+                raise ValueError(f'Duplicate table names {duplicates}')
+
+            if len(tables) == 1:
+                title = tables[0].title()
+            else:
+                title = Path.cwd().name.title()
+
+            # write main app.yaml config file (kept as-is when resuming)
+            if not resume:
+                _cfgfile.write_app_config(
+                    cfg_path,
+                    app_config=_cfgfile.app_config(
+                        table=tables,
+                        title=title,
+                        description=description,
+                        version='0.1.0',
+                        connect_string=connect_string,
+                        expose_routes=expose,
+                        query_params=query,
+                        authn_type=authn,
+                        ldap_bind_dn=ldap_bind_dn,
+                        ldap_server=ldap_server,
+                        )
                     )
-                )
-
-            datafile_resource = frictionless.describe(
-                datafile, encoding=encoding)
-
-            # Normalize table headers to be valid identifiers, use string
-            # instead of any tableschema datatype.
-            # See https://github.com/frictionlessdata/framework/issues/812 for
-            # background to CSV any detection.
-            # TODO: Should this better be done with transform steps?
-            # Is there a simple way to modify header names and avoid rewriting
-            # the data?
-            datafile_resource = modify_resource_fields(
-                datafile_resource,
-                field_name_normalizer(),
-                field_type_mapper(any='string')
-                )
-
-            if field_description:
-                add_descriptions(
-                    datafile_resource, **_dict_from(field_description))
 
             if _cfgfile.ExposeRoutesEnum.create in expose:
                 create_exposed = True
             else:
                 create_exposed = False
 
-            add_examples(datafile_resource)
-
-            # Inject primary key into the resource schema. Depending on the
-            # used id type this adds a single generated id field to the tabular
-            # resource data.
-            add_pk_step = primary_key_step(
-                datafile_resource,
-                id_type=resource_id_type,
-                primary_key=primary_key,
-                create_exposed=create_exposed,
-            )
-            resource_with_pk = frictionless.transform(
-                datafile_resource,
-                steps=[add_pk_step()])
-
-            # Create data resource yaml file
-            resource_path = f'{table}.yaml'
-            resource_with_pk.to_yaml(resource_path)
-
-            if rewrite_datafile:
-                # write id (primary key)-enhanced + normalized data file
-                resource_with_pk.write(datafile)
+            # Describe the data files and create the data resource yaml
+            # files in parallel.
+            described = _map_parallel(
+                functools.partial(
+                    _describe_datafile,
+                    encoding=encoding,
+                    resource_id_type=resource_id_type,
+                    primary_key=primary_key,
+                    create_exposed=create_exposed,
+                    field_description=field_description,
+                    rewrite_datafile=rewrite_datafile,
+                    sheet=sheet,
+                    header_row=header_row,
+                    skip_fields=skip_fields,
+                    on_duplicate_id=on_duplicate_id,
+                    compact_types=compact_types,
+                    dictionary_max=dictionary_max,
+                    binary_ids=binary_ids,
+                    echo=typer.echo,
+                    ),
+                datafiles, jobs)
 
             cfg = _cfgfile.read_app_config()
             from . import _database
+            from . import _models
             from sqlmodel import SQLModel
             models = _models.create_models(cfg.datarest.datatables)
             SQLModel.metadata.create_all(_database.engine)
 
-            resource_with_pk.write(
-                cfg.datarest.database.connect_string,
-                control=formats.SqlControl(table=table))
+            # Load the data into the database tables in parallel.
+            # SQLite only allows for a single writer at a time so don't
+            # bother to run concurrent loads, there.
+            load_jobs = 1 if _database.connect_string.startswith(
+                'sqlite:') else jobs
+
+            _map_parallel(
+                functools.partial(
+                    _load_datafile, resume=resume, echo=typer.echo),
+                described, load_jobs)
         except Exception as exc:
             typer.echo(exc)
             # raise typer.Exit(1)
@@ -212,6 +576,10 @@ def cli():
                     )
                 )
 
+            import frictionless
+            from frictionless import formats
+            from ._data_resource_tools import add_descriptions, add_examples
+
             # Connect to DB using environment-expanded connect_string
             db_resource = frictionless.describe(
                 string.Template(connect_string).substitute(os.environ),
@@ -251,6 +619,7 @@ def cli():
 
             cfg = _cfgfile.read_app_config()
             from . import _database
+            from . import _models
             from sqlmodel import SQLModel
             models = _models.create_models(cfg.datarest.datatables)
             SQLModel.metadata.create_all(_database.engine)
@@ -260,6 +629,38 @@ def cli():
             # raise typer.Exit(1)
             raise
 
+    @app.command()
+    def serve(
+            host: str = typer.Option(
+                '127.0.0.1', help='Bind socket to this host'),
+            port: int = typer.Option(8000, help='Bind socket to this port'),
+            workers: int = typer.Option(
+                1, min=1, help='Number of worker processes'),
+            log_level: str = typer.Option('info', help='Log level'),
+            ):
+        """Serve the app from preforked worker processes.
+
+        The app is built once and shared by the workers (copy-on-write),
+        instead of each worker building it separately as with run --workers.
+        """
+        from . import _prefork
+        _prefork.serve(
+            host=host, port=port, workers=workers, log_level=log_level)
+
+    @app.command()
+    def profile_startup(
+            imports: bool = typer.Option(
+                True, help='Report module import times'),
+            top: int = typer.Option(
+                10, min=1, help='Number of slowest tables + imports to '
+                'report'),
+            ):
+        """Time and report the app startup phases, per table.
+        """
+        from . import _profiling
+        profile = _profiling.profile_startup(imports=imports)
+        typer.echo(profile.report(top=top))
+
     app.add_typer(init_app, name="init")
 
     # Just for providing the main command documentation
@@ -279,6 +680,16 @@ def cli():
         if isinstance(param, click.Argument) and param.name == 'app'][0]
     app_arg.default = 'datarest._app:app'
 
+    # Refuse running multiple workers which can't verify each other's tokens
+    run_callback = uvicorn.main.callback
+
+    def run(**kwargs):
+        if (kwargs.get('workers') or 1) > 1:
+            _check_multi_worker_authn()
+        return run_callback(**kwargs)
+
+    uvicorn.main.callback = run
+
     # hook uvicorn's click to our typer cli here
     uvicorn.main.name = 'run'
     typer_click_object.add_command(uvicorn.main)
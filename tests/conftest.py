@@ -0,0 +1,45 @@
+import frictionless
+import pytest
+from sqlmodel import SQLModel
+
+from datarest._cfgfile import write_app_config
+
+
+def write_resource(path, rows):
+    """Write the data resource file for rows (the header row first), with a
+    biz_key primary key "id".
+    """
+    resource = frictionless.describe(rows)
+    resource.schema.primary_key = ["id"]
+    resource.schema.custom['x_datarest_primary_key_info'] = {
+        'id_type': 'biz_key',
+        'id_src_fields': [],
+        }
+    resource.to_yaml(str(path))
+
+
+@pytest.fixture
+def make_project(tmp_path, monkeypatch):
+    """Return a factory for a project directory: make_project(tables,
+    config=None) writes the <name>.yaml data resource files of the
+    {name: rows} tables and the optional app config to app.yaml, changes
+    into the directory and returns its path.
+
+    The tables are removed from the SQLModel metadata afterwards.
+    """
+    names = []
+
+    def make_project(tables, config=None):
+        monkeypatch.chdir(tmp_path)
+        for name, rows in tables.items():
+            write_resource(tmp_path / f'{name}.yaml', rows)
+            names.append(name)
+        if config is not None:
+            write_app_config(tmp_path / 'app.yaml', config)
+        return tmp_path
+
+    yield make_project
+    for name in names:
+        table = SQLModel.metadata.tables.get(name)
+        if table is not None:
+            SQLModel.metadata.remove(table)
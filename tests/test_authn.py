@@ -49,11 +49,94 @@ def test_httpbasic_scheme(app_config_def):
         os.remove('app.yaml')
 
 
-def test_oauth2_passwordbearer_scheme_raises_notimplementederror():
-    from datarest._authn import _oauth2_passwordbearer_scheme
-    
-    with pytest.raises(NotImplementedError):
-        _oauth2_passwordbearer_scheme()
+def test_oauth2_passwordbearer_scheme():
+    from fastapi.security import OAuth2PasswordBearer
+    from datarest._authn import AuthnScheme, _oauth2_passwordbearer_scheme
+
+    scheme = _oauth2_passwordbearer_scheme()
+    assert isinstance(scheme, AuthnScheme)
+    assert isinstance(scheme.scheme, OAuth2PasswordBearer)
+    assert scheme.CredentialsType == str
+    assert scheme.challenge == 'Bearer'
+
+
+def test_oauth2_passwordbearer_ldap(tmp_path, monkeypatch):
+    import frictionless
+    from fastapi.testclient import TestClient
+    from datarest import _ldap_authn
+    from datarest._cfgfile import (
+        Authn, AuthnEnum, Jwt, LDAP, app_config, read_app_config)
+
+    ldap_binds = []
+
+    class FakeLDAP:
+        """Local LDAP stand-in.
+        """
+        def __init__(self, bind_dn, server, **kwargs):
+            pass
+
+        def authenticate(self, username, password):
+            ldap_binds.append(username)
+            if (username, password) != ('alice', 'secret'):
+                raise _ldap_authn.InvalidCredentialsError()
+            return f'dn:uid={username}'
+
+    monkeypatch.setattr(_ldap_authn, 'LDAPAuth', FakeLDAP)
+    monkeypatch.delenv('DATAREST_JWT_KEYS', raising=False)
+    monkeypatch.chdir(tmp_path)
+    resource = frictionless.describe([["id", "name"], [1, "red"]])
+    resource.schema.primary_key = ["id"]
+    resource.schema.custom['x_datarest_primary_key_info'] = {
+        'id_type': 'biz_key', 'id_src_fields': []}
+    resource.to_yaml('oauth_colors.yaml')
+    config = app_config(
+        'oauth_colors', connect_string='sqlite://',
+        expose_routes=['get_all'])
+    config.datarest.fastapi.authn = Authn(
+        authn_type=AuthnEnum.OAuth2PasswordBearer_LDAP,
+        ldap=LDAP(bind_dn='uid={uid},dc=example', server='ldap.example'),
+        jwt=Jwt(keys={'k1': 'secret1'}),
+        )
+    write_app_config('app.yaml', config)
+    from sqlmodel import Session, SQLModel, create_engine
+    from sqlmodel.pool import StaticPool
+    from datarest import _database
+    from datarest._app_factory import create_app
+    app = create_app(read_app_config('app.yaml'))
+    engine = create_engine(
+        'sqlite://', connect_args={'check_same_thread': False},
+        poolclass=StaticPool)
+
+    def get_db():
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[_database.get_db] = get_db
+    client = TestClient(app)
+
+    assert client.get('/oauth_colors').status_code == 401
+    response = client.post(
+        '/token', data={'username': 'alice', 'password': 'wrong'})
+    assert response.status_code == 401
+    assert response.headers['www-authenticate'] == 'Bearer'
+
+    response = client.post(
+        '/token', data={'username': 'alice', 'password': 'secret'})
+    assert response.status_code == 200
+    assert response.json()['token_type'] == 'bearer'
+    headers = {
+        'Authorization': f"Bearer {response.json()['access_token']}"}
+    ldap_binds.clear()
+    # Verified locally, no LDAP round-trips
+    for _ in range(3):
+        response = client.get('/oauth_colors', headers=headers)
+        assert response.status_code == 200
+    assert ldap_binds == []
+
+    response = client.get(
+        '/oauth_colors', headers={'Authorization': 'Bearer invalid'})
+    assert response.status_code == 401
 
 
 @pytest.mark.skip
@@ -0,0 +1,99 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPBasicCredentials
+
+from datarest import _ldap_authn
+from datarest._authn_cache import CachedAuth
+from datarest._cfgfile import AuthnCache, LDAP, app_config, write_app_config
+
+
+class FakeLDAP:
+    """Local LDAP stand-in, counting the (bind) round-trips.
+    """
+    users = {'alice': 'secret'}
+
+    def __init__(self, bind_dn='uid={uid},ou=users,dc=example,dc=com',
+                 server=None, **kwargs):
+        self.bind_dn = bind_dn
+        self.binds = 0
+
+    def authenticate(self, username, password):
+        self.binds += 1
+        if self.users.get(username) != password:
+            raise _ldap_authn.InvalidCredentialsError('invalid credentials')
+        return f'dn:{self.bind_dn.format(uid=username)}'
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cached_auth():
+    ldap, clock = FakeLDAP(), Clock()
+    auth = CachedAuth(
+        ldap, _ldap_authn.InvalidCredentialsError, max_size=2, ttl=60,
+        negative_ttl=5, clock=clock)
+
+    identity = 'dn:uid=alice,ou=users,dc=example,dc=com'
+    assert auth.authenticate('alice', 'secret') == identity
+    assert auth.authenticate('alice', 'secret') == identity
+    assert ldap.binds == 1
+
+    # A different password is never a cache hit
+    with pytest.raises(_ldap_authn.InvalidCredentialsError):
+        auth.authenticate('alice', 'wrong')
+    with pytest.raises(_ldap_authn.InvalidCredentialsError):
+        auth.authenticate('alice', 'wrong')
+    assert ldap.binds == 2
+
+    # Failures expire first
+    clock.now = 10
+    with pytest.raises(_ldap_authn.InvalidCredentialsError):
+        auth.authenticate('alice', 'wrong')
+    assert ldap.binds == 3
+    assert auth.authenticate('alice', 'secret') == identity
+    assert ldap.binds == 3
+
+    clock.now = 61
+    assert auth.authenticate('alice', 'secret') == identity
+    assert ldap.binds == 4
+
+    # No plain passwords kept
+    assert all('secret' not in repr(key) for key in auth._valid)
+
+
+def test_cached_auth_bounded():
+    ldap = FakeLDAP()
+    ldap.users = {f'user{i}': 'pw' for i in range(3)}
+    auth = CachedAuth(ldap, _ldap_authn.InvalidCredentialsError, max_size=2)
+    for i in range(3):
+        auth.authenticate(f'user{i}', 'pw')
+    assert len(auth._valid) == 2
+    # least recently used user0 got dropped
+    auth.authenticate('user0', 'pw')
+    assert ldap.binds == 4
+
+
+def test_ldap_authentication_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_app_config('app.yaml', app_config('table1'))
+    monkeypatch.setattr(_ldap_authn, 'LDAPAuth', FakeLDAP)
+    from datarest._authn import _ldap_authentication, _httpbasic_scheme
+
+    authenticate = _ldap_authentication(
+        ldap=LDAP(bind_dn='uid={uid},dc=example', server='ldap.example.com'),
+        authn_scheme=_httpbasic_scheme(),
+        cache=AuthnCache(),
+        )
+    credentials = HTTPBasicCredentials(username='alice', password='secret')
+    assert authenticate(credentials) == 'alice'
+    assert authenticate(credentials) == 'alice'
+    with pytest.raises(HTTPException) as exc_info:
+        authenticate(
+            HTTPBasicCredentials(username='alice', password='wrong'))
+    assert exc_info.value.status_code == 401
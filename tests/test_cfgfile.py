@@ -55,6 +55,17 @@ def test_app_config_overrides():
     assert config.datarest.datatables.__root__['table'].expose_routes == [ExposeRoutesEnum.get_one]
 
 
+def test_app_config_multiple_tables():
+    # Test a sequence of table names
+    config = app_config(['table1', 'table2'], query_params=['name'])
+    assert isinstance(config, AppConfig)
+    assert config.datarest.fastapi.app.title == "table1 API"
+    assert list(config.datarest.datatables.__root__) == ['table1', 'table2']
+    assert config.datarest.datatables.__root__['table2'].schema_ == 'table2.yaml'
+    assert config.datarest.datatables.__root__['table2'].dbtable == 'table2'
+    assert config.datarest.datatables.__root__['table2'].query_params == ['name']
+
+
 def test_app_config_no_title():
     # Test default values with no title
     config = app_config('table')
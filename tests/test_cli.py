@@ -1,6 +1,7 @@
 import pytest
 
-from datarest.cli import _dict_from
+from datarest._resource_ids import DuplicateIdEnum, IdEnum
+from datarest.cli import _dict_from, _expand_datafiles, _table_name, _datafile_dialect, _skip_field_names
 
 def test__dict_from():
     # Test input with colon characters
@@ -9,8 +10,121 @@ def test__dict_from():
     assert _dict_from(['a : b ', 'c : d']) == {'a': 'b', 'c' : 'd'}
 
 
+def test__expand_datafiles(tmp_path):
+    for name in ['b.csv', 'a.xlsx', 'c.txt']:
+        (tmp_path / name).write_text('')
+    # directories expand to the contained data files
+    assert _expand_datafiles([str(tmp_path)]) == [
+        str(tmp_path / 'a.xlsx'), str(tmp_path / 'b.csv')]
+    # glob patterns expand to matching files
+    assert _expand_datafiles([str(tmp_path / '*.csv')]) == [
+        str(tmp_path / 'b.csv')]
+    # anything else is passed through
+    assert _expand_datafiles(['colors.csv', 'https://x/y.csv']) == [
+        'colors.csv', 'https://x/y.csv']
 
 
+def test__table_name():
+    assert _table_name('data/Colors.csv') == 'colors'
 
-    
 
+def test__datafile_dialect():
+    dialect = _datafile_dialect('data.xlsx', sheet='2', header_row=3)
+    assert dialect.header_rows == [3]
+    excel_control = dialect.get_control('excel')
+    assert excel_control.sheet == 2
+    # Frictionless default: Read-only workbook, streamed rows
+    assert excel_control.fill_merged_cells is False
+    assert _datafile_dialect('data.xlsx', sheet='data').get_control(
+        'excel').sheet == 'data'
+    # no spreadsheet control for other data files
+    assert _datafile_dialect('data.csv').controls == []
+
+
+def test__skip_field_names():
+    field_names = ['a', 'b', 'c']
+    assert _skip_field_names(field_names, []) == []
+    assert _skip_field_names(field_names, ['c', '1']) == ['c', 'a']
+    with pytest.raises(ValueError):
+        _skip_field_names(field_names, ['4'])
+    with pytest.raises(ValueError):
+        _skip_field_names(field_names, ['d'])
+
+
+def test_multi_worker_needs_jwt_keys(tmp_path, monkeypatch):
+    import click
+    from datarest import _cfgfile
+    from datarest.cli import _check_multi_worker_authn
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('DATAREST_JWT_KEYS', raising=False)
+    config = _cfgfile.app_config(
+        'colors', authn_type=_cfgfile.AuthnEnum.OAuth2PasswordBearer_LDAP,
+        ldap_bind_dn='uid={uid},dc=example', ldap_server='ldap.example')
+    _cfgfile.write_app_config('app.yaml', config)
+    with pytest.raises(click.UsageError):
+        _check_multi_worker_authn()
+
+    monkeypatch.setenv('DATAREST_JWT_KEYS', 'k1=secret')
+    _check_multi_worker_authn()
+
+
+def test_compact_types_read_only():
+    import click
+    from datarest._cfgfile import ExposeRoutesEnum
+    from datarest.cli import _check_compact_types
+
+    _check_compact_types(True, [ExposeRoutesEnum.get_all])
+    _check_compact_types(False, [ExposeRoutesEnum.create])
+    for route in [ExposeRoutesEnum.create, ExposeRoutesEnum.update]:
+        with pytest.raises(click.UsageError):
+            _check_compact_types(True, [ExposeRoutesEnum.get_one, route])
+
+
+def test__map_parallel():
+    from datarest.cli import _map_parallel
+
+    assert _map_parallel(abs, [-1, 2, -3], 2) == [1, 2, 3]
+    assert _map_parallel(abs, [-1], 4) == [1]
+    with pytest.raises(TypeError):
+        _map_parallel(abs, [-1, 'a'], 2)
+
+
+def test__describe_datafile(tmp_path, monkeypatch):
+    import pickle
+    from datarest.cli import _datafile_resource, _describe_datafile
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'colors.csv').write_text(
+        'no,color name,junk\n1,red,x\n2,green,y\n2,green,y\n')
+    described = _describe_datafile(
+        'colors.csv', resource_id_type=IdEnum.biz_key, primary_key=['no'],
+        skip_fields=['junk'], on_duplicate_id=DuplicateIdEnum.skip,
+        compact_types=True, echo=lambda message: None)
+    assert (tmp_path / 'colors.yaml').exists()
+
+    # E.g. described in a worker process, loaded in another one
+    resource = _datafile_resource(pickle.loads(pickle.dumps(described)))
+    assert resource.read_rows() == [
+        {'no': 1, 'color_name': 'red'}, {'no': 2, 'color_name': 'green'}]
+    assert resource.schema.get_field('color_name').constraints == {
+        'maxLength': 5}
+
+
+def test__describe_datafile_duplicate_rows(tmp_path, monkeypatch):
+    from datarest._data_resource_tools import DuplicateIdError
+    from datarest.cli import _describe_datafile
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'colors.csv').write_text(
+        'Colors\n\nno,color,junk\n1,red,x\n2,green,y\n1,blue,z\n')
+    # The data file's row numbers are reported, also for transformed
+    # (skipped fields) resources
+    for skip_fields in [[], ['junk']]:
+        with pytest.raises(DuplicateIdError) as exc_info:
+            _describe_datafile(
+                'colors.csv', resource_id_type=IdEnum.biz_key,
+                primary_key=['no'], header_row=3, skip_fields=skip_fields,
+                echo=lambda message: None)
+        assert exc_info.value.duplicates.source_rows == {1: [6]}
+        assert '1: rows 6' in str(exc_info.value)
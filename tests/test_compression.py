@@ -0,0 +1,139 @@
+import gzip
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from datarest._compression import (
+    CompressionMiddleware, available_encodings, compress, encoder, negotiate)
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ('', None),
+    ('gzip', 'gzip'),
+    ('gzip, br, zstd', 'zstd'),
+    ('gzip, br;q=0.5', 'gzip'),
+    ('br;q=0.5, gzip;q=0.8', 'gzip'),
+    ('*', 'zstd'),
+    ('*, zstd;q=0', 'br'),
+    ('identity', None),
+    ('gzip;q=0', None),
+    ('GZIP;q=x', None),
+    ])
+def test_negotiate(accept_encoding, expected):
+    assert negotiate(accept_encoding, ['zstd', 'br', 'gzip']) == expected
+
+
+def test_available_encodings():
+    assert 'gzip' in available_encodings()
+    assert available_encodings(['gzip']) == ['gzip']
+    with pytest.raises(ValueError, match='deflate'):
+        available_encodings(['gzip', 'deflate'])
+
+
+def test_encoder():
+    assert gzip.decompress(compress(b'x' * 1000, 'gzip')) == b'x' * 1000
+
+    gzip_encoder = encoder('gzip', level=1)
+    decompressor = zlib.decompressobj(31)
+    # Each chunk is decompressible right away
+    assert decompressor.decompress(gzip_encoder.compress(b'abc')) == b'abc'
+    assert decompressor.decompress(gzip_encoder.compress(b'def')) == b'def'
+    assert decompressor.decompress(gzip_encoder.finish(b'ghi')) == b'ghi'
+    assert decompressor.eof
+
+
+def app(**kwargs):
+    body = b'x' * 2000
+
+    def large(request):
+        return Response(body, media_type='text/plain')
+
+    def small(request):
+        return Response(b'x' * 10, media_type='text/plain')
+
+    def stream(request):
+        return StreamingResponse(
+            iter([b'a' * 10, b'b' * 10]), media_type='text/csv')
+
+    def encoded(request):
+        return Response(
+            gzip.compress(body), media_type='text/plain',
+            headers={'Content-Encoding': 'gzip'})
+
+    def parquet(request):
+        return Response(body, media_type='application/vnd.apache.parquet')
+
+    app = Starlette(routes=[
+        Route(f'/{endpoint.__name__}', endpoint)
+        for endpoint in [large, small, stream, encoded, parquet]])
+    app.add_middleware(CompressionMiddleware, **kwargs)
+    return app
+
+
+def test_compression_middleware():
+    client = TestClient(app(encodings=['gzip']))
+    headers = {'Accept-Encoding': 'gzip'}
+
+    response = client.get('/large', headers=headers)
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert int(response.headers['content-length']) < 2000
+    assert response.content == b'x' * 2000
+
+    response = client.get('/large', headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in response.headers
+    assert int(response.headers['content-length']) == 2000
+
+    assert 'content-encoding' not in client.get(
+        '/small', headers=headers).headers
+
+    response = client.get('/stream', headers=headers)
+    assert response.headers['content-encoding'] == 'gzip'
+    assert 'content-length' not in response.headers
+    assert response.content == b'a' * 10 + b'b' * 10
+
+    # Precompressed responses aren't compressed twice
+    response = client.get('/encoded', headers=headers)
+    assert response.content == b'x' * 2000
+
+    assert 'content-encoding' not in client.get(
+        '/parquet', headers=headers).headers
+
+
+def test_compression_middleware_minimum_size():
+    client = TestClient(app(encodings=['gzip'], minimum_size=5))
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+
+
+def test_create_app_compression(tmp_path, monkeypatch):
+    import frictionless
+    from datarest._cfgfile import (
+        Compression, app_config, read_app_config, write_app_config)
+
+    monkeypatch.chdir(tmp_path)
+    resource = frictionless.describe([["id", "name"], [1, "red"]])
+    resource.schema.primary_key = ["id"]
+    resource.schema.custom['x_datarest_primary_key_info'] = {
+        'id_type': 'biz_key', 'id_src_fields': []}
+    resource.to_yaml('compressed_colors.yaml')
+    config = app_config('compressed_colors', connect_string='sqlite://')
+    config.datarest.fastapi.compression = Compression(minimum_size=100)
+    write_app_config('app.yaml', config)
+    # Import late, datarest._app_factory reads app.yaml on import
+    from datarest import _app_factory
+    from sqlmodel import SQLModel
+    app = _app_factory.create_app(read_app_config('app.yaml'))
+    try:
+        response = TestClient(app).get(
+            '/openapi.json', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['content-encoding'] == 'gzip'
+        assert '/compressed_colors/{item_id}' in response.json()['paths']
+    finally:
+        SQLModel.metadata.remove(
+            app.state.models['compressed_colors'].resource_model.__table__)
@@ -137,4 +137,113 @@ def test_filtering_sqlalchemy_crud_router(router):
             assert len(results) == len(data)
     
     finally:
-        os.remove("test.db")
\ No newline at end of file
+        os.remove("test.db")
+
+# range filter query params for ordered types
+def test_query_factory_range_params(model, query_params):
+
+    query = query_factory(model, query_params)
+
+    for op in ['gt', 'gte', 'lt', 'lte']:
+        assert hasattr(query, f'age__{op}')
+        assert not hasattr(query, f'name__{op}')
+
+
+def test_range_filters():
+    from sqlalchemy.pool import StaticPool
+    from sqlmodel import Session
+
+    data = [["id", "day", "amount"],
+            [1, "2023-01-01", "1.10"],
+            [2, "2023-02-01", "2.20"],
+            [3, "2023-03-01", "3.30"]]
+    resource = frictionless.describe(data)
+    resource.schema.primary_key.append("id")
+    resource.schema.custom['x_datarest_primary_key_info'] = {
+        'id_type': 'biz_key',
+        'id_src_fields': []
+        }
+    _, model = create_model_from_tableschema(
+        'RangeModel', resource.schema)
+
+    range_engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False},
+        poolclass=StaticPool)
+    model.__table__.create(range_engine)
+    resource = frictionless.Resource(data, schema=resource.schema)
+    with Session(range_engine) as session:
+        session.add_all(model(**row) for row in resource.read_rows())
+        session.commit()
+
+    def get_db():
+        with Session(range_engine) as session:
+            yield session
+
+    range_app = FastAPI()
+    range_app.include_router(FilteringSQLAlchemyCRUDRouter(
+        schema=model, db_model=model, db=get_db, prefix='range',
+        query_params=['day', 'amount'],
+        ))
+    client = TestClient(range_app)
+
+    response = client.get(
+        '/range', params={'day__gte': '2023-02-01', 'amount__lt': '3.3'})
+    assert response.status_code == 200
+    assert response.json() == [{'id': 2, 'day': '2023-02-01', 'amount': 2.2}]
+
+    response = client.get('/range', params={'day': ['2023-01-01']})
+    assert [item['id'] for item in response.json()] == [1]
+
+
+def test_dictionary_filters():
+    from sqlalchemy.pool import StaticPool
+    from sqlmodel import Session
+
+    data = [["id", "status"], [1, "open"], [2, "closed"], [3, "open"]]
+    resource = frictionless.describe(data)
+    resource.schema.primary_key.append("id")
+    resource.schema.custom['x_datarest_primary_key_info'] = {
+        'id_type': 'biz_key',
+        'id_src_fields': []
+        }
+    status = resource.schema.get_field('status')
+    status.constraints['enum'] = ['closed', 'open']
+    status.custom['x_datarest_dictionary'] = True
+    _, model = create_model_from_tableschema(
+        'DictionaryModel', resource.schema)
+
+    dictionary_engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False},
+        poolclass=StaticPool)
+    model.__table__.create(dictionary_engine)
+    with Session(dictionary_engine) as session:
+        session.add_all(
+            model(id=id_, status=status) for id_, status in data[1:])
+        session.commit()
+
+    def get_db():
+        with Session(dictionary_engine) as session:
+            yield session
+
+    dictionary_app = FastAPI()
+    dictionary_app.include_router(FilteringSQLAlchemyCRUDRouter(
+        schema=model, db_model=model, db=get_db, prefix='dictionary',
+        query_params=['status'],
+        ))
+    client = TestClient(dictionary_app)
+
+    response = client.get('/dictionary', params={'status': ['open']})
+    assert [item['id'] for item in response.json()] == [1, 3]
+    # Values not in the dictionary don't match anything
+    response = client.get(
+        '/dictionary', params={'status': ['unknown', 'closed']})
+    assert [item['id'] for item in response.json()] == [2]
+    response = client.get('/dictionary', params={'status': ['unknown']})
+    assert response.status_code == 200
+    assert response.json() == []
+    response = client.get(
+        '/dictionary', params={'status': ['unknown']},
+        headers={'Accept': 'text/csv'})
+    assert response.status_code == 200
+    # The header row only
+    assert len(response.text.splitlines()) == 1
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+import frictionless
+import sqlalchemy as sa
+
+from datarest import _data_loader
+from datarest._data_loader import load_resource, read_checkpoint, CheckpointMismatchError
+
+
+def create_resource(rows=25):
+    data = [["id", "name"]] + [[i, f"name{i}"] for i in range(rows)]
+    return frictionless.Resource(data)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    metadata = sa.MetaData()
+    sa.Table(
+        "test_table", metadata,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.Text),
+        )
+    metadata.create_all(engine)
+    return engine
+
+
+def count_rows(engine):
+    with engine.connect() as conn:
+        return conn.execute(sa.text("select count(*) from test_table")).scalar()
+
+
+def test_load_resource(engine):
+    loaded = load_resource(
+        create_resource(), engine, "test_table", "test.csv", batch_size=10)
+    assert loaded == 25
+    assert count_rows(engine) == 25
+    checkpoint = read_checkpoint(engine, "test_table")
+    # By real path
+    assert checkpoint.source == os.path.realpath("test.csv")
+    assert checkpoint.row_offset == 25
+    assert checkpoint.batch_rows == 5
+    assert checkpoint.complete
+
+    # nothing left to do for a complete load, also for the same data file
+    # given by another path
+    assert load_resource(
+        create_resource(), engine, "test_table", "./test.csv",
+        resume=True) == 0
+
+
+def test_load_resource_resume(engine, monkeypatch):
+    # Fail after the 2nd committed batch
+    write_checkpoint = _data_loader._write_checkpoint
+
+    def failing_write_checkpoint(conn, dbtable, **values):
+        write_checkpoint(conn, dbtable, **values)
+        if values.get('row_offset') == 20:
+            raise OSError("disk full")
+
+    monkeypatch.setattr(
+        _data_loader, "_write_checkpoint", failing_write_checkpoint)
+    with pytest.raises(OSError):
+        load_resource(
+            create_resource(), engine, "test_table", "test.csv",
+            batch_size=10)
+    # The failing batch is rolled back along with its checkpoint
+    assert count_rows(engine) == 10
+    assert read_checkpoint(engine, "test_table").row_offset == 10
+    monkeypatch.undo()
+
+    loaded = load_resource(
+        create_resource(), engine, "test_table", "test.csv", resume=True,
+        batch_size=10)
+    assert loaded == 15
+    assert count_rows(engine) == 25
+    assert read_checkpoint(engine, "test_table").complete
+
+
+def test_load_resource_resume_mismatch(engine):
+    load_resource(create_resource(), engine, "test_table", "test.csv",
+                  batch_size=10)
+    # Pretend the load stopped after the 1st batch
+    with engine.begin() as conn:
+        conn.execute(sa.text("delete from test_table where id >= 10"))
+        conn.execute(_data_loader.checkpoint_table.update().values(
+            row_offset=10, batch_rows=10, complete=False,
+            batch_hash=_data_loader.batch_hash(
+                [{"id": i, "name": f"name{i}"} for i in range(10)],
+                ["id", "name"])))
+
+    # different source
+    with pytest.raises(CheckpointMismatchError):
+        load_resource(
+            create_resource(), engine, "test_table", "other.csv",
+            resume=True)
+
+    # source data changed since the checkpoint
+    resource = frictionless.Resource(
+        [["id", "name"]] + [[i, "changed"] for i in range(25)])
+    with pytest.raises(CheckpointMismatchError):
+        load_resource(resource, engine, "test_table", "test.csv", resume=True)
+
+    # unchanged source data
+    assert load_resource(
+        create_resource(), engine, "test_table", "test.csv",
+        resume=True) == 15
+    assert count_rows(engine) == 25
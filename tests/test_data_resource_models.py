@@ -1,7 +1,9 @@
+import decimal
+
 import pytest
 import frictionless
 from sqlmodel import select
-from datarest._data_resource_models import create_model_from_tableschema
+from datarest._data_resource_models import create_model_from_tableschema, read_table_def, table_def_from_tableschema
 from sqlmodel.sql.sqltypes import AutoString
 
 
@@ -51,3 +53,169 @@ def test_create_model_from_tableschema(schema):
     assert robert.income == 1600.35
 
 
+def test_table_def_from_tableschema(schema):
+    table_def = table_def_from_tableschema(schema)
+    assert table_def['id_columns'] == ['id']
+    assert table_def['id_type'] == 'uuid4_base64'
+    assert table_def['id_src_fields'] == ['id']
+    assert [field['name'] for field in table_def['fields']] == [
+        'id', 'name', 'age', 'income']
+    assert table_def['fields'][2]['type'] == 'integer'
+
+
+def test_read_table_def_cache(schema, tmp_path, monkeypatch):
+    schema_path = str(tmp_path / 'test.yaml')
+    frictionless.Resource(data=[], schema=schema).to_yaml(schema_path)
+    cache_dir = tmp_path / 'cache'
+
+    table_def = read_table_def(schema_path, cache_dir=str(cache_dir))
+    assert table_def == table_def_from_tableschema(schema)
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # A cache hit doesn't need frictionless
+    def fail(*args, **kwargs):
+        raise AssertionError('frictionless used on cache hit')
+
+    monkeypatch.setattr(frictionless, 'Resource', fail)
+    assert read_table_def(schema_path, cache_dir=str(cache_dir)) == table_def
+
+    # A changed schema file is a cache miss
+    monkeypatch.undo()
+    schema.get_field('name').description = 'The name'
+    frictionless.Resource(data=[], schema=schema).to_yaml(schema_path)
+    table_def = read_table_def(schema_path, cache_dir=str(cache_dir))
+    assert table_def['fields'][1]['description'] == 'The name'
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_read_table_def_cache_schema_file(schema, tmp_path):
+    import yaml
+
+    schema_file = tmp_path / 'test.schema.yaml'
+    schema_file.write_text(yaml.safe_dump(schema.to_dict()))
+    resource_path = str(tmp_path / 'test.yaml')
+    (tmp_path / 'test.yaml').write_text(
+        yaml.safe_dump({'name': 'test', 'schema': 'test.schema.yaml'}))
+    cache_dir = str(tmp_path / 'cache')
+
+    table_def = read_table_def(resource_path, cache_dir=cache_dir)
+    assert list(table_def['schema_files']) == [str(schema_file)]
+    assert read_table_def(resource_path, cache_dir=cache_dir) == table_def
+
+    # A changed referenced schema file is a cache miss, too
+    schema.get_field('name').description = 'The name'
+    schema_file.write_text(yaml.safe_dump(schema.to_dict()))
+    table_def = read_table_def(resource_path, cache_dir=cache_dir)
+    assert table_def['fields'][1]['description'] == 'The name'
+
+
+def test_native_column_types():
+    import datetime
+
+    schema = frictionless.Schema.from_descriptor({
+        'fields': [
+            {'name': 'id', 'type': 'integer'},
+            {'name': 'day', 'type': 'date'},
+            {'name': 'moment', 'type': 'datetime'},
+            {'name': 'clock', 'type': 'time'},
+            {'name': 'vintage', 'type': 'year'},
+            {'name': 'amount', 'type': 'number'},
+            ],
+        'primaryKey': ['id'],
+        'x_datarest_primary_key_info': {
+            'id_type': 'biz_key', 'id_src_fields': []},
+        })
+    _, model = create_model_from_tableschema('NativeTypes', schema)
+    column_types = {
+        column.name: column.type.python_type
+        for column in model.__table__.columns}
+    assert column_types == {
+        'id': int,
+        'day': datetime.date,
+        'moment': datetime.datetime,
+        'clock': datetime.time,
+        'vintage': int,
+        'amount': float,
+        }
+
+
+def test_binary_id_column(schema):
+    from datarest._sqltypes import BinaryId
+
+    schema.custom['x_datarest_primary_key_info']['id_binary'] = True
+    table_def = table_def_from_tableschema(schema)
+    assert table_def['id_binary'] is True
+    _, model = create_model_from_tableschema('BinaryIdModel', schema)
+    assert isinstance(model.__table__.columns['id'].type, BinaryId)
+    assert model.__table__.columns['id'].type.python_type == str
+
+
+@pytest.mark.parametrize("precision, scale", [(18, 4), (24, 6)])
+def test_exact_decimal_column(precision, scale):
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateTable
+    from sqlmodel import Session, SQLModel, create_engine
+
+    schema = frictionless.Schema.from_descriptor({
+        'fields': [
+            {'name': 'id', 'type': 'integer'},
+            {'name': 'amount', 'type': 'number',
+             'x_datarest_precision': precision, 'x_datarest_scale': scale},
+            {'name': 'ratio', 'type': 'number'},
+            ],
+        'primaryKey': ['id'],
+        'x_datarest_primary_key_info': {
+            'id_type': 'biz_key', 'id_src_fields': []},
+        })
+    _, model = create_model_from_tableschema(
+        f'ExactDecimal{precision}', schema)
+    table = model.__table__
+    assert table.columns['amount'].type.python_type == decimal.Decimal
+    # Numbers without a precision stay floats
+    assert table.columns['ratio'].type.python_type == float
+    ddl = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+    assert f'NUMERIC({precision}, {scale})' in ddl
+
+    values = [
+        decimal.Decimal('0.01'), decimal.Decimal('-0.0003'),
+        decimal.Decimal('9' * (precision - scale) + '.' + '9' * scale),
+        decimal.Decimal('12345678901234.5678'),
+        ]
+    engine = create_engine('sqlite://')
+    try:
+        SQLModel.metadata.create_all(engine, tables=[table])
+        with Session(engine) as session:
+            for id_, value in enumerate(values):
+                session.add(model(id=id_, amount=value, ratio=0.5))
+            session.commit()
+        with Session(engine) as session:
+            rows = session.exec(select(model).order_by(model.id)).all()
+            assert [row.amount for row in rows] == values
+            assert session.exec(
+                select(model.id).where(model.amount > decimal.Decimal('0.005'))
+                .order_by(model.id)).all() == [0, 2, 3]
+    finally:
+        SQLModel.metadata.remove(table)
+
+    with pytest.raises(ValueError):
+        model.validate({'id': 9, 'amount': '0.' + '1' * (scale + 1)})
+
+
+def test_compact_integer_columns():
+    import sqlalchemy as sa
+
+    schema = frictionless.Schema.from_descriptor({
+        'fields': [
+            {'name': 'id', 'type': 'integer',
+             'constraints': {'minimum': 1, 'maximum': 100}},
+            {'name': 'qty', 'type': 'integer',
+             'constraints': {'minimum': 1, 'maximum': 100}},
+            ],
+        'primaryKey': ['id'],
+        'x_datarest_primary_key_info': {
+            'id_type': 'biz_key', 'id_src_fields': []},
+        })
+    _, model = create_model_from_tableschema('CompactIntegers', schema)
+    assert isinstance(model.__table__.columns['qty'].type, sa.SmallInteger)
+    # Primary keys keep their (autoincrementing) INTEGER type
+    assert type(model.__table__.columns['id'].type) is sa.Integer
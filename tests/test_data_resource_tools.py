@@ -2,6 +2,8 @@ import pytest
 from frictionless import Schema, Resource, fields, describe, steps, transform, Pipeline
 
 from datarest._data_resource_tools import add_attr, add_descriptions, add_examples,  identifier_field_name, composite_id_step
+from datarest._data_resource_tools import find_duplicate_ids, dedup_step, DuplicateIdEnum
+from datarest._data_resource_tools import field_stats, add_storage_constraints
 from datarest.cli import _dict_from
 from datarest._resource_ids import IdEnum, id_type_funcs
 
@@ -167,3 +169,70 @@ def test_composite_id_step():
     # ????
 
 
+@pytest.fixture
+def duplicates_resource():
+    data = [["id", "name"],
+        [1, "red"],
+        [2, "green"],
+        [1, "blue"],
+        [3, "black"],
+        [1, "white"],
+        [2, "yellow"]]
+    return describe(data)
+
+
+def test_find_duplicate_ids(duplicates_resource):
+    duplicates = find_duplicate_ids(duplicates_resource, id_field_name="id")
+    assert duplicates
+    assert duplicates.count == 3
+    # row numbers of the repeated ids, the header is row 1
+    assert duplicates.rows == {1: [4, 6], 2: [7]}
+    assert "3 duplicate id value(s) for 2 ID(s)" in str(duplicates)
+
+    assert not find_duplicate_ids(duplicates_resource, id_field_name="name")
+
+
+@pytest.mark.parametrize("policy, expected", [
+    (DuplicateIdEnum.skip,
+     [[1, "red"], [2, "green"], [3, "black"]]),
+    (DuplicateIdEnum.last_wins,
+     [[3, "black"], [1, "white"], [2, "yellow"]]),
+    ])
+def test_dedup_step(duplicates_resource, policy, expected):
+    duplicates = find_duplicate_ids(duplicates_resource, id_field_name="id")
+    step = dedup_step(duplicates, policy)
+    deduped = transform(duplicates_resource, steps=[step()])
+    assert [row.to_list() for row in deduped.read_rows()] == expected
+
+
+def test_dedup_step_fail_policy(duplicates_resource):
+    duplicates = find_duplicate_ids(duplicates_resource, id_field_name="id")
+    with pytest.raises(ValueError):
+        dedup_step(duplicates, DuplicateIdEnum.fail)
+
+
+def test_storage_constraints():
+    resource = describe(
+        [["id", "status", "qty"],
+         [1, "open", 5],
+         [2, "closed", 700],
+         [3, "open", None],
+         [4, "open", 2]])
+    resource.schema.primary_key = ["id"]
+    stats = field_stats(resource, max_distinct=2)
+    assert stats["qty"].minimum == 2
+    assert stats["qty"].maximum == 700
+    assert stats["status"].values == {"open", "closed"}
+    assert stats["status"].max_length == 6
+
+    add_storage_constraints(resource, stats, dictionary_max=2)
+    qty = resource.schema.get_field("qty")
+    assert qty.constraints == {"minimum": 2, "maximum": 700}
+    # integer primary keys are not narrowed
+    assert resource.schema.get_field("id").constraints == {}
+    status = resource.schema.get_field("status")
+    assert status.constraints["maxLength"] == 6
+    assert status.constraints["enum"] == ["closed", "open"]
+    assert status.custom["x_datarest_dictionary"] is True
+    # too many distinct values for a dictionary
+    assert field_stats(resource, max_distinct=1)["status"].values is None
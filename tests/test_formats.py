@@ -0,0 +1,156 @@
+import csv
+import datetime
+import io
+
+import frictionless
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from datarest._cfgfile import app_config, read_app_config, write_app_config
+from datarest._formats import csv_stream, negotiate
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, None),
+    ('application/json', None),
+    ('text/csv', 'csv'),
+    ('text/csv;q=0.5, application/json', None),
+    ('application/json;q=0.5, text/csv', 'csv'),
+    ('application/vnd.apache.arrow.stream', 'arrow'),
+    ('application/x-parquet, */*;q=0.1', 'parquet'),
+    ('text/html, text/csv', 'csv'),
+    ('text/csv;q=0', None),
+    ])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def test_csv_stream():
+    class Column:
+        def __init__(self, name):
+            self.name = name
+
+    rows = [
+        (1, 'red', True, datetime.date(2024, 1, 31)),
+        (2, None, False, None),
+        (3, 'a, "b"', None, None),
+        ]
+    chunks = list(csv_stream(
+        [Column(name) for name in ['id', 'name', 'ok', 'day']], rows,
+        batch_size=2))
+    assert len(chunks) == 2
+    assert b''.join(chunks).decode() == (
+        'id,name,ok,day\r\n'
+        '1,red,true,2024-01-31\r\n'
+        '2,,false,\r\n'
+        '3,"a, ""b""",,\r\n')
+    assert list(csv_stream([Column('id')], [])) == [b'id\r\n']
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    resource = frictionless.describe(
+        [["id", "name", "score"], [1, "red", 2.5], [2, "green", 3.5],
+         [3, "blue", 1.0]])
+    resource.schema.primary_key = ["id"]
+    resource.schema.custom['x_datarest_primary_key_info'] = {
+        'id_type': 'biz_key', 'id_src_fields': []}
+    resource.to_yaml('format_colors.yaml')
+    write_app_config('app.yaml', app_config(
+        'format_colors', connect_string='sqlite://',
+        expose_routes=['get_all'], query_params=['name']))
+    # Import late, datarest._app_factory reads app.yaml on import
+    from datarest import _app_factory, _database
+    app = _app_factory.create_app(read_app_config('app.yaml'))
+    engine = create_engine(
+        'sqlite://', connect_args={'check_same_thread': False},
+        poolclass=StaticPool)
+    model = app.state.models['format_colors'].resource_model
+    SQLModel.metadata.create_all(engine, tables=[model.__table__])
+    with Session(engine) as session:
+        session.add_all([
+            model(id=1, name='red', score=2.5),
+            model(id=2, name='green', score=3.5),
+            model(id=3, name='blue', score=1.0),
+            ])
+        session.commit()
+
+    def get_db():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[_database.get_db] = get_db
+    yield TestClient(app)
+    SQLModel.metadata.remove(model.__table__)
+
+
+def test_get_all_csv(client):
+    response = client.get('/format_colors', headers={'Accept': 'text/csv'})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/csv')
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ['id', 'name', 'score']
+    assert [row[1] for row in rows[1:]] == ['red', 'green', 'blue']
+
+    # filters + pagination apply
+    response = client.get(
+        '/format_colors?name=green&name=blue&limit=1',
+        headers={'Accept': 'text/csv'})
+    assert list(csv.reader(io.StringIO(response.text)))[1][1] == 'green'
+
+    # JSON stays the default
+    assert client.get('/format_colors').json()[0]['name'] == 'red'
+
+    content = client.get('/openapi.json').json()['paths'][
+        '/format_colors']['get']['responses']['200']['content']
+    assert 'text/csv' in content
+    assert 'application/json' in content
+
+
+def test_get_all_csv_own_connection(client):
+    # The rows are streamed from an own connection, not from the request's
+    # session, which may be closed before the response is sent (FastAPI
+    # 0.106+ closes yield dependencies before)
+    from datarest import _database
+    app = client.app
+    get_db = app.dependency_overrides[_database.get_db]
+    sessions = []
+
+    def get_db_once():
+        session = next(get_db())
+        sessions.append(session)
+        return session
+
+    app.dependency_overrides[_database.get_db] = get_db_once
+    response = client.get('/format_colors', headers={'Accept': 'text/csv'})
+    assert len(list(csv.reader(io.StringIO(response.text)))) == 4
+    [session] = sessions
+    assert not session.in_transaction()
+
+
+def test_get_all_arrow(client):
+    pa = pytest.importorskip('pyarrow')
+    response = client.get(
+        '/format_colors',
+        headers={'Accept': 'application/vnd.apache.arrow.stream'})
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column('name').to_pylist() == ['red', 'green', 'blue']
+
+    pq = pytest.importorskip('pyarrow.parquet')
+    response = client.get(
+        '/format_colors', headers={'Accept': 'application/vnd.apache.parquet'})
+    table = pq.read_table(pa.BufferReader(response.content))
+    assert table.column('id').to_pylist() == [1, 2, 3]
+
+
+def test_get_all_arrow_unavailable(client, monkeypatch):
+    from datarest import _formats
+    monkeypatch.setattr(_formats, 'pyarrow_available', lambda: False)
+    response = client.get(
+        '/format_colors',
+        headers={'Accept': 'application/vnd.apache.arrow.stream'})
+    assert response.status_code == 406
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import pytest
+
+from datarest._cfgfile import app_config
+
+
+# Modules the serving path must not import, to keep cold start and per-worker
+# memory low.
+init_only_modules = [
+    'frictionless',
+    'datarest._data_resource_tools',
+    'datarest._data_loader',
+    ]
+
+
+def imported_modules(statement, cwd):
+    """Return the set of modules imported by executing statement in a fresh
+    interpreter.
+    """
+    output = subprocess.run(
+        [sys.executable, '-c',
+         f'import sys; {statement}; print("\\n".join(sys.modules))'],
+        cwd=cwd, check=True, capture_output=True, text=True,
+        ).stdout
+    return set(output.split())
+
+
+@pytest.fixture
+def project_dir(make_project):
+    return make_project(
+        {'colors': [["id", "name"], [1, "red"], [2, "green"]]},
+        app_config('colors', connect_string='sqlite:///app.db'))
+
+
+def test_cli_import_budget(project_dir):
+    modules = imported_modules('import datarest.cli', cwd=project_dir)
+    for module in init_only_modules + ['sqlmodel', 'datarest._models']:
+        assert module not in modules
+
+
+def test_app_import_budget(project_dir):
+    modules = imported_modules('import datarest._app', cwd=project_dir)
+    assert 'datarest._app' in modules
+    for module in init_only_modules:
+        assert module not in modules
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+import pytest
+from jose import JWTError
+
+from datarest._cfgfile import Jwt
+from datarest._jwt import (
+    JwtKeys, create_access_token, decode_access_token, keys_configured,
+    parse_keys)
+
+
+def test_parse_keys():
+    assert parse_keys('new=s3cret, old=0ld=') == {
+        'new': 's3cret', 'old': '0ld='}
+    assert parse_keys('') == {}
+    with pytest.raises(ValueError):
+        parse_keys('nokey')
+
+
+def test_access_token():
+    keys = JwtKeys({'k1': 'secret1'})
+    token = create_access_token({'sub': 'alice'}, keys)
+    assert decode_access_token(token, keys).username == 'alice'
+
+    expired = create_access_token(
+        {'sub': 'alice'}, keys, expires_delta=timedelta(seconds=-1))
+    with pytest.raises(JWTError):
+        decode_access_token(expired, keys)
+
+    # Signed with another secret under the same key id
+    with pytest.raises(JWTError):
+        decode_access_token(token, JwtKeys({'k1': 'other'}))
+
+
+def test_key_rotation():
+    old_keys = JwtKeys({'k1': 'secret1'})
+    old_token = create_access_token({'sub': 'alice'}, old_keys)
+
+    # The new key signs, the old key still verifies
+    rotated_keys = JwtKeys({'k2': 'secret2', 'k1': 'secret1'})
+    new_token = create_access_token({'sub': 'bob'}, rotated_keys)
+    assert decode_access_token(old_token, rotated_keys).username == 'alice'
+    assert decode_access_token(new_token, rotated_keys).username == 'bob'
+
+    # Dropped key
+    with pytest.raises(JWTError):
+        decode_access_token(old_token, JwtKeys({'k2': 'secret2'}))
+
+
+def test_keys_from_config(monkeypatch):
+    monkeypatch.delenv('DATAREST_JWT_KEYS', raising=False)
+    jwt_config = Jwt(keys={'cfg': 'secret'})
+    assert keys_configured(jwt_config)
+    assert JwtKeys.from_config(jwt_config).signing_kid == 'cfg'
+
+    monkeypatch.setenv('DATAREST_JWT_KEYS', 'env=secret')
+    assert JwtKeys.from_config(jwt_config).keys == {'env': 'secret'}
+
+    monkeypatch.delenv('DATAREST_JWT_KEYS')
+    assert not keys_configured(Jwt())
+    # A random key, the same for all JwtKeys of this process
+    assert JwtKeys.from_config(Jwt()).keys == JwtKeys.from_config(Jwt()).keys
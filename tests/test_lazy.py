@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from datarest._cfgfile import (
+    Lazy, Openapi, app_config, read_app_config)
+
+
+@pytest.fixture
+def client(make_project):
+    config = app_config(
+        ['lazy_colors', 'lazy_sizes'], connect_string='sqlite://',
+        expose_routes=['get_all', 'get_one'])
+    config.datarest.fastapi.lazy = Lazy(max_warm_tables=1)
+    make_project({
+        'lazy_colors': [["id", "name"], [1, "red"]],
+        'lazy_sizes': [["id", "size"], [1, "big"]],
+        }, config)
+    # Import late, datarest._app_factory reads app.yaml on import
+    from datarest import _app_factory, _database
+    app = _app_factory.create_app(read_app_config('app.yaml'))
+
+    engine = create_engine(
+        'sqlite://', connect_args={'check_same_thread': False},
+        poolclass=StaticPool)
+
+    def get_db():
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[_database.get_db] = get_db
+    yield TestClient(app)
+    app.state.tables.clear()
+
+
+def test_lazy_tables(client):
+    tables = client.app.state.tables
+    assert not tables.warm
+    assert set(client.app.state.models) == {'lazy_colors', 'lazy_sizes'}
+
+    response = client.get('/lazy_colors')
+    assert response.status_code == 200
+    assert response.json() == []
+    assert list(tables.warm) == ['lazy_colors']
+    assert client.get('/lazy_colors/1').status_code == 404
+    assert client.get('/lazy_colors/').status_code == 200
+    assert client.delete('/lazy_colors').status_code == 405
+
+    # Only max_warm_tables are kept built
+    assert client.get('/lazy_sizes').status_code == 200
+    assert list(tables.warm) == ['lazy_sizes']
+    assert client.get('/lazy_colors').status_code == 200
+    assert list(tables.warm) == ['lazy_colors']
+
+    assert client.get('/lazy_nothing').status_code == 404
+
+
+def test_lazy_openapi(client):
+    doc = client.get('/openapi/lazy_sizes.json').json()
+    assert set(doc['paths']) == {'/lazy_sizes', '/lazy_sizes/{item_id}'}
+    assert client.get('/openapi/lazy_nothing.json').status_code == 404
+    assert client.get('/docs/lazy_sizes').status_code == 200
+
+    doc = client.get('/openapi.json').json()
+    assert set(doc['paths']) == {
+        '/lazy_colors', '/lazy_colors/{item_id}',
+        '/lazy_sizes', '/lazy_sizes/{item_id}',
+        }
+
+
+def test_lazy_precomputed_openapi(make_project):
+    config = app_config('lazy_colors', connect_string='sqlite://')
+    config.datarest.fastapi.lazy = Lazy(max_warm_tables=1)
+    config.datarest.fastapi.openapi = Openapi()
+    make_project({'lazy_colors': [["id", "name"], [1, "red"]]}, config)
+    from datarest import _app_factory
+    app = _app_factory.create_app(read_app_config('app.yaml'))
+    try:
+        # Not built at startup, that would build all the datatables
+        assert not app.state.tables.warm
+        doc = TestClient(app).get('/openapi.json').json()
+        assert set(doc['paths']) == {'/lazy_colors/{item_id}'}
+    finally:
+        app.state.tables.clear()
+
+
+def test_lazy_tables_build_locking():
+    from datarest._lazy import LazyTables
+
+    class Table:
+        model = None
+
+    building = threading.Event()
+    release = threading.Event()
+
+    def build_table(model_name, model_def):
+        if model_name == 'slow':
+            building.set()
+            assert release.wait(timeout=10)
+        return Table()
+
+    tables = LazyTables(
+        build_table, {'fast': None, 'slow': None}, max_warm=2)
+    tables._drop_table = lambda table: None
+    fast = tables.get('fast')
+    results = []
+    slow_builds = [
+        threading.Thread(target=lambda: results.append(tables.get('slow')))
+        for _ in range(2)]
+    for thread in slow_builds:
+        thread.start()
+    assert building.wait(timeout=10)
+    # Built datatables are served while another one is built
+    fast_gets = []
+    fast_get = threading.Thread(
+        target=lambda: fast_gets.append(tables.get('fast')))
+    fast_get.start()
+    fast_get.join(timeout=5)
+    release.set()
+    assert fast_gets == [fast]
+    for thread in slow_builds:
+        thread.join(timeout=10)
+    # Built once
+    assert results[0] is results[1] is tables.get('slow')
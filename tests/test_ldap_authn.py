@@ -45,3 +45,47 @@ def test_create_ldap_auth_instance():
 
     
 
+@pytest.fixture
+def pooled_auth():
+    import ldap3
+
+    auth = LDAPAuth(
+        "uid={uid},ou=users,dc=example,dc=com", "mock-server", pool_size=2,
+        client_strategy=ldap3.MOCK_SYNC)
+    # Local LDAP stand-in: the entries of a mock server's directory
+    directory = ldap3.Connection(
+        auth.server, client_strategy=ldap3.MOCK_SYNC)
+    directory.strategy.add_entry(
+        "uid=alice,ou=users,dc=example,dc=com",
+        {"uid": "alice", "userPassword": "secret", "objectClass": "person"})
+    yield auth
+    auth.close()
+
+
+def test_pooled_authentication(pooled_auth):
+    assert pooled_auth.authenticate("alice", "secret") == \
+        "dn:uid=alice,ou=users,dc=example,dc=com"
+    conn = pooled_auth._pool[0][0]
+    # the connection is reused, also after failures
+    with pytest.raises(InvalidCredentialsError):
+        pooled_auth.authenticate("alice", "wrong")
+    with pytest.raises(InvalidCredentialsError):
+        pooled_auth.authenticate("alice", "")
+    pooled_auth.authenticate("alice", "secret")
+    assert [pooled[0] for pooled in pooled_auth._pool] == [conn]
+
+
+def test_pooled_authentication_reconnects(pooled_auth):
+    pooled_auth.authenticate("alice", "secret")
+    conn = pooled_auth._pool[0][0]
+
+    # closed connection
+    conn.unbind()
+    pooled_auth.authenticate("alice", "secret")
+    assert pooled_auth._pool[0][0] is not conn
+    conn = pooled_auth._pool[0][0]
+
+    # idle for too long
+    pooled_auth.max_idle = 0
+    pooled_auth.authenticate("alice", "secret")
+    assert pooled_auth._pool[0][0] is not conn
@@ -0,0 +1,189 @@
+import glob
+import json
+import os
+
+import frictionless
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from datarest._cfgfile import (
+    Metrics, app_config, read_app_config, write_app_config)
+from datarest._metrics import (
+    MetricsDir, Registry, TimedAuth, expose, instrument_engine, merge)
+
+
+def test_expose():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests', ['route'])
+    requests.inc(route='/a')
+    requests.inc(2, route='/a')
+    requests.inc(route='/b"')
+    latency = registry.histogram(
+        'latency_seconds', 'Latency', buckets=[0.1, 1])
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    registry.gauge('size', 'Size').set(3)
+
+    assert expose(merge([registry.snapshot()])) == (
+        '# HELP latency_seconds Latency\n'
+        '# TYPE latency_seconds histogram\n'
+        'latency_seconds_bucket{le="0.1"} 1\n'
+        'latency_seconds_bucket{le="1"} 2\n'
+        'latency_seconds_bucket{le="+Inf"} 3\n'
+        'latency_seconds_sum 5.55\n'
+        'latency_seconds_count 3\n'
+        '# HELP requests_total Requests\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{route="/a"} 3\n'
+        'requests_total{route="/b\\""} 1\n'
+        '# HELP size Size\n'
+        '# TYPE size gauge\n'
+        'size 3\n')
+
+
+def test_metrics_dir(tmp_path):
+    registry = Registry()
+    registry.counter('requests_total', 'Requests').inc()
+    registry.gauge('size', 'Size').set(3)
+    metrics_dir = MetricsDir(str(tmp_path), registry, flush_interval=60)
+    assert metrics_dir.flush() is not None
+    # At most every flush_interval seconds
+    assert metrics_dir.flush() is None
+
+    def exited_worker(pid, requests):
+        other = Registry()
+        other.counter('requests_total', 'Requests').inc(requests)
+        other.gauge('size', 'Size').set(5)
+        snapshot = dict(other.snapshot(), pid=pid)
+        with open(tmp_path / f'metrics-{pid}-{pid:032x}.json',
+                  'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+
+    exited_worker(2 ** 22 + 1, 2)
+    merged = merge(metrics_dir.snapshots())
+    assert merged['requests_total']['samples'] == {(): 3}
+    # Gauges of exited workers don't count
+    assert merged['size']['samples'] == {(): 3}
+    own_files = glob.glob(str(tmp_path / f'metrics-{os.getpid()}-*.json'))
+    assert len(own_files) == 1
+
+    # Exited workers are folded into the archive, also with reused pids
+    assert not glob.glob(str(tmp_path / f'metrics-{2 ** 22 + 1}-*.json'))
+    exited_worker(2 ** 22 + 1, 4)
+    merged = merge(metrics_dir.snapshots())
+    assert merged['requests_total']['samples'] == {(): 7}
+    assert merge(metrics_dir.snapshots()) == merged
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ['.lock', 'archived.json', os.path.basename(own_files[0])])
+
+
+def test_timed_auth():
+    class Backend:
+        def authenticate(self, username, password):
+            if password == 'error':
+                raise OSError
+            if password != 'secret':
+                raise KeyError
+            return username
+
+    from datarest import _metrics
+    _metrics.LDAP_AUTHENTICATION_DURATION.clear()
+    auth = TimedAuth(Backend(), invalid_error=KeyError)
+    assert auth.authenticate('alice', 'secret') == 'alice'
+    with pytest.raises(KeyError):
+        auth.authenticate('alice', 'wrong')
+    with pytest.raises(OSError):
+        auth.authenticate('alice', 'error')
+    samples = {
+        tuple(labels): value[0]
+        for labels, value in _metrics.LDAP_AUTHENTICATION_DURATION.samples()}
+    assert sorted(samples) == [('error', ), ('invalid', ), ('success', )]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    resource = frictionless.describe(
+        [["id", "name"], [1, "red"], [2, "green"]])
+    resource.schema.primary_key = ["id"]
+    resource.schema.custom['x_datarest_primary_key_info'] = {
+        'id_type': 'biz_key', 'id_src_fields': []}
+    resource.to_yaml('metric_colors.yaml')
+    config = app_config(
+        'metric_colors', connect_string='sqlite://',
+        expose_routes=['get_all', 'get_one'])
+    config.datarest.fastapi.metrics = Metrics(authn=False)
+    write_app_config('app.yaml', config)
+    # Import late, datarest._app_factory reads app.yaml on import
+    from datarest import _app_factory, _database
+    app = _app_factory.create_app(read_app_config('app.yaml'))
+    engine = create_engine(
+        'sqlite://', connect_args={'check_same_thread': False},
+        poolclass=StaticPool)
+    instrument_engine(engine)
+    model = app.state.models['metric_colors'].resource_model
+    SQLModel.metadata.create_all(engine, tables=[model.__table__])
+    with Session(engine) as session:
+        session.add_all([model(id=1, name='red'), model(id=2, name='green')])
+        session.commit()
+
+    def get_db():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[_database.get_db] = get_db
+    yield TestClient(app)
+    SQLModel.metadata.remove(model.__table__)
+
+
+def test_metrics_endpoint(client):
+    assert client.get('/metric_colors').status_code == 200
+    assert client.get(
+        '/metric_colors', headers={'Accept': 'text/csv'}).status_code == 200
+    assert client.get('/metric_colors/1').status_code == 200
+    assert client.get('/metric_colors/3').status_code == 404
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'] == (
+        'text/plain; version=0.0.4; charset=utf-8')
+    lines = response.text.splitlines()
+
+    def value(sample):
+        return [float(line.rsplit(' ', 1)[1]) for line in lines
+                if line.rsplit(' ', 1)[0] == sample]
+
+    assert value(
+        'datarest_http_requests_total{table="metric_colors",'
+        'route="/metric_colors",method="GET",status="200"}') == [2]
+    assert value(
+        'datarest_http_requests_total{table="metric_colors",'
+        'route="/metric_colors/{item_id}",method="GET",status="404"}') == [1]
+    # JSON + CSV, 2 rows each
+    assert value(
+        'datarest_rows_returned_sum{table="metric_colors",'
+        'route="/metric_colors"}') == [4]
+    assert value(
+        'datarest_db_statement_duration_seconds_count{table="metric_colors",'
+        'statement="SELECT"}')[0] >= 4
+    assert value('datarest_db_pool_checkout_seconds_count')[0] >= 4
+    assert value(
+        'datarest_http_response_size_bytes_count{table="metric_colors",'
+        'route="/metric_colors"}') == [2]
+    assert '/metrics' not in client.get('/openapi.json').json()['paths']
+
+
+def test_pool_checkout_after_dispose():
+    from datarest import _metrics
+    engine = create_engine('sqlite://')
+    instrument_engine(engine)
+    # As in the forked worker processes
+    engine.dispose(close=False)
+    _metrics.DB_POOL_CHECKOUT_DURATION.clear()
+    with engine.connect():
+        pass
+    [[_, [counts, _]]] = _metrics.DB_POOL_CHECKOUT_DURATION.samples()
+    assert sum(counts) == 1
@@ -0,0 +1,113 @@
+import gzip
+import json
+
+import pytest
+import yaml
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel
+
+from datarest._cfgfile import (
+    Openapi, app_config, read_app_config)
+from datarest._openapi import (
+    openapi_cache_key, split_by_tag, strip_examples, tags)
+
+
+doc = {
+    'openapi': '3.0.2',
+    'info': {'title': 'test', 'version': '0.1.0'},
+    'paths': {
+        '/a': {'get': {'tags': ['A'], 'responses': {'200': {'content': {
+            'application/json': {
+                'schema': {'$ref': '#/components/schemas/A'}}}}}}},
+        '/b': {'get': {'tags': ['B'], 'responses': {'200': {'content': {
+            'application/json': {
+                'schema': {'$ref': '#/components/schemas/B'}}}}}}},
+        },
+    'components': {'schemas': {
+        'A': {'properties': {
+            'name': {'type': 'string', 'example': 'red'},
+            'sub': {'$ref': '#/components/schemas/Sub'},
+            }},
+        'B': {'properties': {'size': {'type': 'integer', 'example': 1}}},
+        'Sub': {'properties': {}},
+        }},
+    }
+
+
+def test_split_by_tag():
+    assert tags(doc) == ['A', 'B']
+    a_doc = split_by_tag(doc, 'A')
+    assert list(a_doc['paths']) == ['/a']
+    assert list(a_doc['components']['schemas']) == ['A', 'Sub']
+    assert a_doc['info'] == doc['info']
+
+
+def test_strip_examples():
+    stripped = strip_examples(json.loads(json.dumps(doc)))
+    assert 'example' not in (
+        stripped['components']['schemas']['A']['properties']['name'])
+
+
+@pytest.fixture
+def project_dir(make_project):
+    config = app_config('openapi_colors', connect_string='sqlite://')
+    config.datarest.fastapi.openapi = Openapi(split_tags=True)
+    return make_project(
+        {'openapi_colors': [["id", "name"], [1, "red"]]}, config)
+
+
+def test_precomputed_openapi(project_dir):
+    # Import late, datarest._app_factory reads app.yaml on import
+    from datarest._app_factory import create_app
+    app = create_app(read_app_config('app.yaml'))
+    cache_path = project_dir / 'app.openapi.json.gz'
+    cached = json.loads(gzip.decompress(cache_path.read_bytes()))
+    assert '/openapi_colors/{item_id}' in cached['openapi']['paths']
+
+    client = TestClient(app)
+    response = client.get('/openapi.json')
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.json() == cached['openapi']
+    etag = response.headers['etag']
+    response = client.get('/openapi.json', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    response = client.get('/openapi/tags/Openapi_colors.json')
+    assert list(response.json()['paths']) == ['/openapi_colors/{item_id}']
+    assert client.get('/openapi/tags/nothing.json').status_code == 404
+    assert 'openapi/tags/Openapi_colors.json' in client.get('/docs').text
+    assert client.get('/redoc').status_code == 200
+
+    # The cached document is used for a new app
+    cached['openapi']['info']['title'] = 'From cache'
+    cache_path.write_bytes(gzip.compress(json.dumps(cached).encode()))
+    SQLModel.metadata.remove(
+        app.state.models['openapi_colors'].resource_model.__table__)
+    app = create_app(read_app_config('app.yaml'))
+    response = TestClient(app).get('/openapi.json')
+    assert response.json()['info']['title'] == 'From cache'
+
+
+def test_openapi_cache_key(project_dir):
+    config = read_app_config('app.yaml')
+    key = openapi_cache_key(config, 'app.yaml')
+    assert openapi_cache_key(config, 'app.yaml') == key
+
+    # Changes of a schema file referenced by the data resource change the key
+    resource_path = project_dir / 'openapi_colors.yaml'
+    descriptor = yaml.safe_load(resource_path.read_text())
+    schema = descriptor['schema']
+    descriptor['schema'] = 'openapi_colors.schema.yaml'
+    resource_path.write_text(yaml.safe_dump(descriptor))
+    schema_path = project_dir / 'openapi_colors.schema.yaml'
+    schema_path.write_text(yaml.safe_dump(schema))
+    key = openapi_cache_key(config, 'app.yaml')
+    schema['fields'][1]['description'] = 'Color name'
+    schema_path.write_text(yaml.safe_dump(schema))
+    assert openapi_cache_key(config, 'app.yaml') != key
+
+    # Schemas that aren't local files aren't cached
+    config.datarest.datatables.openapi_colors.schema_ = (
+        'https://example.com/colors.yaml')
+    assert openapi_cache_key(config, 'app.yaml') is None
@@ -0,0 +1,122 @@
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+from datarest._cfgfile import app_config
+
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, 'fork'), reason='Preforking needs os.fork()')
+
+
+@pytest.fixture
+def project_dir(make_project):
+    return make_project(
+        {'colors': [["id", "name"], [1, "red"], [2, "green"]]},
+        app_config('colors', connect_string='sqlite:///app.db'))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(predicate, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(0.1)
+    raise TimeoutError()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status
+    except OSError:
+        return None
+
+
+def test_serve(project_dir, tmp_path):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}/openapi.json'
+    log_path = tmp_path / 'serve.log'
+    with open(log_path, 'w') as log:
+        server = subprocess.Popen(
+            [sys.executable, '-c',
+             'from datarest import _prefork; '
+             f'_prefork.serve(port={port}, workers=2)'],
+            cwd=project_dir, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        assert wait_for(lambda: get(url)) == 200
+
+        def worker_pids():
+            pids = re.findall(
+                r'Started worker process \[(\d+)\]', log_path.read_text())
+            return [int(pid) for pid in pids]
+
+        pids = wait_for(lambda: len(worker_pids()) >= 2 and worker_pids())
+        assert len(pids) == 2
+
+        # A dying worker gets replaced
+        os.kill(pids[0], signal.SIGKILL)
+        wait_for(lambda: len(worker_pids()) == 3)
+        assert wait_for(lambda: get(url)) == 200
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=20) == 0
+    assert 'restarting' in log_path.read_text()
+
+
+def test_restart_delays(monkeypatch):
+    from datarest import _prefork
+    monkeypatch.setattr(_prefork, 'RESTART_DELAY', 1.0)
+    monkeypatch.setattr(_prefork, 'MAX_RESTART_DELAY', 3.0)
+    monkeypatch.setattr(_prefork, 'MIN_UPTIME', 10.0)
+    monkeypatch.setattr(_prefork, 'MAX_FAST_FAILURES', 4)
+    now = 0.0
+    restarts = _prefork._Restarts(clock=lambda: now)
+
+    def died_after(uptime):
+        nonlocal now
+        restarts.start(1)
+        now += uptime
+        return restarts.delay(1)
+
+    # Consecutive fast failures back off up to the max delay
+    assert [died_after(1) for _ in range(3)] == [1.0, 2.0, 3.0]
+    # A worker that ran long enough resets the backoff
+    assert died_after(60) == 0.0
+    assert [died_after(1) for _ in range(3)] == [1.0, 2.0, 3.0]
+    # Serving is given up after MAX_FAST_FAILURES fast failures in a row
+    assert died_after(1) is None
+
+
+def test_serve_gives_up(project_dir, tmp_path):
+    log_path = tmp_path / 'serve.log'
+    with open(log_path, 'w') as log:
+        server = subprocess.Popen(
+            [sys.executable, '-c',
+             'from datarest import _prefork; '
+             '_prefork.RESTART_DELAY = 0.01; '
+             '_prefork._run_worker = lambda config, sock: 1 / 0; '
+             f'_prefork.serve(port={free_port()}, workers=2)'],
+            cwd=project_dir, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        assert server.wait(timeout=20) != 0
+    finally:
+        server.kill()
+    log_text = log_path.read_text()
+    assert 'restarting in' in log_text
+    assert 'giving up' in log_text
+    assert 'Worker processes keep failing' in log_text
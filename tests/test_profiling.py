@@ -0,0 +1,73 @@
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+from datarest._cfgfile import Lazy, Openapi, app_config, write_app_config
+from datarest._profiling import StartupProfile, import_times
+
+
+def test_startup_profile_phases():
+    profile = StartupProfile()
+    with profile.phase('config parse'):
+        pass
+    for table in ['colors', 'countries']:
+        with profile.phase('model creation', table):
+            time.sleep(0.01 if table == 'countries' else 0)
+        with profile.phase('router creation', table):
+            pass
+
+    assert [timing.name for timing in profile.phases] == [
+        'config parse', 'model creation', 'router creation',
+        'model creation', 'router creation']
+    assert list(profile.phase_totals()) == [
+        'config parse', 'model creation', 'router creation']
+    # slowest table first
+    assert list(profile.table_totals()) == ['countries', 'colors']
+
+    report = profile.report()
+    assert 'model creation' in report
+    assert 'Slowest tables (of 2)' in report
+
+
+def test_import_times():
+    timings = import_times(modules=['json'])
+    modules = [timing.module for timing in timings]
+    assert 'json' in modules
+    json_timing = timings[modules.index('json')]
+    assert json_timing.cumulative_seconds >= json_timing.self_seconds > 0
+
+
+@pytest.mark.parametrize("openapi, lazy, openapi_phases", [
+    (False, False, 1),
+    # Timed by create_app() only
+    (True, False, 1),
+    # Would build all the lazy datatables
+    (False, True, 0),
+    ])
+def test_profile_startup(make_project, openapi, lazy, openapi_phases):
+    config = app_config('profiled_colors', connect_string='sqlite://')
+    if openapi:
+        config.datarest.fastapi.openapi = Openapi()
+    if lazy:
+        config.datarest.fastapi.lazy = Lazy()
+    project_dir = make_project(
+        {'profiled_colors': [["id", "name"], [1, "red"]]})
+    # Not the default app.yaml
+    write_app_config(project_dir / 'other.yaml', config)
+
+    # In a fresh interpreter, the app modules read the config on import
+    completed = subprocess.run(
+        [sys.executable, '-c',
+         'import json; '
+         'from datarest._profiling import profile_startup; '
+         'profile = profile_startup("other.yaml", imports=False); '
+         'print(json.dumps([[timing.name, timing.table] '
+         'for timing in profile.phases]))'],
+        cwd=project_dir, capture_output=True, text=True, check=True)
+    phases = json.loads(completed.stdout.splitlines()[-1])
+    assert ['schema load', 'profiled_colors'] in phases or lazy
+    assert phases.count(['openapi generation', None]) == openapi_phases
+    assert phases[-1] == ['engine connect', None]
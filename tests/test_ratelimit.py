@@ -0,0 +1,111 @@
+import frictionless
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from datarest._cfgfile import (
+    RateLimit, app_config, read_app_config, write_app_config)
+from datarest._ratelimit import RateLimiter, TokenBucket
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, burst=2, now=0)
+    assert bucket.take(0) == 0
+    assert bucket.take(0) == 0
+    assert bucket.take(0) == pytest.approx(0.5)
+    assert bucket.take(0.5) == 0
+    # Never refilled above the burst size
+    assert bucket.take(10) == 0
+    assert bucket.take(10) == 0
+    assert bucket.take(10) > 0
+
+
+def test_rate_limiter():
+    clock = Clock()
+    limiter = RateLimiter(clock=clock)
+    limits = RateLimit(rate=1, burst=1, max_concurrent=1)
+
+    release = limiter.acquire('', 'alice', limits)
+    # Rate limits per client
+    with pytest.raises(HTTPException) as exc_info:
+        limiter.acquire('', 'alice', limits)
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.headers['Retry-After'] == '1'
+
+    # Concurrency limits per client
+    clock.now = 1
+    with pytest.raises(HTTPException) as exc_info:
+        limiter.acquire('', 'alice', limits)
+    assert exc_info.value.detail == 'Concurrent requests limit exceeded'
+    limiter.acquire('', 'bob', limits)()
+    release()
+    clock.now = 2
+    limiter.acquire('', 'alice', limits)()
+    # Scopes are limited separately
+    limiter.acquire('colors', 'alice', limits)()
+
+
+def test_rate_limiter_bounded():
+    limiter = RateLimiter(max_clients=2)
+    limits = RateLimit(rate=1)
+    for client in ['a', 'b', 'c']:
+        limiter.acquire('', client, limits)()
+    assert list(limiter._buckets) == [('', 'b'), ('', 'c')]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for table in ['limited_colors', 'limited_sizes']:
+        resource = frictionless.describe([["id", "name"], [1, "red"]])
+        resource.schema.primary_key = ["id"]
+        resource.schema.custom['x_datarest_primary_key_info'] = {
+            'id_type': 'biz_key', 'id_src_fields': []}
+        resource.to_yaml(f'{table}.yaml')
+    config = app_config(
+        ['limited_colors', 'limited_sizes'], connect_string='sqlite://',
+        expose_routes=['get_all'])
+    config.datarest.fastapi.rate_limit = RateLimit(rate=0.001, burst=4)
+    config.datarest.datatables.limited_sizes.rate_limit = RateLimit(
+        rate=0.001, burst=1)
+    write_app_config('app.yaml', config)
+    # Import late, datarest._app_factory reads app.yaml on import
+    from datarest import _app_factory, _database
+    app = _app_factory.create_app(read_app_config('app.yaml'))
+    engine = create_engine(
+        'sqlite://', connect_args={'check_same_thread': False},
+        poolclass=StaticPool)
+
+    def get_db():
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[_database.get_db] = get_db
+    return TestClient(app)
+
+
+def test_rate_limited_app(client):
+    assert client.get('/limited_sizes').status_code == 200
+    # Per-datatable limit
+    response = client.get('/limited_sizes')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert client.get('/limited_colors').status_code == 200
+    # App-wide limit, for all datatables together (a burst of 4
+    # requests)
+    assert client.get('/limited_colors').status_code == 200
+    assert client.get('/limited_colors').status_code == 429
+    assert '429' in client.get('/openapi.json').json()[
+        'paths']['/limited_colors']['get']['responses']
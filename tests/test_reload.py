@@ -0,0 +1,182 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from datarest._cfgfile import (
+    Authn, AuthnEnum, LDAP, Reload, app_config, read_app_config,
+    write_app_config)
+
+
+@pytest.fixture
+def project_dir(make_project):
+    return make_project({
+        'reload_colors': [["id", "name"], [1, "red"]],
+        'reload_sizes': [["id", "size"], [1, "small"]],
+        })
+
+
+@pytest.fixture
+def fake_ldap(monkeypatch):
+    from datarest import _ldap_authn
+
+    class FakeLDAP:
+        def __init__(self, bind_dn, server, **kwargs):
+            pass
+
+        def authenticate(self, username, password):
+            if (username, password) != ('alice', 'secret'):
+                raise _ldap_authn.InvalidCredentialsError()
+            return f'dn:uid={username}'
+
+    monkeypatch.setattr(_ldap_authn, 'LDAPAuth', FakeLDAP)
+
+
+def reload_config(config, authn=True):
+    config.datarest.fastapi.reload = Reload(endpoint=True)
+    if authn:
+        config.datarest.fastapi.authn = Authn(
+            authn_type=AuthnEnum.HTTPBasic_LDAP,
+            ldap=LDAP(bind_dn='uid={uid},dc=example', server='ldap.example'))
+    return config
+
+
+def paths(app):
+    return set(TestClient(app).get('/openapi.json').json()['paths'])
+
+
+def test_reload_app(project_dir, fake_ldap):
+    config = reload_config(app_config(
+        'reload_colors', connect_string='sqlite://',
+        expose_routes=['get_all', 'get_one']))
+    write_app_config('app.yaml', config)
+    # Import late, datarest._app_factory reads app.yaml on import
+    from datarest._app_factory import create_app, reload_app
+    app = create_app(read_app_config('app.yaml'))
+    assert paths(app) == {'/reload_colors', '/reload_colors/{item_id}'}
+    colors_routes = app.state.tables['reload_colors'].routes
+
+    # Nothing changed
+    result = reload_app(app)
+    assert result.unchanged == ['reload_colors']
+    assert app.state.tables['reload_colors'].routes is colors_routes
+
+    # Add a table, change the exposed routes of another
+    config = reload_config(app_config(
+        ['reload_colors', 'reload_sizes'], connect_string='sqlite://'))
+    write_app_config('app.yaml', config)
+    client = TestClient(app)
+    assert client.post('/admin/reload').status_code == 401
+    response = client.post('/admin/reload', auth=('alice', 'secret'))
+    assert response.status_code == 200
+    assert response.json() == {
+        'added': ['reload_sizes'],
+        'changed': ['reload_colors'],
+        'removed': [],
+        'unchanged': [],
+        }
+    assert paths(app) == {
+        '/reload_colors/{item_id}', '/reload_sizes/{item_id}'}
+    sizes_routes = app.state.tables['reload_sizes'].routes
+
+    # Remove a table, keep the other
+    config.datarest.datatables.__root__.pop('reload_colors')
+    write_app_config('app.yaml', config)
+    result = reload_app(app)
+    assert result.removed == ['reload_colors']
+    assert result.unchanged == ['reload_sizes']
+    assert app.state.tables['reload_sizes'].routes is sizes_routes
+    assert set(app.state.models) == {'reload_sizes'}
+    assert paths(app) == {'/reload_sizes/{item_id}'}
+
+
+def test_reload_endpoint_needs_authn(project_dir):
+    config = reload_config(
+        app_config('reload_colors', connect_string='sqlite://'), authn=False)
+    write_app_config('app.yaml', config)
+    from datarest._app_factory import create_app
+    app = create_app(read_app_config('app.yaml'))
+    assert TestClient(app).post('/admin/reload').status_code == 404
+
+
+def test_reload_schema_file(project_dir):
+    import yaml
+
+    resource = yaml.safe_load((project_dir / 'reload_colors.yaml').read_text())
+    schema = resource.pop('schema')
+    (project_dir / 'reload_colors.schema.yaml').write_text(
+        yaml.safe_dump(schema))
+    resource['schema'] = 'reload_colors.schema.yaml'
+    (project_dir / 'reload_colors.yaml').write_text(yaml.safe_dump(resource))
+    config = app_config('reload_colors', connect_string='sqlite://')
+    write_app_config('app.yaml', config)
+    from datarest._app_factory import _watched_files, create_app, reload_app
+    app = create_app(read_app_config('app.yaml'))
+    assert 'reload_colors.schema.yaml' in _watched_files(app)
+
+    # A changed referenced schema file changes the datatable
+    schema['fields'][1]['description'] = 'The color name'
+    (project_dir / 'reload_colors.schema.yaml').write_text(
+        yaml.safe_dump(schema))
+    result = reload_app(app)
+    assert result.changed == ['reload_colors']
+
+
+def test_reload_failure(project_dir, monkeypatch):
+    from sqlmodel import SQLModel
+
+    config = app_config(
+        ['reload_colors', 'reload_sizes'], connect_string='sqlite://')
+    write_app_config('app.yaml', config)
+    from datarest import _app_factory
+    app = _app_factory.create_app(read_app_config('app.yaml'))
+    tables = app.state.tables
+    colors_table = SQLModel.metadata.tables['reload_colors']
+    routes = list(app.router.routes)
+
+    # Both datatables change, rebuilding the second one fails
+    config = app_config(
+        ['reload_colors', 'reload_sizes'], connect_string='sqlite://',
+        expose_routes=['get_all'])
+    write_app_config('app.yaml', config)
+    create_table = _app_factory._create_table
+
+    def fail_sizes(app, model_name, *args, **kwargs):
+        if model_name == 'reload_sizes':
+            raise ValueError('Broken datatable')
+        return create_table(app, model_name, *args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(_app_factory, '_create_table', fail_sizes)
+        with pytest.raises(ValueError):
+            _app_factory.reload_app(app)
+    assert app.state.tables is tables
+    assert app.router.routes == routes
+    assert SQLModel.metadata.tables['reload_colors'] is colors_table
+    assert paths(app) == {
+        '/reload_colors/{item_id}', '/reload_sizes/{item_id}'}
+
+    # And succeeds later on
+    result = _app_factory.reload_app(app)
+    assert result.changed == ['reload_colors', 'reload_sizes']
+    assert paths(app) == {'/reload_colors', '/reload_sizes'}
+
+
+def test_reload_keeps_authn(project_dir, fake_ldap):
+    config = reload_config(app_config(
+        'reload_colors', connect_string='sqlite://',
+        expose_routes=['get_all']))
+    write_app_config('app.yaml', config)
+    from datarest._app_factory import create_app
+    app = create_app(read_app_config('app.yaml'))
+    client = TestClient(app)
+
+    # Dropping authn needs a restart, the app stays protected
+    config = reload_config(app_config(
+        'reload_colors', connect_string='sqlite://',
+        expose_routes=['get_all', 'get_one']), authn=False)
+    write_app_config('app.yaml', config)
+    assert client.post('/admin/reload').status_code == 401
+    response = client.post('/admin/reload', auth=('alice', 'secret'))
+    assert response.json()['changed'] == ['reload_colors']
+    assert app.state.config.datarest.fastapi.authn is not None
+    assert client.get('/reload_colors/1').status_code == 401
+    assert client.post('/admin/reload').status_code == 401
@@ -0,0 +1,174 @@
+import cProfile
+
+import frictionless
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from datarest._cfgfile import (
+    Authn, AuthnEnum, LDAP, Profiling, app_config, read_app_config,
+    write_app_config)
+from datarest._request_profiling import (
+    ID_HEADER, ProfileStore, RequestProfile, instrument_engine)
+
+
+@pytest.mark.parametrize("directory", [False, True])
+def test_profile_store(tmp_path, directory):
+    store = ProfileStore(
+        keep=2, directory=str(tmp_path) if directory else None)
+    ids = ['a' * 32, 'b' * 32, 'c' * 32]
+    for profile_id in ids:
+        store.add(profile_id, f'report {profile_id}')
+    assert store.get(ids[0]) is None
+    assert store.get(ids[2]) == f'report {ids[2]}'
+    assert store.get('../app.yaml') is None
+
+
+def test_request_profile_phases():
+    times = iter([0, 1, 4, 5])
+    profile = RequestProfile('GET', '/colors', clock=lambda: next(times))
+    profile.endpoint_start = next(times)
+    profile.add_statement(2)
+    profile.endpoint_end = next(times)
+    profile.response_start = next(times)
+    phases = profile.phases(profile.stats())
+    assert phases['dependencies'] == 1
+    assert phases['sql execution'] == 2
+    assert phases['orm hydration'] == 1
+    assert phases['response validation'] == 1
+    assert phases['sending'] is None
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch):
+    from datarest import _ldap_authn
+
+    class FakeLDAP:
+        def __init__(self, bind_dn, server, **kwargs):
+            pass
+
+        def authenticate(self, username, password):
+            if password != 'secret':
+                raise _ldap_authn.InvalidCredentialsError()
+            return f'dn:uid={username}'
+
+    monkeypatch.setattr(_ldap_authn, 'LDAPAuth', FakeLDAP)
+    monkeypatch.chdir(tmp_path)
+    resource = frictionless.describe([["id", "name"], [1, "red"]])
+    resource.schema.primary_key = ["id"]
+    resource.schema.custom['x_datarest_primary_key_info'] = {
+        'id_type': 'biz_key', 'id_src_fields': []}
+    resource.to_yaml('profiled_colors.yaml')
+    tables = []
+
+    def make_client(authn):
+        config = app_config(
+            'profiled_colors', connect_string='sqlite://',
+            expose_routes=['get_all'])
+        config.datarest.fastapi.profiling = Profiling(admins=['alice'])
+        if authn:
+            config.datarest.fastapi.authn = Authn(
+                authn_type=AuthnEnum.HTTPBasic_LDAP,
+                ldap=LDAP(bind_dn='uid={uid},dc=example',
+                          server='ldap.example'))
+        write_app_config('app.yaml', config)
+        # Import late, datarest._app_factory reads app.yaml on import
+        from datarest import _app_factory, _database
+        app = _app_factory.create_app(read_app_config('app.yaml'))
+        engine = create_engine(
+            'sqlite://', connect_args={'check_same_thread': False},
+            poolclass=StaticPool)
+        instrument_engine(engine)
+        model = app.state.models['profiled_colors'].resource_model
+        tables.append(model.__table__)
+        SQLModel.metadata.create_all(engine, tables=[model.__table__])
+        with Session(engine) as session:
+            session.add(model(id=1, name='red'))
+            session.commit()
+
+        def get_db():
+            with Session(engine) as session:
+                yield session
+
+        app.dependency_overrides[_database.get_db] = get_db
+        return TestClient(app)
+
+    yield make_client
+    for table in tables:
+        SQLModel.metadata.remove(table)
+
+
+def test_profiled_request(make_client):
+    client = make_client(authn=True)
+    alice = ('alice', 'secret')
+    profile_header = {'X-Datarest-Profile': '1'}
+
+    response = client.get('/profiled_colors', auth=alice)
+    assert ID_HEADER not in response.headers
+
+    response = client.get(
+        '/profiled_colors', auth=alice, headers=profile_header)
+    assert response.json()[0]['name'] == 'red'
+    profile_id = response.headers[ID_HEADER]
+
+    response = client.get(f'/admin/profiles/{profile_id}', auth=alice)
+    assert response.status_code == 200
+    report = response.text
+    assert f'Profile {profile_id}: GET /profiled_colors -> 200' in report
+    for phase in ['dependencies', 'sql execution', 'orm hydration',
+                  'response validation', 'json encoding', 'sending']:
+        assert phase in report
+    assert 'SQL statements: 1' in report
+    # The endpoint is profiled in its threadpool thread too
+    assert '_crudrouter_ext.py' in report
+
+    # Admins only
+    bob = ('bob', 'secret')
+    response = client.get(
+        '/profiled_colors', auth=bob, headers=profile_header)
+    assert response.status_code == 200
+    assert ID_HEADER not in response.headers
+    assert client.get(
+        f'/admin/profiles/{profile_id}', auth=bob).status_code == 403
+    assert client.get(
+        f'/admin/profiles/{"0" * 32}', auth=alice).status_code == 404
+
+
+def test_profiling_needs_authn(make_client):
+    client = make_client(authn=False)
+    response = client.get(
+        '/profiled_colors', headers={'X-Datarest-Profile': '1'})
+    assert response.status_code == 200
+    assert ID_HEADER not in response.headers
+    assert client.get(f'/admin/profiles/{"0" * 32}').status_code == 404
+
+
+def test_unauthorized_requests_not_profiled(make_client, monkeypatch):
+    from datarest import _request_profiling
+    client = make_client(authn=True)
+    started = []
+    monkeypatch.setattr(
+        _request_profiling.RequestProfile, 'profiler',
+        lambda self: started.append(self) or cProfile.Profile())
+    profile_header = {'X-Datarest-Profile': '1'}
+
+    for auth in [None, ('bob', 'secret'), ('alice', 'wrong')]:
+        client.get('/profiled_colors', auth=auth, headers=profile_header)
+    assert started == []
+    assert not _request_profiling._profiling.locked()
+
+    # Another request being profiled doesn't keep admins waiting
+    with _request_profiling._profiling:
+        response = client.get(
+            '/profiled_colors', auth=('alice', 'secret'),
+            headers=profile_header)
+    assert response.status_code == 200
+    assert ID_HEADER not in response.headers
+    assert started == []
+
+    response = client.get(
+        '/profiled_colors', auth=('alice', 'secret'), headers=profile_header)
+    assert ID_HEADER in response.headers
+    assert started
+    assert not _request_profiling._profiling.locked()
@@ -1,6 +1,13 @@
 import pytest
 
+import base64
+import time
+import uuid
+
 from datarest._resource_ids import biz_key_composite_id, biz_hash_md5_id, biz_hash_sha256_id, uuid4_base64_id, create_id_default, IdEnum
+from datarest._resource_ids import biz_key_composite_ids, biz_hash_md5_ids, biz_hash_sha256_ids, uuid4_base64_ids
+from datarest._resource_ids import id_type_funcs, id_type_batch_funcs, crockford_base32_alphabet, sortable_base64_alphabet
+from datarest._resource_ids import binary_id_types
 
 def test_biz_key_composite_id():
     # Test with different primary key field values and separators
@@ -59,8 +66,82 @@ def test_uuid4_base64_id():
     #Can there be more test cases?
     
 
+@pytest.mark.parametrize("ids_func, id_func", [
+    (biz_key_composite_ids, biz_key_composite_id),
+    (biz_hash_md5_ids, biz_hash_md5_id),
+    (biz_hash_sha256_ids, biz_hash_sha256_id),
+    ])
+def test_batch_ids_match_single_ids(ids_func, id_func):
+    rows = [('foo', 'bar'), (1, 2), (1, 2.5), (' x ', 'y'), ()]
+    assert ids_func(rows) == [id_func(*row) for row in rows]
+    assert ids_func(rows, concat_sep='-') == [
+        id_func(*row, concat_sep='-') for row in rows]
+    assert ids_func([]) == []
+
+
+def test_uuid4_base64_ids():
+    ids = uuid4_base64_ids([()] * 100)
+    assert len(ids) == 100
+    assert len(set(ids)) == 100
+    for id_ in ids:
+        assert len(id_) == 22
+        # proper version 4 + RFC 4122 variant uuids
+        uuid_ = uuid.UUID(
+            bytes=base64.b64decode(id_ + '==', altchars=b'_-'))
+        assert uuid_.version == 4
+        assert uuid_.variant == uuid.RFC_4122
+    assert uuid4_base64_ids([]) == []
+
+
+def decode_sortable(id_, alphabet):
+    value = 0
+    for char in id_:
+        value = value * len(alphabet) + alphabet.index(char)
+    return value
+
+
+@pytest.mark.parametrize("id_type, length, alphabet", [
+    (IdEnum.ulid, 26, crockford_base32_alphabet),
+    (IdEnum.uuid7_base64, 22, sortable_base64_alphabet),
+    ])
+def test_time_ordered_ids(id_type, length, alphabet):
+    id_func = id_type_funcs[id_type]
+    ids_func = id_type_batch_funcs[id_type]
+    before = time.time_ns() // 1_000_000
+    ids = [id_func() for _ in range(3)]
+    time.sleep(0.002)
+    ids.extend(ids_func([()] * 100))
+    after = time.time_ns() // 1_000_000
+
+    assert len(set(ids)) == len(ids)
+    # ids sort in creation order
+    assert ids[3:] == sorted(ids[3:])
+    assert max(ids[:3]) < min(ids[3:])
+    for id_ in ids:
+        assert len(id_) == length
+        value = decode_sortable(id_, alphabet)
+        assert before <= value >> 80 <= after
+        if id_type == IdEnum.uuid7_base64:
+            uuid_ = uuid.UUID(int=value)
+            assert uuid_.version == 7
+            assert uuid_.variant == uuid.RFC_4122
+    assert ids_func([]) == []
+
+
 # möglichkeit des parametisierens fürs mapping?
 
+@pytest.mark.parametrize("id_type", list(binary_id_types))
+def test_binary_id_round_trip(id_type):
+    length, to_bytes, from_bytes = binary_id_types[id_type]
+    id_ = id_type_funcs[id_type]('a', 'b')
+    raw = to_bytes(id_)
+    assert isinstance(raw, bytes)
+    assert len(raw) == length
+    assert from_bytes(raw) == id_
+    with pytest.raises(ValueError):
+        to_bytes(id_[:-1])
+
+
 def test_create_id_default():
 
     # Test with different ID types
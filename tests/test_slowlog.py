@@ -0,0 +1,119 @@
+import frictionless
+import pytest
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from datarest._cfgfile import (
+    Authn, AuthnEnum, LDAP, SlowQueries, app_config, read_app_config,
+    write_app_config)
+from datarest._slowlog import SlowQueryLog
+
+
+def test_slow_query_log():
+    # Statement durations 1, 3, 0.5, 2
+    times = iter([0, 1, 10, 13, 20, 20.5, 30, 32])
+    slow_queries = SlowQueryLog(1, explain=True, top_n=2,
+                                clock=lambda: next(times))
+    engine = sa.create_engine('sqlite://')
+    metadata = sa.MetaData()
+    table = sa.Table(
+        'slow', metadata, sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String))
+    metadata.create_all(engine)
+    slow_queries.instrument(engine)
+    with engine.connect() as conn:
+        for name in ['red', 'green', 'blue', 'yellow']:
+            conn.execute(sa.select(table).where(table.c.name == name))
+
+    slowest = slow_queries.slowest()
+    assert [entry['duration'] for entry in slowest] == [3, 2]
+    assert slowest[0]['parameters'] == "('green',)"
+    assert 'SCAN' in slowest[0]['plan']
+    assert 'test_slowlog.py' in slowest[0]['caller']
+    assert slowest[0]['table'] == ''
+
+    slow_queries.clear()
+    assert slow_queries.slowest() == []
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch):
+    from datarest import _ldap_authn
+
+    class FakeLDAP:
+        def __init__(self, bind_dn, server, **kwargs):
+            pass
+
+        def authenticate(self, username, password):
+            if (username, password) != ('alice', 'secret'):
+                raise _ldap_authn.InvalidCredentialsError()
+            return f'dn:uid={username}'
+
+    monkeypatch.setattr(_ldap_authn, 'LDAPAuth', FakeLDAP)
+    monkeypatch.chdir(tmp_path)
+    resource = frictionless.describe([["id", "name"], [1, "red"]])
+    resource.schema.primary_key = ["id"]
+    resource.schema.custom['x_datarest_primary_key_info'] = {
+        'id_type': 'biz_key', 'id_src_fields': []}
+    resource.to_yaml('slow_colors.yaml')
+    tables = []
+
+    def make_client(authn):
+        config = app_config(
+            'slow_colors', connect_string='sqlite://',
+            expose_routes=['get_all'], query_params=['name'])
+        config.datarest.fastapi.slow_queries = SlowQueries(
+            threshold=0, endpoint=True)
+        if authn:
+            config.datarest.fastapi.authn = Authn(
+                authn_type=AuthnEnum.HTTPBasic_LDAP,
+                ldap=LDAP(bind_dn='uid={uid},dc=example',
+                          server='ldap.example'))
+        write_app_config('app.yaml', config)
+        # Import late, datarest._app_factory reads app.yaml on import
+        from datarest import _app_factory, _database
+        app = _app_factory.create_app(read_app_config('app.yaml'))
+        engine = create_engine(
+            'sqlite://', connect_args={'check_same_thread': False},
+            poolclass=StaticPool)
+        app.state.slow_queries.instrument(engine)
+        model = app.state.models['slow_colors'].resource_model
+        tables.append(model.__table__)
+        SQLModel.metadata.create_all(engine, tables=[model.__table__])
+
+        def get_db():
+            with Session(engine) as session:
+                yield session
+
+        app.dependency_overrides[_database.get_db] = get_db
+        return TestClient(app)
+
+    yield make_client
+    for table in tables:
+        SQLModel.metadata.remove(table)
+
+
+def test_slow_queries_endpoint(make_client):
+    client = make_client(authn=True)
+    auth = ('alice', 'secret')
+    assert client.get('/slow_colors?name=red', auth=auth).status_code == 200
+    assert client.get('/admin/slow-queries').status_code == 401
+
+    response = client.get('/admin/slow-queries', auth=auth)
+    assert response.status_code == 200
+    # Besides the create table statements
+    entry, = [entry for entry in response.json()
+              if entry['table'] == 'slow_colors']
+    assert entry['route'] == '/slow_colors'
+    assert 'red' in entry['parameters']
+    assert entry['statement'].startswith('SELECT')
+    assert entry['plan'] is None
+
+
+def test_slow_queries_endpoint_needs_authn(make_client):
+    client = make_client(authn=False)
+    assert client.get('/slow_colors').status_code == 200
+    assert client.get('/admin/slow-queries').status_code == 404
+    assert client.app.state.slow_queries.slowest()
@@ -0,0 +1,65 @@
+import pytest
+import sqlalchemy as sa
+
+from datarest._sqltypes import BinaryId, DictionaryEncoded, integer_type
+from datarest._resource_ids import IdEnum, ulid_id
+
+
+@pytest.mark.parametrize("minimum, maximum, expected", [
+    (0, 100, sa.SmallInteger),
+    (-2**15, 2**15 - 1, sa.SmallInteger),
+    (0, 2**15, sa.Integer),
+    (-2**40, 0, sa.BigInteger),
+    (0, 2**70, None),
+    (None, None, None),
+    ])
+def test_integer_type(minimum, maximum, expected):
+    assert integer_type(minimum, maximum) is expected
+
+
+def test_dictionary_encoded():
+    metadata = sa.MetaData()
+    table = sa.Table(
+        'items', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('status', DictionaryEncoded(['closed', 'open'])),
+        )
+    engine = sa.create_engine('sqlite://')
+    metadata.create_all(engine)
+    status = table.c.status.type
+    lookup_table = status.lookup_table('items__status', metadata)
+    lookup_table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(lookup_table.insert(), status.lookup_rows())
+        conn.execute(table.insert(), [
+            {'id': 1, 'status': 'open'}, {'id': 2, 'status': None}])
+        assert conn.execute(
+            sa.select(table.c.status).order_by(table.c.id)).scalars().all() \
+            == ['open', None]
+        # stored as codes, expandable by joining the lookup table
+        assert conn.execute(sa.text(
+            'select value from items join items__status '
+            'on items.status = items__status.code')).scalars().all() \
+            == ['open']
+        with pytest.raises(sa.exc.StatementError):
+            conn.execute(table.insert(), [{'id': 3, 'status': 'lost'}])
+
+
+def test_binary_id():
+    metadata = sa.MetaData()
+    table = sa.Table(
+        'items', metadata,
+        sa.Column('id', BinaryId(IdEnum.ulid), primary_key=True),
+        )
+    engine = sa.create_engine('sqlite://')
+    metadata.create_all(engine)
+    id_ = ulid_id()
+    with engine.begin() as conn:
+        conn.execute(table.insert(), [{'id': id_}])
+        assert conn.execute(sa.select(table.c.id)).scalars().all() == [id_]
+        # stored as 16 bytes
+        assert conn.execute(sa.text(
+            'select length(id) from items')).scalar() == 16
+        # invalid ids don't match anything
+        assert conn.execute(
+            sa.select(table.c.id).where(table.c.id == 'bogus')).all() == []